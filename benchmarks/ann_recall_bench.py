@@ -0,0 +1,119 @@
+"""
+Recall versus latency of the IVF entity name index (embedded_string_comparison/ann_index.py) against an
+exact brute-force cosine search over the same vectors.
+
+Names come from the synthetic corpus and are embedded with a hashed character trigram stand-in for
+BioSentVec. Most of the names are inserted into the index in batches, the way new entities arrive.
+The rest are held out as queries, because their family siblings are in the index. For every n_probe it
+reports recall@k (the share of the exact top k the index returns) and the per-query latency.
+
+Run from the repository root:
+
+    python -m benchmarks.ann_recall_bench
+    python -m benchmarks.ann_recall_bench --families 40000 --n-lists 256 --output ann.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.stand_ins import HashedNgramEmbeddingModel
+from benchmarks.synthetic import SyntheticCorpus, address_keys
+
+sys.path.append('embedded_string_comparison')
+from ann_index import IVFIndex, normalize_rows, top_k_rows  # noqa: E402
+from embedded_comp import SentenceEmbedder  # noqa: E402
+
+
+def time_queries(search, query_vectors):
+    """runs one query at a time, like a request would :return: (results, latencies in ms)"""
+    results, latencies = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        rows, _ = search(vector[None, :])
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(rows[0])
+    return results, np.array(latencies)
+
+
+def exact_search(unit_vectors: np.ndarray, k: int):
+    """brute force cosine top k over vectors normalized once up front, what the index is measured against"""
+    def search(query_vector):
+        scores = unit_vectors @ normalize_rows(query_vector)[0]
+        return [top_k_rows(scores, k)], None
+    return search
+
+
+def recall(approximate: list, exact: list) -> float:
+    return float(np.mean([len(set(a) & set(e)) / max(len(e), 1) for a, e in zip(approximate, exact)]))
+
+
+def latency_summary(latencies: np.ndarray) -> dict:
+    return {'mean_ms': round(float(latencies.mean()), 3), 'p95_ms': round(float(np.percentile(latencies, 95)), 3)}
+
+
+def run(families: int, queries: int, k: int, n_lists: int, dim: int, insert_batch: int, seed: int) -> dict:
+    corpus = SyntheticCorpus(families, address_keys(500, seed=seed), seed=seed)
+    names = sorted(set(entity['name'] for entity in corpus.entities))
+    rng = np.random.RandomState(seed)
+    rng.shuffle(names)
+    query_names, index_names = names[:queries], names[queries:]
+
+    embedder = SentenceEmbedder(model=HashedNgramEmbeddingModel(dim=dim, seed=seed), preprocess=str.lower)
+    start = time.perf_counter()
+    vectors = embedder.embed(index_names)
+    query_vectors = embedder.embed(query_names)
+    embed_seconds = time.perf_counter() - start
+
+    index = IVFIndex(dim, n_lists=n_lists, seed=seed)
+    start = time.perf_counter()
+    for i in range(0, len(vectors), insert_batch):
+        index.add(vectors[i:i + insert_batch])
+    build_seconds = time.perf_counter() - start
+
+    exact, brute_latencies = time_queries(exact_search(normalize_rows(vectors), k), query_vectors)
+    report = {
+        'config': {'families': families, 'names': len(index_names), 'queries': len(query_names), 'k': k,
+                   'n_lists': n_lists, 'dim': dim, 'insert_batch': insert_batch, 'seed': seed},
+        'embed_seconds': round(embed_seconds, 3),
+        'build_seconds': round(build_seconds, 3),
+        'brute_force': latency_summary(brute_latencies),
+        'ivf': [],
+    }
+    n_probes = sorted(set(p for p in (1, 2, 4, 8, 16, 32, 64, n_lists) if p <= n_lists))
+    for n_probe in n_probes:
+        approximate, latencies = time_queries(lambda q: index.search(q, k=k, n_probe=n_probe), query_vectors)
+        report['ivf'].append(dict(n_probe=n_probe, recall=round(recall(approximate, exact), 4), **latency_summary(latencies)))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IVF entity name index recall versus latency')
+    parser.add_argument('--families', type=int, default=10000, help='synthetic entity families, about 2.5 names each')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-lists', type=int, default=64)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--insert-batch', type=int, default=1000, help='names per incremental insert')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.families, args.queries, args.k, args.n_lists, args.dim, args.insert_batch, args.seed)
+    config = report['config']
+    print(f"{config['names']} names, {config['queries']} queries, k={config['k']}, {config['n_lists']} lists, "
+          f"embedded in {report['embed_seconds']}s, indexed in {report['build_seconds']}s")
+    brute_force = report['brute_force']
+    print(f"{'brute force':<14} recall 1.0000  mean {brute_force['mean_ms']:>8.3f}ms  p95 {brute_force['p95_ms']:>8.3f}ms")
+    for row in report['ivf']:
+        print(f"n_probe {row['n_probe']:<6} recall {row['recall']:.4f}  mean {row['mean_ms']:>8.3f}ms  p95 {row['p95_ms']:>8.3f}ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
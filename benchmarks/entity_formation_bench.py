@@ -0,0 +1,300 @@
+"""
+Offline latency benchmark for the entity formation services.
+
+Replays entity_formation_model_updated_th/test_payloads.py and requests drawn from a synthetic name
+corpus through each service's handler, with S3 and address_keys replaced by local stand-ins (a forest
+pickled into an ARTIFACT_LOCAL_DIR and a sqlite address_keys table). Every (service, workload) runs in
+its own interpreter so the peak RSS reported is that workload's alone.
+
+Run from the repository root:
+
+    python -m benchmarks.entity_formation_bench                      # compare against benchmarks/baseline.json
+    python -m benchmarks.entity_formation_bench --update-baseline    # record a new baseline
+    python -m benchmarks.entity_formation_bench --scale 4            # 4x the requests and corpus
+
+The run exits with 1 when a workload regressed against the baseline (p50 or p95 latency, pairs per
+second or peak RSS past the tolerance) or a request failed, and with 2 when the baseline was recorded
+with a different configuration. p99 is reported but not gated, with tens of requests it is the slowest one.
+Baselines are only comparable on the machine that recorded them.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+from benchmarks.stand_ins import (
+    GEOTAG_DB_ENV, GEOTAG_DELAY_ENV, SERVICES, create_geotag_db, install_stand_ins, load_service_app,
+    write_service_artifacts
+)
+from benchmarks.synthetic import SyntheticCorpus, address_keys, synthetic_requests
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+ENTITY_CORPUS_KEY = "artifacts/entity_formation_string_comparison/entity_corpus.json"
+# comparison type -> (requests at scale 1, size of each request), see synthetic_requests
+SYNTHETIC_WORKLOADS = {
+    'string_to_string': (100, 1),
+    'entity_to_entity': (100, 1),
+    'string_to_entity': (30, 10),
+    'batch': (10, 100),
+    'cluster': (5, 200),
+    'string_to_corpus': (30, 50),
+}
+# replays of test_payloads.py at scale 1
+PAYLOAD_REPEATS = 5
+WARMUP_REQUESTS = 3
+SERVICE_WORKLOADS = {
+    'entity_formation_model_updated_th': ['payloads'] + list(SYNTHETIC_WORKLOADS),
+    'entity_formation_string_comparison': ['payloads', 'string_to_string', 'entity_to_entity', 'string_to_entity'],
+}
+# latency changes smaller than this are timer and scheduler noise whatever their relative size
+MIN_LATENCY_DELTA_MS = 1.0
+GATED_METRICS = {'p50_ms': 'latency', 'p95_ms': 'latency', 'pairs_per_sec': 'throughput', 'peak_rss_mb': 'rss'}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def request_pairs(body: dict, response_body: dict) -> int:
+    """number of string pairs a request scores"""
+    comparison_type = body['comparison_type']
+    if comparison_type == 'string_to_entity':
+        return len(body['entity'])
+    if comparison_type == 'batch':
+        return len(body['pairs'])
+    if comparison_type == 'cluster':
+        return response_body['pairs_scored']
+    if comparison_type == 'string_to_corpus':
+        return body['n_candidates']
+    return 1
+
+
+def summarize(latencies: list, pairs: int, errors: int) -> dict:
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+    return {
+        'requests': len(latencies),
+        'pairs': pairs,
+        'errors': errors,
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'pairs_per_sec': round(pairs / sum(latencies), 1) if latencies else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def replay(handler, requests: list):
+    """
+    sends every request through the handler and times it
+    :return: (latencies in seconds, pairs scored, failed requests)
+    """
+    latencies, pairs, errors = [], 0, 0
+    for body in requests:
+        event = {'body': json.dumps(body)}
+        start = time.perf_counter()
+        try:
+            response = handler(event, None)
+        except Exception:
+            traceback.print_exc()
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response['statusCode'] != 200:
+            print(f"{body['comparison_type']} request failed: {response['body']}", file=sys.stderr)
+            errors += 1
+            continue
+        pairs += request_pairs(body, json.loads(response['body']))
+    return latencies, pairs, errors
+
+
+def run_worker(service: str, requests_file: str, out_file: str, local_dir: str):
+    """runs one workload against one service, in its own process, and writes its summary to out_file"""
+    install_stand_ins(local_dir, os.environ[GEOTAG_DB_ENV], float(os.environ.get(GEOTAG_DELAY_ENV, 0)))
+    with open(requests_file) as f:
+        workload = json.load(f)
+    app = load_service_app(service)
+    # the first requests pay for loading the model and corpus, they are not part of the latency
+    replay(app.handler, workload['warmup'])
+    gc.collect()
+    summary = summarize(*replay(app.handler, workload['requests']))
+    with open(out_file, 'w') as f:
+        json.dump(summary, f)
+
+
+def build_workloads(work_dir: str, scale: float, seed: int) -> dict:
+    """
+    writes every workload's warmup and timed requests and the address_keys table to work_dir
+    :return: (workload -> requests file, the corpus entities string_to_corpus is run against)
+    """
+    from entity_formation_model_updated_th.test_payloads import test_payloads
+
+    geotags = address_keys(max(50, int(500 * scale)), seed=seed)
+    create_geotag_db(os.path.join(work_dir, 'address_keys.sqlite'), geotags)
+    corpus = SyntheticCorpus(max(50, int(1000 * scale)), geotags, seed=seed)
+    warmup_corpus = SyntheticCorpus(50, geotags, seed=seed + 1)
+
+    workloads = {'payloads': {
+        'warmup': test_payloads[:WARMUP_REQUESTS],
+        'requests': test_payloads * max(1, round(PAYLOAD_REPEATS * scale)),
+    }}
+    for comparison_type, (n_requests, size) in SYNTHETIC_WORKLOADS.items():
+        workloads[comparison_type] = {
+            'warmup': synthetic_requests(warmup_corpus, comparison_type, WARMUP_REQUESTS, size),
+            'requests': synthetic_requests(corpus, comparison_type, max(1, round(n_requests * scale)), size),
+        }
+
+    files = {}
+    for name, workload in workloads.items():
+        files[name] = os.path.join(work_dir, f'{name}.json')
+        with open(files[name], 'w') as f:
+            json.dump(workload, f)
+    return files, corpus.entities
+
+
+def run_benchmarks(config: dict, services: list, workloads: list) -> dict:
+    """:return: service -> workload -> summary"""
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        files, corpus = build_workloads(work_dir, config['scale'], config['seed'])
+        local_dir = os.path.join(work_dir, 'artifacts')
+        from entity_formation_model_updated_th.features import FEATURE_KERNELS
+        feature_names = {
+            'entity_formation_model_updated_th': list(FEATURE_KERNELS),
+            'entity_formation_string_comparison': load_service_app('entity_formation_string_comparison').ef_feature_columns,
+        }
+        write_service_artifacts(local_dir, feature_names, ENTITY_CORPUS_KEY, corpus,
+                                n_estimators=config['n_estimators'], seed=config['seed'])
+        env = dict(os.environ, **{
+            GEOTAG_DB_ENV: os.path.join(work_dir, 'address_keys.sqlite'),
+            GEOTAG_DELAY_ENV: str(config['geotag_delay_ms']),
+            'ENTITY_CORPUS_KEY': ENTITY_CORPUS_KEY,
+        })
+        for service in services:
+            for workload in SERVICE_WORKLOADS[service]:
+                if workloads and workload not in workloads:
+                    continue
+                out_file = os.path.join(work_dir, f'{service}.{workload}.out.json')
+                # the handlers log a line per request, only the failures are worth showing
+                subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.entity_formation_bench', '--worker', service,
+                     files[workload], out_file, local_dir],
+                    env=env, stdout=subprocess.DEVNULL, check=False
+                )
+                if os.path.exists(out_file):
+                    with open(out_file) as f:
+                        summary = json.load(f)
+                else:
+                    summary = {'errors': 1, 'crashed': True}
+                results.setdefault(service, {})[workload] = summary
+                print(f'{service:<40} {workload:<18} {format_summary(summary)}')
+    return results
+
+
+def format_summary(summary: dict) -> str:
+    if summary.get('crashed'):
+        return 'CRASHED'
+    return (f"p50 {summary['p50_ms']:>9.2f}ms  p95 {summary['p95_ms']:>9.2f}ms  p99 {summary['p99_ms']:>9.2f}ms  "
+            f"{summary['pairs_per_sec']:>8.1f} pairs/s  rss {summary['peak_rss_mb']:>7.1f}MB  "
+            f"errors {summary['errors']}")
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float, rss_tolerance: float) -> list:
+    """
+    :param tolerance: allowed relative slowdown of p50/p95 and drop of pairs per second
+    :param rss_tolerance: allowed relative growth of the peak RSS
+    :return: one message per regression, empty when nothing regressed
+    """
+    regressions = []
+    for service, workloads in results.items():
+        for workload, summary in workloads.items():
+            if summary.get('errors'):
+                regressions.append(f"{service} {workload}: {summary['errors']} failed requests")
+                continue
+            reference = baseline.get(service, {}).get(workload)
+            if reference is None:
+                continue
+            for metric, kind in GATED_METRICS.items():
+                current, before = summary[metric], reference[metric]
+                if kind == 'throughput':
+                    regressed = current < before * (1 - tolerance)
+                elif kind == 'rss':
+                    regressed = current > before * (1 + rss_tolerance)
+                else:
+                    regressed = current > before * (1 + tolerance) and current - before > MIN_LATENCY_DELTA_MS
+                if regressed:
+                    change = (current - before) / before * 100 if before else float('inf')
+                    regressions.append(f'{service} {workload}: {metric} {before} -> {current} ({change:+.1f}%)')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='entity formation latency benchmark')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the requests and the corpus size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--n-estimators', type=int, default=100, help='trees in the stand-in models')
+    parser.add_argument('--geotag-delay-ms', type=float, default=0, help='simulated address_keys round trip')
+    parser.add_argument('--services', nargs='+', choices=list(SERVICES), default=list(SERVICES))
+    parser.add_argument('--workloads', nargs='+', choices=['payloads'] + list(SYNTHETIC_WORKLOADS))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--rss-tolerance', type=float, default=0.15)
+    parser.add_argument('--output', help='also write the full report to this file')
+    parser.add_argument('--worker', nargs=4, metavar=('SERVICE', 'REQUESTS', 'OUT', 'ARTIFACTS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(*args.worker)
+        return 0
+
+    config = {
+        'scale': args.scale,
+        'seed': args.seed,
+        'n_estimators': args.n_estimators,
+        'geotag_delay_ms': args.geotag_delay_ms,
+    }
+    report = {
+        'config': config,
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': run_benchmarks(config, args.services, args.workloads),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'baseline written to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline}, run with --update-baseline to record one')
+        regressions = compare_to_baseline(report['results'], {}, args.tolerance, args.rss_tolerance)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print(f"baseline was recorded with {baseline['config']}, this run is {config}")
+            return 2
+        regressions = compare_to_baseline(report['results'], baseline['results'], args.tolerance, args.rss_tolerance)
+
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
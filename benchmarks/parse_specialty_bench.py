@@ -0,0 +1,142 @@
+"""
+Microbenchmark of EntityStringParsing.parse_specialty against the way it used to work, where every call
+rebuilt the root tables and every word was compared with every root.
+
+Names are built from synthetic corpus names joined together, with some specialty words (and typos of
+them) mixed in, so the longer names have many words for the root matcher to go through. Both versions
+must return the same matches for every name. The parser is built fresh for each run, so its per-word
+caches start empty.
+
+Run from the repository root:
+
+    python -m benchmarks.parse_specialty_bench
+    python -m benchmarks.parse_specialty_bench --words 8 32 128 --names 200
+"""
+import argparse
+import random
+import sys
+import time
+
+from Levenshtein import distance as levenshtein_distance
+
+from benchmarks.synthetic import SyntheticCorpus, address_keys, typo
+from utils.parsing_utils import EntityStringParsing, find_word_matches
+from utils.string_parser_lookup import departments_lookup, medical_entities, field_roots
+
+
+def reference_parse_specialty(fields, string, cutoff=1):
+    """parse_specialty before the root tables and the fuzzy root index, kept as it was to compare against"""
+    roots = [
+        i.replace('logy', '').replace('logist', '') for i in fields
+    ]
+    vals = []
+    full_names = (
+            [i + 'logy' for i in roots] +
+            [i + 'logist' for i in roots] +
+            [i + 'logists' for i in roots]
+    )
+    for full_name, root in zip(full_names, roots):
+        if full_name in string.split():
+            vals.append((root + 'logy', full_name))
+
+    matches = find_word_matches(string=string, substring='logy')
+    for match in matches:
+        if isinstance(match, str):
+            index_string = match.find('logy')
+        elif isinstance(match, list):
+            index_string = match[0].find(match[1])
+            match = match[0]
+        else:
+            for field in roots:
+                string_root = match[:index_string].strip()
+                sim = levenshtein_distance(field, string_root)
+                if sim == cutoff:
+                    vals.append((field + 'logy', match))
+
+    words = string.split()
+    for word in words:
+        if word.endswith('sia') and word.startswith('a'):
+            vals.append(('anesthesiology', word))
+        if 'obgyn' in word or 'ob-gyn' in word or word == 'ob' or word == 'gyn':
+            vals.append(('obgyn', word))
+        if word.startswith('ortho'):
+            vals.append(('orthopedic', word))
+        if word.startswith('pedi'):
+            vals.append(('pedatric', word))
+        if word.startswith('geri'):
+            vals.append(('geriatric', word))
+        if word.startswith('endos'):
+            vals.append(('endoscopy', word))
+        if word.startswith('cardio'):
+            vals.append(('cardiology', word))
+        if word.startswith('pulmon'):
+            vals.append('pulmonology')
+        if word == 'ent' or word.startswith('otorhino'):
+            vals.append(('ent', word))
+
+        for root in roots:
+            root_word = f'{root}log'
+            if root_word not in [v[0] for v in vals] and root_word not in ['urolog', 'neurolog']:
+                if root_word in word:
+                    vals.append((root_word + 'y', word))
+                if levenshtein_distance(root + 'logy', word) <= 1 and root[0] == word[0]:
+                    vals.append((root + 'logy', word))
+
+    return vals if vals else []
+
+
+def long_names(corpus: SyntheticCorpus, n_names: int, n_words: int, rng: random.Random) -> list:
+    names = []
+    for _ in range(n_names):
+        words = []
+        while len(words) < n_words:
+            if rng.random() < .2:
+                words.append(typo(rng.choice(field_roots), rng))
+            else:
+                words.extend(rng.choice(corpus.entities)['name'].lower().split())
+        names.append(' '.join(words[:n_words]))
+    return names
+
+
+def time_per_name(parse, names) -> float:
+    """mean microseconds per name"""
+    start = time.perf_counter()
+    for name in names:
+        parse(name)
+    return (time.perf_counter() - start) / len(names) * 1e6
+
+
+def run(word_counts: list, n_names: int, seed: int) -> list:
+    rng = random.Random(seed)
+    corpus = SyntheticCorpus(500, address_keys(50, seed=seed), seed=seed)
+    rows = []
+    for n_words in word_counts:
+        names = long_names(corpus, n_names, n_words, rng)
+        esp = EntityStringParsing(medical_entities=medical_entities, fields=field_roots, departments=departments_lookup)
+        for name in names:
+            if esp.parse_specialty(name) != reference_parse_specialty(field_roots, name):
+                raise AssertionError(f'parse_specialty differs from the reference for {name!r}')
+        esp = EntityStringParsing(medical_entities=medical_entities, fields=field_roots, departments=departments_lookup)
+        reference_us = time_per_name(lambda name: reference_parse_specialty(field_roots, name), names)
+        cold_us = time_per_name(esp.parse_specialty, names)
+        warm_us = time_per_name(esp.parse_specialty, names)
+        rows.append({'words': n_words, 'reference_us': reference_us, 'cold_us': cold_us, 'warm_us': warm_us})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='parse_specialty microbenchmark on long names')
+    parser.add_argument('--words', type=int, nargs='+', default=[4, 16, 64], help='words per name')
+    parser.add_argument('--names', type=int, default=500, help='names per word count')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'words':>6} {'reference':>12} {'cold':>10} {'warm':>10} {'speedup':>8}")
+    for row in run(args.words, args.names, args.seed):
+        print(f"{row['words']:>6} {row['reference_us']:>10.1f}us {row['cold_us']:>8.1f}us {row['warm_us']:>8.1f}us "
+              f"{row['reference_us'] / row['cold_us']:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import importlib
+import importlib.util
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from utils.artifact_utils import ARTIFACT_LOCAL_DIR_ENV
+
+# sqlite file holding the address_keys stand-in, set by the runner for its workers
+GEOTAG_DB_ENV = 'BENCH_GEOTAG_DB'
+# simulated round trip of the address_keys query, on top of the sqlite lookup
+GEOTAG_DELAY_ENV = 'BENCH_GEOTAG_DELAY_MS'
+
+STRING_COMPARISON_MODEL_KEY = (
+    "artifacts/entity_formation_string_comparison/string_comparison_RF_v2_2021_06_30_sim_threshold.pkl"
+)
+# service directory -> S3 key of its model
+SERVICES = {
+    'entity_formation_model_updated_th': (
+        "artifacts/entity_formation_string_comparison/entity_resolution_model_2022_09_30_updated_featset.pkl"
+    ),
+    'entity_formation_string_comparison': STRING_COMPARISON_MODEL_KEY,
+}
+
+
+def load_service_app(service: str):
+    """the package style service is imported as a package, the flat ones straight from their app.py"""
+    if os.path.exists(os.path.join(service, '__init__.py')):
+        return importlib.import_module(f'{service}.app')
+    if service not in sys.path:
+        sys.path.append(service)
+    spec = importlib.util.spec_from_file_location(f'{service}_app', os.path.join(service, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stand_in_model(feature_names, n_estimators: int = 100, seed: int = 0):
+    """
+    Forest with the production feature names, trained on noise. The trees are grown to full depth so
+    predict_proba costs about what the real model does, the scores themselves mean nothing
+    """
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame(rng.rand(2000, len(feature_names)), columns=list(feature_names))
+    y = (X[feature_names[0]] + rng.rand(2000) * .2 > .6).astype(int)
+    return RandomForestClassifier(n_estimators=n_estimators, random_state=seed).fit(X, y)
+
+
+class HashedNgramEmbeddingModel():
+    """
+    Sentence embedding stand-in for BioSentVec: the character trigrams of a string are hashed into
+    n_buckets and summed through a fixed random projection, so names sharing trigrams get close vectors
+    """
+    def __init__(self, dim: int = 128, n_buckets: int = 4096, seed: int = 0):
+        self.dim = dim
+        self.n_buckets = n_buckets
+        self.projection = np.random.RandomState(seed).randn(n_buckets, dim).astype(np.float32)
+
+    def embed_sentences(self, sentences):
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            padded = f' {sentence} '
+            buckets = [zlib.crc32(padded[j:j + 3].encode()) % self.n_buckets for j in range(len(padded) - 2)]
+            if buckets:
+                vectors[i] = self.projection[buckets].sum(axis=0)
+        return vectors
+
+
+def write_artifact(local_dir: str, key: str, body: bytes):
+    path = os.path.join(local_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+
+
+def write_service_artifacts(local_dir: str, feature_names: dict, corpus_key: str, corpus: list,
+                            n_estimators: int = 100, seed: int = 0):
+    """
+    Lays out everything the services pull from S3 under local_dir, for ARTIFACT_LOCAL_DIR
+    :param feature_names: service -> model feature columns
+    :param corpus: [{'name', 'metadata'}, ...] records served as the entity corpus
+    """
+    for service, key in SERVICES.items():
+        model = stand_in_model(feature_names[service], n_estimators=n_estimators, seed=seed)
+        write_artifact(local_dir, key, pickle.dumps(model))
+    write_artifact(local_dir, corpus_key, json.dumps(corpus).encode())
+
+
+def create_geotag_db(path: str, address_keys: dict):
+    """
+    sqlite copy of the address_keys columns query_geotags reads
+    :param address_keys: cpli -> {'city', 'state', 'street'}
+    """
+    with sqlite3.connect(path) as conn:
+        conn.execute('DROP TABLE IF EXISTS address_keys')
+        conn.execute('CREATE TABLE address_keys (id INTEGER PRIMARY KEY, city TEXT, state TEXT, route TEXT)')
+        conn.executemany(
+            'INSERT INTO address_keys VALUES (?, ?, ?, ?)',
+            [(int(cpli), row['city'], row['state'], row['street']) for cpli, row in address_keys.items()]
+        )
+
+
+def sqlite_query_geotags(path: str, delay_ms: float = 0):
+    """
+    Drop-in for utils.geographic_utils.query_geotags reading the sqlite address_keys table, same
+    {cpli: {'city', 'state', 'street'}} result
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+
+    def query_geotags(cplis):
+        cplis = [int(cpli) for cpli in cplis]
+        rows = conn.execute(
+            f"SELECT id, city, state, route FROM address_keys WHERE id IN ({', '.join('?' * len(cplis))})",
+            cplis
+        ).fetchall()
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        return {cpli: {'city': city, 'state': state, 'street': street} for cpli, city, state, street in rows}
+    return query_geotags
+
+
+def install_stand_ins(local_dir: str, geotag_db: str, delay_ms: float = 0):
+    """points the artifact loaders at local_dir and the geotag lookups at the sqlite table, for this process"""
+    from utils import geographic_utils
+    os.environ[ARTIFACT_LOCAL_DIR_ENV] = local_dir
+    geographic_utils.query_geotags = sqlite_query_geotags(geotag_db, delay_ms)
+    geographic_utils.GEOTAG_CACHE.clear()
+
@@ -0,0 +1,156 @@
+import random
+
+from utils.string_parser_lookup import departments_lookup, medical_entities, field_roots
+
+SYSTEM_STEMS = [
+    'advocate', 'bromenn', 'carle', 'emory', 'nyu', 'upenn', 'osf', 'mercy', 'providence', 'baptist',
+    'methodist', 'sutter', 'kaiser', 'ascension', 'trinity', 'adventist', 'banner', 'intermountain',
+    'geisinger', 'allina', 'sanford', 'essentia', 'ochsner', 'novant', 'atrium', 'piedmont', 'wellstar',
+]
+SYLLABLES = ['ber', 'cal', 'den', 'fair', 'glen', 'har', 'lake', 'mont', 'nor', 'oak', 'pine', 'ridge',
+             'shore', 'ton', 'val', 'wood', 'view', 'brook', 'field', 'haven']
+SAINTS = ['st joseph', 'st mary', 'st luke', 'st vincent', 'st francis', 'st john']
+# (city, state, street) of the address_keys rows, the cities show up in some names so the geotag rules get exercised
+PLACES = [
+    ('Decatur', 'GA', 'N Decatur Rd'), ('Philadelphia', 'PA', None), ('Chicago', 'IL', 'W Harrison St'),
+    ('Boston', 'MA', 'Longwood Ave'), ('Houston', 'TX', 'Fannin St'), ('Denver', 'CO', None),
+    ('Atlanta', 'GA', 'Peachtree St'), ('Seattle', 'WA', 'Broadway'), ('Phoenix', 'AZ', 'E Mcdowell Rd'),
+    ('Columbus', 'OH', 'N High St'), ('Nashville', 'TN', 'Church St'), ('Portland', 'OR', None),
+]
+
+# address_keys rows of the cplis test_payloads.py sends, the geotag rules need them to exist
+PAYLOAD_ADDRESS_KEYS = {
+    12345: {'city': 'New York', 'state': 'NY', 'street': None},
+    3259484: {'city': 'Decatur', 'state': 'GA', 'street': 'N Decatur Rd'},
+    2383383: {'city': 'Philadelphia', 'state': 'PA', 'street': None},
+    3524666: {'city': 'Eugene', 'state': 'OR', 'street': 'Country Club Rd'},
+}
+
+
+def typo(word: str, rng: random.Random) -> str:
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return rng.choice([word[:i] + word[i + 1:], word[:i] + word[i + 1] + word[i] + word[i + 2:], word[:-1]])
+
+
+def system_name(rng: random.Random) -> str:
+    if rng.random() < .5:
+        return rng.choice(SYSTEM_STEMS)
+    if rng.random() < .3:
+        return rng.choice(SAINTS)
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+
+def address_keys(n_cplis: int, seed: int = 0) -> dict:
+    """cpli -> {'city', 'state', 'street'} rows for the address_keys stand-in, the payload cplis included"""
+    rng = random.Random(seed)
+    cplis = rng.sample(range(2000000, 7000000), n_cplis)
+    rows = {cpli: dict(zip(('city', 'state', 'street'), rng.choice(PLACES))) for cpli in cplis}
+    rows.update(PAYLOAD_ADDRESS_KEYS)
+    return rows
+
+
+class SyntheticCorpus():
+    """
+    Reproducible healthcare entity names in families: every family is one place (system name, optional
+    medical entity, department or specialty, sometimes the city) spelled a few ways, with typos,
+    department abbreviations and dropped words, sharing phone numbers and npis the way real duplicates do.
+    The size scales with n_families, the same seed always gives the same corpus
+
+    :param n_families: number of distinct places
+    :param geotags: cpli -> address_keys row, see address_keys
+    """
+    def __init__(self, n_families: int, geotags: dict, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.geotags = geotags
+        self.cplis = sorted(geotags)
+        self.departments = sorted(departments_lookup)
+        self.families = [self.family() for _ in range(n_families)]
+        self.entities = [entity for family in self.families for entity in family]
+
+    def metadata(self, cpli) -> dict:
+        rng = self.rng
+        return {
+            'cpli': cpli,
+            'phone_numbers': [str(rng.randint(2000000000, 9999999999)) for _ in range(rng.randint(0, 2))] or None,
+            'org_npis': [str(rng.randint(1000000000, 1999999999))] if rng.random() < .6 else None,
+            'location_types': rng.choice([None, ['hospital'], ['clinic'], ['hospital', 'clinic']]),
+        }
+
+    def family(self) -> list:
+        rng = self.rng
+        cpli = rng.choice(self.cplis)
+        words = [system_name(rng)]
+        if rng.random() < .4:
+            words.append(rng.choice(sorted(medical_entities)))
+        department = rng.choice(self.departments) if rng.random() < .5 else None
+        if department:
+            words.append(department)
+        elif rng.random() < .6:
+            words.append(rng.choice(field_roots))
+        if rng.random() < .3:
+            words.append(self.geotags[cpli]['city'].lower())
+        name = ' '.join(words)
+        metadata = self.metadata(cpli)
+
+        variants = [{'name': name, 'metadata': metadata}]
+        for _ in range(rng.randint(0, 3)):
+            variant = name
+            if department and rng.random() < .5:
+                variant = variant.replace(department, rng.choice(departments_lookup[department]).strip())
+            tokens = variant.split()
+            if len(tokens) > 2 and rng.random() < .3:
+                tokens.pop(rng.randrange(1, len(tokens)))
+            if rng.random() < .5:
+                i = rng.randrange(len(tokens))
+                tokens[i] = typo(tokens[i], rng)
+            variant_metadata = dict(metadata)
+            if rng.random() < .3:
+                variant_metadata['phone_numbers'] = None
+            variants.append({'name': ' '.join(tokens), 'metadata': variant_metadata})
+        return variants
+
+    def pair(self) -> tuple:
+        """two entities of the same family half the time, of different families otherwise"""
+        rng = self.rng
+        family = rng.choice(self.families)
+        e1 = rng.choice(family)
+        e2 = rng.choice(family if rng.random() < .5 else rng.choice(self.families))
+        return e1, e2
+
+    def sample(self, n: int) -> list:
+        return [self.rng.choice(self.entities) for _ in range(n)]
+
+
+def synthetic_requests(corpus: SyntheticCorpus, comparison_type: str, n_requests: int, size: int) -> list:
+    """
+    request bodies for a comparison type
+    :param size: entities per string_to_entity request, pairs per batch, entities per cluster and
+        candidates per string_to_corpus request
+    """
+    requests = []
+    for _ in range(n_requests):
+        e1, e2 = corpus.pair()
+        if comparison_type == 'string_to_string':
+            body = {'s1': e1['name'], 's2': e2['name']}
+        elif comparison_type == 'entity_to_entity':
+            body = {'entity_1': e1['name'], 'entity_2': e2['name'],
+                    'entity_1_metadata': e1['metadata'], 'entity_2_metadata': e2['metadata']}
+        elif comparison_type == 'string_to_entity':
+            entity = [e2] + corpus.sample(size - 1)
+            body = {'record': e1['name'], 'entity': [e['name'] for e in entity],
+                    'record_metadata': e1['metadata'], 'entity_metadata': e2['metadata']}
+        elif comparison_type == 'batch':
+            pairs = [corpus.pair() for _ in range(size)]
+            body = {'pairs': [{'s1': a['name'], 's2': b['name'], 'rm': a['metadata'], 'em': b['metadata']}
+                              for a, b in pairs]}
+        elif comparison_type == 'cluster':
+            body = {'entities': corpus.sample(size)}
+        elif comparison_type == 'string_to_corpus':
+            body = {'record': e1['name'], 'record_metadata': e1['metadata'], 'k': 10, 'n_candidates': size}
+        else:
+            raise ValueError(f'unknown comparison type {comparison_type}')
+        body['comparison_type'] = comparison_type
+        requests.append(body)
+    return requests
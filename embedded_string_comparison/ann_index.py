@@ -0,0 +1,235 @@
+import io
+import json
+import os
+
+import numpy as np
+
+from utils.artifact_utils import atomic_write
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """float32 copy with every row scaled to unit length, all zero rows stay zero"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """positions of the k highest scores, highest first and ties by position"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.lexsort((top, -scores[top]))]
+
+
+def brute_force_search(vectors, query_vectors, k: int = 10):
+    """
+    exact cosine similarity top k of every query against every vector
+    :return: (rows, scores), one array of each per query, best first
+    """
+    vectors, queries = normalize_rows(vectors), normalize_rows(query_vectors)
+    rows, scores = [], []
+    for query_scores in queries @ vectors.T:
+        top = top_k_rows(query_scores, k)
+        rows.append(top)
+        scores.append(query_scores[top])
+    return rows, scores
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """unit length centroids of n_clusters groups of unit length vectors, clustered by cosine similarity"""
+    rng = np.random.RandomState(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        # a cluster nothing was assigned to keeps its centroid
+        filled = np.bincount(assignments, minlength=n_clusters) > 0
+        centroids[filled] = normalize_rows(sums[filled])
+    return centroids
+
+
+class IVFIndex():
+    """
+    Approximate cosine nearest neighbours with an inverted file: vectors are filed under the closest of
+    n_lists k-means centroids, and a query only scores the vectors of its n_probe closest lists. More
+    probes trade latency for recall, n_probe = n_lists is an exact search.
+
+    Vectors can be added at any time. The centroids are trained once (train, or the first add) and
+    later vectors are filed under them, so retrain when the data drifts far from what it was trained on.
+
+    :param dim: vector length
+    :param n_lists: number of lists (centroids)
+    :param n_probe: lists a query scores by default
+    :param train_size: most vectors the centroids are trained on, a random sample beyond that
+    """
+    def __init__(self, dim: int, n_lists: int = 64, n_probe: int = 8, train_size: int = 50000, seed: int = 0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+        # row ids and vectors of every list, a list's vectors are contiguous so a probe is one matrix product
+        self.list_rows = []
+        self.list_vectors = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """every vector, in row order"""
+        vectors = np.zeros((self._size, self.dim), dtype=np.float32)
+        for rows, list_vectors in zip(self.list_rows, self.list_vectors):
+            vectors[rows] = list_vectors
+        return vectors
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors):
+        """fits the centroids and refiles the vectors already added"""
+        existing = self.vectors
+        vectors = normalize_rows(vectors)
+        if len(vectors) > self.train_size:
+            vectors = vectors[np.random.RandomState(self.seed).choice(len(vectors), self.train_size, replace=False)]
+        self.centroids = spherical_kmeans(vectors, max(1, min(self.n_lists, len(vectors))), seed=self.seed)
+        self.list_rows = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self.list_vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        if len(existing):
+            self._file(np.arange(len(existing)), existing)
+
+    def add(self, vectors) -> np.ndarray:
+        """
+        appends vectors to the index, the first add trains the centroids when train was not called
+        :return: row ids of the added vectors
+        """
+        vectors = normalize_rows(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f'expected vectors of shape (n, {self.dim}), got {vectors.shape}')
+        if not len(vectors):
+            return np.zeros(0, dtype=np.int64)
+        if not self.is_trained:
+            self.train(vectors)
+        rows = np.arange(self._size, self._size + len(vectors))
+        self._file(rows, vectors)
+        self._size += len(vectors)
+        return rows
+
+    def _file(self, rows: np.ndarray, vectors: np.ndarray):
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        list_ids, starts = np.unique(assignments[order], return_index=True)
+        for list_id, members in zip(list_ids, np.split(order, starts[1:])):
+            self.list_rows[list_id] = np.concatenate([self.list_rows[list_id], rows[members]])
+            self.list_vectors[list_id] = np.concatenate([self.list_vectors[list_id], vectors[members]])
+
+    def search(self, query_vectors, k: int = 10, n_probe: int = None):
+        """
+        :return: (rows, scores), one array of each per query with up to k rows, most similar first
+        """
+        queries = normalize_rows(query_vectors)
+        if not self.is_trained:
+            return [np.zeros(0, dtype=np.int64)] * len(queries), [np.zeros(0, dtype=np.float32)] * len(queries)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        rows, scores = [], []
+        for query, centroid_scores in zip(queries, queries @ self.centroids.T):
+            probed = top_k_rows(centroid_scores, n_probe)
+            candidates = np.concatenate([self.list_rows[i] for i in probed])
+            candidate_scores = np.concatenate([self.list_vectors[i] @ query for i in probed])
+            top = top_k_rows(candidate_scores, k)
+            rows.append(candidates[top])
+            scores.append(candidate_scores[top])
+        return rows, scores
+
+    def to_arrays(self) -> dict:
+        row_lists = np.zeros(self._size, dtype=np.int64)
+        for list_id, rows in enumerate(self.list_rows):
+            row_lists[rows] = list_id
+        return {
+            'config': np.array([self.dim, self.n_lists, self.n_probe, self.train_size, self.seed]),
+            'centroids': self.centroids if self.is_trained else np.zeros((0, self.dim), dtype=np.float32),
+            'vectors': self.vectors,
+            'row_lists': row_lists,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        dim, n_lists, n_probe, train_size, seed = (int(v) for v in arrays['config'])
+        index = cls(dim, n_lists=n_lists, n_probe=n_probe, train_size=train_size, seed=seed)
+        if len(arrays['centroids']):
+            index.centroids = arrays['centroids']
+            vectors, row_lists = arrays['vectors'], arrays['row_lists']
+            # rows are added in order, so every list comes back with its rows in the order they were inserted
+            index.list_rows = [np.flatnonzero(row_lists == list_id) for list_id in range(len(index.centroids))]
+            index.list_vectors = [vectors[rows] for rows in index.list_rows]
+            index._size = len(vectors)
+        return index
+
+
+class EntityNameIndex():
+    """
+    Known entity names (and their metadata) behind an IVFIndex of their sentence embeddings, so the
+    candidates for a new record are its nearest names instead of every name. Saved as a single npz file.
+
+    :param embedder: embedded_comp.SentenceEmbedder
+    :param index: IVFIndex over the names' vectors, a new one sized for the embedder when not given
+    """
+    def __init__(self, embedder, index: IVFIndex = None, names: list = None, metadata: list = None):
+        self.embedder = embedder
+        self.index = index
+        self.names = list(names or [])
+        self.metadata = list(metadata) if metadata is not None else [None] * len(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, names: list, metadata: list = None):
+        """embeds and indexes the names, metadata is one dict (or None) per name"""
+        names = list(names)
+        metadata = list(metadata) if metadata is not None else [None] * len(names)
+        if len(metadata) != len(names):
+            raise ValueError('names and metadata must be the same length')
+        vectors = self.embedder.embed(names)
+        if self.index is None:
+            self.index = IVFIndex(vectors.shape[1])
+        self.index.add(vectors)
+        self.names.extend(names)
+        self.metadata.extend(metadata)
+
+    def top_k(self, record: str, k: int = 10, n_probe: int = None) -> list:
+        """
+        same shape as EntityCorpus.top_k
+        :return: up to k (index, cosine similarity) tuples, most similar first
+        """
+        if self.index is None or not len(self):
+            return []
+        rows, scores = self.index.search(self.embedder.embed([record]), k=k, n_probe=n_probe)
+        return [(int(row), float(score)) for row, score in zip(rows[0], scores[0])]
+
+    def save(self, path: str):
+        if self.index is None:
+            raise ValueError('add names before saving the index')
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            names=np.array(self.names, dtype=str),
+            metadata=np.array([json.dumps(m) for m in self.metadata], dtype=str),
+            **self.index.to_arrays()
+        )
+        atomic_write(os.path.abspath(path), buffer.getvalue())
+
+    @classmethod
+    def load(cls, path: str, embedder):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(
+                embedder,
+                index=IVFIndex.from_arrays(arrays),
+                names=arrays['names'].tolist(),
+                metadata=[json.loads(m) for m in arrays['metadata']]
+            )
@@ -9,104 +9,18 @@ import os,itertools, re, boto3
 
 import time
 import pickle
-from polyfuzz import PolyFuzz
-from polyfuzz.models import RapidFuzz
 import traceback
 import boto3
+from embedded_comp import EMBEDDING_FEATURE, sentence_embedder
+from utils.artifact_utils import lazy_artifact
+from utils.similarity_utils import rapidfuzz_scorer
+from utils.string_similarity import compute_roland_score, i_token_max_similarity, meta_data_overlap, similarity, token_overlap
 
 DATASCIENCE_MICROSERVICES_BUCKET = "rh-ds-microservices"
 
 
-def get_s3_obj(bucket, path):
-    print("in get s3 obj")
-    client = boto3.client('s3')
-    obj = client.get_object(
-        Bucket=bucket,
-        Key=path,
-    )
-    print("after get")
-    return obj['Body']
-
-
-def find_ngrams(text: str, number: int=3) -> set:
-    """
-    returns a set of ngrams for the given string
-    :param text: the string to find ngrams for
-    :param number: the length the ngrams should be. defaults to 3 (trigrams)
-    :return: set of ngram strings
-    """
-
-    if not text:
-        return set()
-
-    words = [f'  {x} ' for x in re.split(r'\W+', text.lower()) if x.strip()]
-
-    ngrams = set()
-
-    for word in words:
-        for x in range(0, len(word) - number + 1):
-            ngrams.add(word[x:x+number])
-
-    return ngrams
-
-
-def similarity(text1: str, text2: str, number: int=3) -> float:
-    """
-    Finds the similarity between 2 strings using ngrams.
-    0 being completely different strings, and 1 being equal strings
-    """
-    if text1 is None or text2 is None:
-        return None
-
-    ngrams1 = find_ngrams(text1, number)
-    ngrams2 = find_ngrams(text2, number)
-
-    num_unique = len(ngrams1 | ngrams2)
-    if num_unique == 0:
-        return 0
-    num_equal = len(ngrams1 & ngrams2)
-    return float(num_equal) / float(num_unique)
-
-
-def token_overlap(s1: str, s2: str) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    t2 = s2.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    return len([t for t in t1 if t1 in t2])/len(t1)
-
-
-def i_token_max_similarity(s1: str, s2: str, n: int) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    if n >= len(t1):
-        return 0.0
-    else:
-        return max([similarity(t1[n], t) for t in s2.lower().replace('  ',' ').replace('   ',' ').split(' ')])
-
-
 def fuzz_sim(s1, s2):
-    rapidfuzz_matcher = RapidFuzz(n_jobs=1)
-    pfmodel = PolyFuzz(rapidfuzz_matcher).match([s1], [s2])
-    return pfmodel.get_matches().iloc[0]['Similarity']
-
-
-def compute_roland_score(possible_name, cleaned_name):
-    word_set_1 = possible_name.split(' ')
-    word_set_2 = cleaned_name.split(' ')
-    total_words = len(word_set_1) + len(word_set_2)
-    count_of_syncs = 0
-    for word_temp in word_set_1:
-        if word_temp in word_set_2:
-            count_of_syncs += 1
-    for word_temp in word_set_2:
-        if word_temp in word_set_1:
-            count_of_syncs += 1
-    roland_score = int(round(100.0 * count_of_syncs / total_words, 0))
-    return roland_score
-
-
-def meta_data_overlap(m1, m2):
-    if m1 is None or m2 is None:
-        return 0
-    return float(len([m for m in m1 if m in m2]) + len([m for m in m2 if m in m1])) / (len(m1) + len(m2))
+    return rapidfuzz_scorer.score(s1, s2)
 
 
 def entity_formation_features(s1: str, s2: str, o1=None, o2=None) -> dict:
@@ -136,21 +50,50 @@ def entity_formation_features(s1: str, s2: str, o1=None, o2=None) -> dict:
     return features
 
 
-def compare_eval_records(model, s1: str, s2: str, model_columns: list, rm=None, em=None) -> float:
+def embedding_similarities(model_columns: list, s1s: list, s2s: list):
+    """the embedding feature of every pair in one batch, None when the model was not trained with it"""
+    if EMBEDDING_FEATURE not in model_columns:
+        return None
+    return sentence_embedder.pair_similarities(s1s, s2s)
+
+
+def compare_eval_records(model, s1: str, s2: str, model_columns: list, rm=None, em=None, embedding_sim=None) -> float:
     try:
         if s1==s2:
             return 0.999
-        x = np.nan_to_num(pd.DataFrame([entity_formation_features(s1,s2, o1=rm, o2=em)])[model_columns].values)
+        features = entity_formation_features(s1,s2, o1=rm, o2=em)
+        if EMBEDDING_FEATURE in model_columns:
+            features[EMBEDDING_FEATURE] = embedding_sim if embedding_sim is not None else embedding_similarities(model_columns, [s1], [s2])[0]
+        x = np.nan_to_num(pd.DataFrame([features])[model_columns].values)
         return model.predict_proba(x)[0,1]
     except Exception as e:
         traceback.print_exc()
         print(e, s1,s2)
 
 
-def compare_record_entity(model, cols: list, record: str, entity: list, record_metadata=None, entity_metadata=None, truthset_records=None) -> dict:
+def metadata_fingerprint(metadata) -> str:
+    """stable text form of a metadata dict, so equal metadata gives equal memo keys"""
+    return json.dumps(metadata, sort_keys=True, default=str)
+
+
+def memoized_compare_eval_records(memo: dict, model, s1: str, s2: str, model_columns: list, rm=None, em=None, embedding_sim=None) -> float:
+    """
+    compare_eval_records, scored once per distinct pair and metadata within the memo (one request). The pair is
+    keyed exactly as given, because the scoring here is case sensitive
+    """
+    key = (s1, s2, metadata_fingerprint(rm), metadata_fingerprint(em))
+    if key not in memo:
+        memo[key] = compare_eval_records(model, s1, s2, model_columns, rm=rm, em=em, embedding_sim=embedding_sim)
+    return memo[key]
+
+
+def compare_record_entity(model, cols: list, record: str, entity: list, record_metadata=None, entity_metadata=None, truthset_records=None, memo=None) -> dict:
+    # pairs the truthset terms leave untouched are the same pairs the second pass below scores again
+    memo = {} if memo is None else memo
     comparisons = []
     if not truthset_records:
         truthset_records = []
+    pairs = []
     for entity_record in entity:
         temp_record = record
         for ts_record in truthset_records:
@@ -158,13 +101,20 @@ def compare_record_entity(model, cols: list, record: str, entity: list, record_m
                 if term in temp_record and term in entity_record:
                     temp_record = temp_record.replace(term, '').replace('  ', ' ').strip()
                     entity_record = entity_record.replace(term, '').replace('  ', ' ').strip()
+        pairs.append((temp_record, entity_record))
+    # every pair of the request is embedded in one batch
+    embedding_sims = embedding_similarities(cols, [p[0] for p in pairs], [p[1] for p in pairs])
+    for i, (temp_record, entity_record) in enumerate(pairs):
         if temp_record == '' and record != '':
             comparisons.append(1.0)
         else:
-            comparisons.append(compare_eval_records(model, temp_record, entity_record, cols, rm=record_metadata, em=entity_metadata))
+            comparisons.append(memoized_compare_eval_records(
+                memo, model, temp_record, entity_record, cols, rm=record_metadata, em=entity_metadata,
+                embedding_sim=embedding_sims[i] if embedding_sims is not None else None
+            ))
 
     if truthset_records:
-        comparisons.extend(compare_record_entity(model, cols, record, entity, record_metadata, entity_metadata)['all_comparisons'])
+        comparisons.extend(compare_record_entity(model, cols, record, entity, record_metadata, entity_metadata, memo=memo)['all_comparisons'])
     # comparisons = [compare_eval_records(model, record, entity_record, cols, rm=record_metadata, em=entity_metadata) for entity_record in entity]
     return {
                 'mean_score': np.mean(comparisons),
@@ -193,12 +143,15 @@ ef_feature_columns = ['overall_sim',
                       'phone_numbers_overlap']
 
 
-obj = get_s3_obj(DATASCIENCE_MICROSERVICES_BUCKET, "artifacts/entity_formation_string_comparison/string_comparison_RF_v2_2021_06_30_sim_threshold.pkl")
-entity_formation_rf_model = pickle.loads(obj.read())
+# fetched and unpickled on the first request (not at import), then kept for the life of the container
+get_entity_formation_model = lazy_artifact(
+    "artifacts/entity_formation_string_comparison/string_comparison_RF_v2_2021_06_30_sim_threshold.pkl"
+)
 
 
 def handler(event, context):
     data = json.loads(event['body'])
+    entity_formation_rf_model = get_entity_formation_model()
 
     if 'comparison_type' not in data:
         return {'statusCode': 400,
@@ -278,7 +231,9 @@ def handler(event, context):
 # resp = handler(event, None)
 # print(resp)
 
-data = {'comparison_type': 'string_to_entity', 'record': 'advocate bromenn regional medical center', 'entity': ['carle bromenn ip rehab unit carle bromenn med center', 'advocate bromenn regional medical center', 'carle bromen medical center', 'bromenn med center er', 'carle bromenn medical center', 'bromenn medical center er'], 'record_metadata': {'org_npis': None, 'phone_numbers': '3094541400', 'location_types': ['Hospital'], 'sources': ['truthset'], 'truthset_name': 'Advocate BroMenn Regional Medical Center'}, 'entity_metadata': {'org_npis': ['1962424036', 1306867866.0, 1962424036.0, '1306867866'], 'phone_numbers': [3094541400], 'location_types': ['Physical Therapy', 'Retail Health Clinic', 'Ambulatory Surgery Center', 'Hospital - General Acute Care', 'Independent Clinic', 'Imaging Center', 'Hospital', 'Hospice'], 'sources': ['309', '83', '29', 'https://www.healthalliance.org/content/CmsJson/x.json', '1743', '11', 'truthset', '10', '14', '2469', '22', '12', '68', '2172'], 'truthset_name': 'Carle BroMenn Medical Center'}, 'truthset_records': ['carle bromenn medical center'], 'geo_tokens': None}
-event = {'body': json.dumps(data)}
-resp = handler(event, None)
-print(resp)
\ No newline at end of file
+# run the example request locally, lambda imports this module and must not fire a request at import
+if __name__ == '__main__':
+    data = {'comparison_type': 'string_to_entity', 'record': 'advocate bromenn regional medical center', 'entity': ['carle bromenn ip rehab unit carle bromenn med center', 'advocate bromenn regional medical center', 'carle bromen medical center', 'bromenn med center er', 'carle bromenn medical center', 'bromenn medical center er'], 'record_metadata': {'org_npis': None, 'phone_numbers': '3094541400', 'location_types': ['Hospital'], 'sources': ['truthset'], 'truthset_name': 'Advocate BroMenn Regional Medical Center'}, 'entity_metadata': {'org_npis': ['1962424036', 1306867866.0, 1962424036.0, '1306867866'], 'phone_numbers': [3094541400], 'location_types': ['Physical Therapy', 'Retail Health Clinic', 'Ambulatory Surgery Center', 'Hospital - General Acute Care', 'Independent Clinic', 'Imaging Center', 'Hospital', 'Hospice'], 'sources': ['309', '83', '29', 'https://www.healthalliance.org/content/CmsJson/x.json', '1743', '11', 'truthset', '10', '14', '2469', '22', '12', '68', '2172'], 'truthset_name': 'Carle BroMenn Medical Center'}, 'truthset_records': ['carle bromenn medical center'], 'geo_tokens': None}
+    event = {'body': json.dumps(data)}
+    resp = handler(event, None)
+    print(resp)
@@ -1,33 +1,115 @@
-import sent2vec
-from nltk import word_tokenize
-from nltk.corpus import stopwords
+import os
+from functools import lru_cache
 from string import punctuation
-from scipy.spatial import distance
 
+import numpy as np
 
-model_path = '/Users/aaron/Downloads/BioSentVec_PubMed_MIMICIII-bigram_d700.bin'
-model = sent2vec.Sent2vecModel()
-try:
-    model.load_model(model_path)
-except Exception as e:
-    print(e)
-print('model successfully loaded')
+from utils.artifact_utils import lazy_artifact
+from utils.cache_utils import TTLCache
 
+# model column of the sentence embedding cosine similarity, only computed for models trained with it
+EMBEDDING_FEATURE = 'embedding_cosine_sim'
+EMBEDDING_MODEL_KEY = os.environ.get(
+    'EMBEDDING_MODEL_KEY', "artifacts/embedded_string_comparison/BioSentVec_PubMed_MIMICIII-bigram_d700.bin"
+)
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 50000))
 
-stop_words = set(stopwords.words('english'))
-def preprocess_sentence(text):
+
+@lru_cache(maxsize=1)
+def english_stop_words() -> frozenset:
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+def preprocess_sentence(text: str) -> str:
+    """BioSentVec preprocessing: split punctuation off, lower case, drop punctuation and stop word tokens"""
+    from nltk import word_tokenize
     text = text.replace('/', ' / ')
     text = text.replace('.-', ' .- ')
     text = text.replace('.', ' . ')
     text = text.replace('\'', ' \' ')
     text = text.lower()
 
+    stop_words = english_stop_words()
     tokens = [token for token in word_tokenize(text) if token not in punctuation and token not in stop_words]
 
     return ' '.join(tokens)
 
-sentence_vector1 = model.embed_sentence(preprocess_sentence('UMIAMI MEDICINE - UROLOGY'))
-sentence_vector2 = model.embed_sentence(preprocess_sentence('UMIAMI MEDICINE - NEUROLOGY'))
 
-cosine_sim = 1 - distance.cosine(sentence_vector1, sentence_vector2)
-print('cosine similarity:', cosine_sim)
\ No newline at end of file
+def load_sent2vec(path: str):
+    import sent2vec
+    model = sent2vec.Sent2vecModel()
+    model.load_model(path)
+    return model
+
+
+def cosine_similarities(a, b) -> np.ndarray:
+    """
+    row-wise cosine similarity of two (n, d) arrays, 1 - scipy's cosine distance for every row.
+    A row with an all zero vector (sent2vec returns one when it knows none of the words) gets 0, not nan
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    dots = np.einsum('ij,ij->i', a, b)
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+
+class SentenceEmbedder():
+    """
+    Embeds strings in batches and keeps the vectors of every preprocessed string it has seen, so a
+    string is preprocessed and sent to the model once per container.
+
+    :param model: anything with embed_sentences(list of str) -> (n, d) array, like sent2vec.Sent2vecModel
+    :param load_model: zero argument function returning the model, called on the first embedding when
+        model is not given
+    :param preprocess: text -> normalized text, the cache key and what the model embeds
+    :param cache_size: vectors to keep
+    """
+    def __init__(self, model=None, load_model=None, preprocess=preprocess_sentence, cache_size: int = EMBEDDING_CACHE_SIZE):
+        if model is None and load_model is None:
+            raise ValueError('either model or load_model is required')
+        self._model = model
+        self.load_model = load_model
+        self.preprocess = lru_cache(maxsize=cache_size)(preprocess)
+        self.vectors = TTLCache(maxsize=cache_size, ttl=None)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self.load_model()
+        return self._model
+
+    def embed(self, texts) -> np.ndarray:
+        """
+        :return: float32 array of shape (len(texts), d), one model call for all the strings not cached yet
+        """
+        keys = [self.preprocess(text) for text in texts]
+        vectors = {}
+        missing = []
+        for key in keys:
+            if key in vectors:
+                continue
+            vector = self.vectors.get(key)
+            if vector is None:
+                missing.append(key)
+                vectors[key] = None
+            else:
+                vectors[key] = vector
+        if missing:
+            embedded = np.asarray(self.model.embed_sentences(missing), dtype=np.float32)
+            for key, vector in zip(missing, embedded):
+                self.vectors.set(key, vector)
+                vectors[key] = vector
+        return np.stack([vectors[key] for key in keys])
+
+    def pair_similarities(self, s1s, s2s) -> np.ndarray:
+        """cosine similarity of s1s[i] and s2s[i] for every i, both sides embedded in a single batch"""
+        s1s, s2s = list(s1s), list(s2s)
+        if not s1s:
+            return np.zeros(0)
+        vectors = self.embed(s1s + s2s)
+        return cosine_similarities(vectors[:len(s1s)], vectors[len(s1s):])
+
+
+sentence_embedder = SentenceEmbedder(load_model=lazy_artifact(EMBEDDING_MODEL_KEY, loader=load_sent2vec))
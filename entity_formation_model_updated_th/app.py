@@ -1,15 +1,17 @@
 import json
-import pandas as pd
+import os
 import numpy as np
-import itertools, re
-import pickle
-from polyfuzz import PolyFuzz
-from polyfuzz.models import RapidFuzz
 import traceback
-from py_stringmatching.similarity_measure import affine, bag_distance, generalized_jaccard
+from collections import Counter
+from functools import lru_cache
+from entity_formation_model_updated_th.features import EntityFormationFeatureEngine
+from entity_formation_model_updated_th.clustering import candidate_pairs, connected_components
+from entity_formation_model_updated_th.corpus import EntityCorpus
+from utils.artifact_utils import lazy_artifact
 from utils.parsing_utils import EntityStringParsing,no_meaningful_diff
+from utils.profiling_utils import profile_request, stage
 from utils.string_parser_lookup import departments_lookup, medical_entities, field_roots
-from utils.geographic_utils import is_geotag_diff, is_hospital_cpli, pull_geotags
+from utils.geographic_utils import is_geotag_diff, is_hospital_cpli, pull_geotags, pull_geotags_many
 
 esp = EntityStringParsing(
     medical_entities=medical_entities,
@@ -17,241 +19,57 @@ esp = EntityStringParsing(
     departments=departments_lookup
 )
 
-import boto3
-
-DATASCIENCE_MICROSERVICES_BUCKET = "rh-ds-microservices"
-
-
-aff = affine.Affine()
-bag = bag_distance.BagDistance()
-gen_jac = generalized_jaccard.GeneralizedJaccard()
-
-def get_s3_obj(bucket, path):
-    print("in get s3 obj")
-    client = boto3.client('s3')
-    obj = client.get_object(
-        Bucket=bucket,
-        Key=path,
-    )
-    print("after get")
-    return obj['Body']
-
-
-def find_ngrams(text: str, number: int=3) -> set:
-    """
-    returns a set of ngrams for the given string
-    :param text: the string to find ngrams for
-    :param number: the length the ngrams should be. defaults to 3 (trigrams)
-    :return: set of ngram strings
-    """
-    if not text:
-        return set()
-
-    words = [f'  {x} ' for x in re.split(r'\W+', text.lower()) if x.strip()]
+ENTITY_FORMATION_MODEL_KEY = "artifacts/entity_formation_string_comparison/entity_resolution_model_2022_09_30_updated_featset.pkl"
+ENTITY_CORPUS_KEY = os.environ.get(
+    'ENTITY_CORPUS_KEY', "artifacts/entity_formation_string_comparison/entity_corpus.json"
+)
 
-    ngrams = set()
 
-    for word in words:
-        for x in range(0, len(word) - number + 1):
-            ngrams.add(word[x:x+number])
+# how many pairs each business rule decided, plus how many reached the model, for the life of the container
+RULE_COUNTS = Counter()
 
-    return ngrams
+DIFF_RULES = ['mismatched_specialty_flag', 'mismatched_department_flag', 'dept_vs_speciality_flag']
 
-def token_overlap(s1: str, s2: str) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    t2 = s2.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    return len([t for t in t1 if t1 in t2])/len(t1)
+def diff_rule(record):
+    """name of the first mismatch flag set on the record, None when there is none"""
+    return next((flag for flag in DIFF_RULES if record['business_logic_match'][flag]), None)
 
-def fuzz_sim(s1, s2):
-    rapidfuzz_matcher = RapidFuzz(n_jobs=1)
-    pfmodel = PolyFuzz(rapidfuzz_matcher).match([s1], [s2])
-    return pfmodel.get_matches().iloc[0]['Similarity']
+def is_diff_flag(record):
+    return diff_rule(record) is not None
 
+def metadata_cpli(metadata):
+    # metadata is optional on every comparison type, so treat a missing dict like a missing cpli
+    return metadata.get('cpli') if metadata else None
 
-def similarity(text1: str, text2: str, number: int=3) -> float:
+def same_rule(record, s1, s2, rm, em):
     """
-    Finds the similarity between 2 strings using ngrams.
-    0 being completely different strings, and 1 being equal strings
+    name of the first rule that marks the pair as the same entity, None when no rule does. The rules
+    run cheapest first and stop at the first one that holds, so the comparison record only computes the
+    fields (and the geotag lookup only runs) when the earlier rules did not decide the pair
     """
-    if text1 is None or text2 is None:
-        return None
-
-    ngrams1 = find_ngrams(text1, number)
-    ngrams2 = find_ngrams(text2, number)
-
-    num_unique = len(ngrams1 | ngrams2)
-    if num_unique == 0:
-        return 0
-    num_equal = len(ngrams1 & ngrams2)
-    return float(num_equal) / float(num_unique)
-
-
-def token_overlap(s1: str, s2: str) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    t2 = s2.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    return len([t for t in t1 if t1 in t2])/len(t1)
-
-
-def i_token_max_similarity(s1: str, s2: str, n: int) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    if n >= len(t1):
-        return 0.0
-    else:
-        return max([similarity(t1[n], t) for t in s2.lower().replace('  ',' ').replace('   ',' ').split(' ')])
-
-def compute_roland_score(possible_name, cleaned_name):
-    word_set_1 = possible_name.split(' ')
-    word_set_2 = cleaned_name.split(' ')
-    total_words = len(word_set_1) + len(word_set_2)
-    count_of_syncs = 0
-    for word_temp in word_set_1:
-        if word_temp in word_set_2:
-            count_of_syncs += 1
-    for word_temp in word_set_2:
-        if word_temp in word_set_1:
-            count_of_syncs += 1
-    roland_score = int(round(100.0 * count_of_syncs / total_words, 0))
-    return roland_score
-
-def meta_data_overlap(m1, m2):
-    if m1 is None or m2 is None:
-        return 0
-    return float(len([m for m in m1 if m in m2]) + len([m for m in m2 if m in m1])) / (len(m1) + len(m2))
-
-def find_fuzzsim_string_diffs(s1, s2):
-    """Finds the average string similarity for all words that are different between the two strings"""
-    s1_words, s2_words = set(s1.split()), set(s2.split())
-    s1_diffs = s1_words.difference(s2_words)
-    s2_diffs = s2_words.difference(s1_words)
-    # get the fuzz similarity between those differences (common misspellings=high, non=low)
-    if s2_diffs != set():
-        try:
-            s1_diff_fuzz_sims = np.max(
-                [fuzz_sim(i, j) for (i, j) in itertools.product(s2_diffs, s1_words)]
-            )
-        except Exception:
-            s1_diff_fuzz_sims = 0
-    else:
-        s1_diff_fuzz_sims = 0
-
-    if s1_diffs != set():
-        try:
-            s2_diff_fuzz_sims = np.max(
-                [fuzz_sim(i, j) for (i, j) in itertools.product(s1_diffs, s2_words)]
-            )
-        except Exception:
-            s2_diff_fuzz_sims = 0
-    else:
-        s2_diff_fuzz_sims = 0
-
-    return s1_diff_fuzz_sims, s2_diff_fuzz_sims
-
-def create_char_grams(s, n):
-    s = s.replace(' ', '').replace('  ', '')
-    return [s[i:i+n] for i in range(len(s)-1)]
-
-def find_char_diffs(s1, s2, n):
-    char_s1, char_s2 = set(create_char_grams(s=s1, n=n)), set(create_char_grams(s=s2, n=n))
-    char_s1_diff = len(char_s1.difference(char_s2))
-    char_s2_diff = len(char_s2.difference(char_s1))
-    char_s1_inter = len(char_s1.intersection(char_s2))
-    char_s2_inter = len(char_s2.intersection(char_s1))
-    numer = (char_s1_diff + char_s2_diff)
-    denom = (char_s1_inter + char_s2_inter)
-    return numer / denom if denom > 0 else numer
-
-def most_similar_words_distance(s1, s2, char_len=3):
-    """Finds the two most similar words in a certain string"""
-    s1 = set([j for j in [i.lower().strip() for i in s1.split()] if len(j) >= char_len])
-    s2 = set([j for j in [i.lower().strip() for i in s2.split()] if len(j) >= char_len])
-    diff_s1 = s1.difference(s2)
-    diff_s2 = s2.difference(s1)
-    prods = [*itertools.product(diff_s1, diff_s2)]
-    value = 0
-    if prods:
-        for prod in prods:
-            distance = fuzz_sim(prod[0], prod[1])
-            if distance >= value:
-                value = distance
-        return distance # distance between two most similar words
-    else:
-        return 1 # exactly the same
-
-def entity_formation_features(comp_record: dict, s1: str, s2: str, o1=None, o2=None) -> dict:
-    diff_fuzz_sim = find_fuzzsim_string_diffs(s1, s2)
-    features =  {
-        'overall_sim': similarity(s1, s2),
-        'overall_fuzz_sim': fuzz_sim(s1, s2),
-        'overall_roland': compute_roland_score(s1, s2),
-        'token_overlap_1': token_overlap(s1, s2),
-        'token_overlap_2': token_overlap(s2, s1),
-        'word_diff_fuzz_sim_s1': diff_fuzz_sim[0],
-        'word_diff_fuzz_sim_s2': diff_fuzz_sim[1],
-        'char_diff_fuzz_sim_bigrams': find_char_diffs(s1, s2, 2),
-        'char_diff_fuzz_sim_trigrams': find_char_diffs(s1, s2, 3),
-        'dept_vs_speciality_flag': comp_record['business_logic_match']['dept_vs_speciality_flag'],
-        'affine_gap': aff.get_raw_score(s1, s2),
-        'bag_distance': bag.get_sim_score(s1, s2),
-        'gen_jaccard_sim': gen_jac.get_sim_score(s1.split(), s2.split()),
-        'count_entity_differences': len(comp_record['entity_differences']),
-        'count_common_speciality_entities': len(comp_record['entity_overlap']),
-        'count_common_medical_entities': len(comp_record['common_medical_entities']),
-        'count_diff_medical_elements': len(comp_record['diff_medical_elements']),
-        'count_diff_department_elements': len(comp_record['diff_department_elements']),
-        's1_1_token_sim': i_token_max_similarity(s1, s2, 0),
-        's1_2_token_sim': i_token_max_similarity(s1, s2, 1),
-        's1_3_token_sim': i_token_max_similarity(s1, s2, 2),
-        's2_1_token_sim': i_token_max_similarity(s2, s1, 0),
-        's2_2_token_sim': i_token_max_similarity(s2, s1, 1),
-        's2_3_token_sim': i_token_max_similarity(s2, s1, 2),
-        'org_npi_overlap': meta_data_overlap(o1.get('org_npis') if o1 is not None else None,
-                                             o2.get('org_npis') if o2 is not None else None),
-        'location_types_overlap': meta_data_overlap(o1.get('location_types') if o1 is not None else None,
-                                                    o2.get('location_types') if o2 is not None else None),
-        'phone_numbers_overlap': meta_data_overlap(o1.get('phone_numbers') if o1 is not None else None,
-                                                   o2.get('phone_numbers') if o2 is not None else None),
-
-    }
-    return features
-
-
-
-
-def is_diff_flag(record):
-    diff_flags = [
-        record['business_logic_match']['mismatched_specialty_flag'],
-        record['business_logic_match']['mismatched_department_flag'],
-        record['business_logic_match']['dept_vs_speciality_flag']
+    record_cpli = metadata_cpli(rm)
+    entity_cpli = metadata_cpli(em)
+    both_cplis = record_cpli is not None and entity_cpli is not None
+    hospital_cplis = both_cplis and is_hospital_cpli(record_cpli) and is_hospital_cpli(entity_cpli)
+    business_logic = record['business_logic_match']
+    rules = [
+        # both are medical entities, and have no other specialities
+        ('dual_medical_entities', lambda: (
+            hospital_cplis and business_logic['dual_medical_entities_flag'] and not is_diff_flag(record)
+        )),
+        # one string is fully encompassed in the other; and the difference has no additional entities
+        ('no_meaningful_diff', lambda: hospital_cplis and no_meaningful_diff(s1, s2, record)),
+        # both records have all the same entity, and have string sim > .90
+        ('entity_overlap_string_sim', lambda: business_logic['entity_overlap_string_sim']),
+        # the only difference between the two is a medical entity
+        ('medical_entities_sole_diff', lambda: business_logic['medical_entities_sole_diff']),
+        # the only difference is a geographic difference
+        ('geotag_diff', lambda: both_cplis and is_geotag_diff(s1=s1, s2=s2, cpli=record_cpli)),
     ]
-    return True if any(diff_flags) else False
+    return next((name for name, rule in rules if rule()), None)
 
 def is_same_flag(record, s1, s2, rm, em):
-    # parse out the needed information from the records
-    record_cpli = rm['cpli'] if 'cpli' in rm.keys() else None
-    entity_cpli = em['cpli'] if 'cpli' in em.keys() else None
-    if record_cpli is not None and entity_cpli is not None:
-        hospital_cplis = all([is_hospital_cpli(record_cpli), is_hospital_cpli(entity_cpli)])
-        cond_one = is_geotag_diff(s1=s1, s2=s2, cpli=record_cpli)
-    else:
-        hospital_cplis = False
-        cond_one = False
-
-    two_med_entities = record['business_logic_match']['dual_medical_entities_flag']
-    other_matches_flag = is_diff_flag(record) == False
-    # first condition: both are medical entities, and have no other specialities
-    cond_two = all([
-        hospital_cplis, two_med_entities, other_matches_flag
-    ])
-    # the only difference between the two is a medical entity
-    cond_three = record['business_logic_match']['medical_entities_sole_diff']
-    # the only difference is a geographic difference
-    # both records have all the same entity, and have string sim > .90
-    cond_four = record['business_logic_match']['entity_overlap_string_sim']
-    # one string is fully encompassed in the other; and the difference has no additional entities
-    cond_five = no_meaningful_diff(s1, s2, record) if hospital_cplis else False
-    # if any of the conditions above are true; mark as the same entity
-    same_entity = any([cond_one, cond_two, cond_three, cond_four, cond_five])
-    return True if same_entity else False
+    return same_rule(record, s1, s2, rm, em) is not None
 
 def remove_geotags(string, cpli):
     geotags = pull_geotags(cpli)
@@ -260,52 +78,146 @@ def remove_geotags(string, cpli):
             string = string.replace(geotag, '')
     return string
 
-def compare_eval_records(model, s1: str, s2: str, model_columns: list,  rm=None, em=None) -> float:
-    s1, s2 = s1.lower(), s2.lower()
-    try:
-        if s1 == s2:
-            return 0.999
-
-        record = esp.create_comparison_records(string_one=s1, string_two=s2)
-        same_flag = is_same_flag(record=record, s1=s1, s2=s2, rm=rm, em=em)
-        diff_flag = is_diff_flag(record=record)
-        record_cpli = rm['cpli'] if 'cpli' in rm.keys() else None
-        entity_cpli = em['cpli'] if 'cpli' in em.keys() else None
+def apply_business_rules(s1: str, s2: str, rm=None, em=None):
+    """
+    Runs the rule checks for a single (lower cased) pair
+    :return: tuple of (score, comparison record, s1, s2). score is None when no rule decided the pair
+        and the model needs to score it; in that case s1 and s2 are returned with their geotags removed
+    """
+    if s1 == s2:
+        RULE_COUNTS['identical_strings'] += 1
+        return 0.999, None, s1, s2
+
+    record = esp.create_comparison_records(string_one=s1, string_two=s2)
+    # a mismatch decides the pair on its own and only needs the entity sets, so it is checked first
+    with stage('rules'):
+        rule = diff_rule(record)
+    if rule is not None:
+        RULE_COUNTS[f'diff:{rule}'] += 1
+        return 0.001, record, s1, s2
+
+    record_cpli = metadata_cpli(rm)
+    entity_cpli = metadata_cpli(em)
+    with stage('geotags'):
+        # the record and the entity cpli are looked up together, so the geotag_diff rule and
+        # remove_geotags below both read the cache
+        pull_geotags_many([record_cpli, entity_cpli])
+
+    with stage('rules'):
+        rule = same_rule(record=record, s1=s1, s2=s2, rm=rm, em=em)
+    if rule is not None:
+        RULE_COUNTS[f'same:{rule}'] += 1
+        return 0.999, record, s1, s2
+
+    with stage('geotags'):
         if record_cpli is not None:
             s1 = remove_geotags(s1, record_cpli)
         if entity_cpli is not None:
             s2 = remove_geotags(s2, entity_cpli)
+    RULE_COUNTS['model'] += 1
+    return None, record, s1, s2
+
+@lru_cache(maxsize=8)
+def feature_engine(model_columns: tuple) -> EntityFormationFeatureEngine:
+    return EntityFormationFeatureEngine(model_columns)
+
+def compare_eval_records(model, s1: str, s2: str, model_columns: list,  rm=None, em=None) -> float:
+    s1, s2 = s1.lower(), s2.lower()
+    try:
+        score, record, s1, s2 = apply_business_rules(s1=s1, s2=s2, rm=rm, em=em)
+        if score is not None:
+            return score
 
-        # check the various buisness rules
-        if diff_flag:
-            return 0.001
-        elif same_flag:
-            return 0.999
-        else:
-            X = np.nan_to_num(
-                    pd.DataFrame(
-                        [entity_formation_features(comp_record=record, s1=s1, s2=s2, o1=rm, o2=em)]
-                    )[model_columns].values
-            )
+        with stage('features'):
+            X = feature_engine(tuple(model_columns)).transform([record], [s1], [s2], [rm], [em])
+        with stage('predict'):
             return model.predict_proba(X)[0, 1]
     except Exception as e:
         traceback.print_exc()
         print(e, s1,s2)
 
+def unpack_pair(pair):
+    """pairs can be sent as {'s1', 's2', 'rm', 'em'} objects or as [s1, s2, rm, em] lists"""
+    if isinstance(pair, dict):
+        return pair['s1'], pair['s2'], pair.get('rm'), pair.get('em')
+    s1, s2, rm, em = (list(pair) + [None, None])[:4]
+    return s1, s2, rm, em
+
+def prefetch_geotags(pairs: list):
+    """warms the geotag cache for every cpli in the batch with a single query"""
+    cplis = set()
+    for pair in pairs:
+        try:
+            _, _, rm, em = unpack_pair(pair)
+            cplis.update([metadata_cpli(rm), metadata_cpli(em)])
+        except Exception:
+            # a malformed pair is reported when it is scored
+            continue
+    try:
+        with stage('geotags'):
+            pull_geotags_many(cplis)
+    except Exception:
+        # anything that failed here is looked up (and reported) again pair by pair
+        traceback.print_exc()
+
+def compare_eval_records_batch(model, pairs: list, model_columns: list) -> list:
+    """
+    Scores many pairs in one go. The rule checks run per pair, then the features of every pair that
+    reaches the model are built column by column into one matrix and scored with a single predict_proba call
+    :param pairs: list of (s1, s2, rm, em) pairs, see unpack_pair
+    :return: list of scores in the same order as pairs (None where a pair failed, like compare_eval_records)
+    """
+    scores = [None] * len(pairs)
+    model_pairs, model_index = [], []
+    prefetch_geotags(pairs)
+    for i, pair in enumerate(pairs):
+        try:
+            # a malformed pair only fails its own score
+            s1, s2, rm, em = unpack_pair(pair)
+            s1, s2 = s1.lower(), s2.lower()
+            score, record, s1, s2 = apply_business_rules(s1=s1, s2=s2, rm=rm, em=em)
+            if score is not None:
+                scores[i] = score
+            else:
+                model_pairs.append((record, s1, s2, rm, em))
+                model_index.append(i)
+        except Exception as e:
+            traceback.print_exc()
+            print(e, pair)
+
+    if model_pairs:
+        engine = feature_engine(tuple(model_columns))
+        try:
+            with stage('features'):
+                X = engine.transform(*[list(column) for column in zip(*model_pairs)])
+        except Exception:
+            # a single bad pair fails the whole matrix, so build the rows one at a time to find it
+            rows, row_index = [], []
+            for i, (record, s1, s2, rm, em) in zip(model_index, model_pairs):
+                try:
+                    rows.append(engine.transform([record], [s1], [s2], [rm], [em]))
+                    row_index.append(i)
+                except Exception as e:
+                    traceback.print_exc()
+                    print(e, s1, s2)
+            X = np.vstack(rows) if rows else np.empty((0, len(engine.feature_names)), dtype=np.float32)
+            model_index = row_index
+        if model_index:
+            with stage('predict'):
+                model_scores = model.predict_proba(X)[:, 1]
+            for i, score in zip(model_index, model_scores):
+                scores[i] = score
+
+    return scores
+
 
 def compare_record_entity(model, cols: list, record: str, entity: list, record_metadata=None, entity_metadata=None, truthset_records=None) -> dict:
     entity = [entity] if isinstance(entity, str) else entity
-    comparisons = []
-    for entity_record in entity:
-        eval_record = compare_eval_records(
-            model=model,
-            s1=record,
-            s2=entity_record,
-            model_columns=EF_FEATURE_COLUMNS,
-            rm=record_metadata,
-            em=entity_metadata
-        )
-        comparisons.append(eval_record)
+    comparisons = compare_eval_records_batch(
+        model=model,
+        pairs=[(record, entity_record, record_metadata, entity_metadata) for entity_record in entity],
+        model_columns=cols
+    )
 
     if truthset_records:
         comparisons.extend(compare_record_entity(model, cols, record, entity, record_metadata, entity_metadata)['all_comparisons'])
@@ -316,13 +228,89 @@ def compare_record_entity(model, cols: list, record: str, entity: list, record_m
         'all_comparisons': comparisons
     }
 
-obj = get_s3_obj(DATASCIENCE_MICROSERVICES_BUCKET, "artifacts/entity_formation_string_comparison/entity_resolution_model_2022_09_30_updated_featset.pkl")
-entity_formation_rf_model = pickle.loads(obj.read())
-# make sure the features are in the correct order
-EF_FEATURE_COLUMNS = entity_formation_rf_model.feature_names_in_
+def compare_record_corpus(model, cols: list, record: str, corpus: EntityCorpus, record_metadata=None, k: int=10, n_candidates: int=None) -> dict:
+    """
+    Finds the best matching entities for a record without the caller sending candidates. The corpus
+    index retrieves the n_candidates closest names, those are scored with the model and the k best returned
+    :return: {'candidates': [{'entity', 'entity_metadata', 'retrieval_score', 'model_score'}, ...]} best first
+    """
+    n_candidates = n_candidates or max(5 * k, 50)
+    retrieved = corpus.top_k(record, n_candidates)
+    scores = compare_eval_records_batch(
+        model=model,
+        pairs=[(record, corpus.names[i], record_metadata, corpus.metadata[i]) for i, _ in retrieved],
+        model_columns=cols
+    )
+    candidates = [
+        {
+            'entity': corpus.names[i],
+            'entity_metadata': corpus.metadata[i],
+            'retrieval_score': retrieval_score,
+            'model_score': score
+        }
+        for (i, retrieval_score), score in zip(retrieved, scores)
+    ]
+    # pairs that failed to score (None) go last, ties keep the retrieval order
+    candidates.sort(key=lambda c: -1 if c['model_score'] is None else c['model_score'], reverse=True)
+    return {'candidates': candidates[:k]}
+
+def unpack_entity(entity):
+    """entities can be sent as {'name', 'metadata'} objects or as plain names"""
+    if isinstance(entity, dict):
+        return entity['name'], entity.get('metadata')
+    return entity, None
+
+def cluster_entities(model, cols: list, entities: list, threshold: float=0.5, max_block_size: int=50) -> dict:
+    """
+    Groups entities that are the same place. Only pairs that share a blocking key (a rare name token,
+    a phone number, an org npi or the cpli) are scored, and every pair scoring at least the threshold
+    links its two entities; the clusters are the connected components of those links
+    :param entities: list of {'name', 'metadata'} objects or names, see unpack_entity
+    :return: {'clusters': [[entity index, ...], ...], 'edges': [[i, j, score], ...], 'pairs_scored': int}
+        every entity is in exactly one cluster, singletons included
+    """
+    names, metadata = zip(*[unpack_entity(e) for e in entities]) if entities else ([], [])
+    pairs = candidate_pairs(names, metadata, max_block_size=max_block_size)
+    scores = compare_eval_records_batch(
+        model=model,
+        pairs=[(names[i], names[j], metadata[i], metadata[j]) for i, j in pairs],
+        model_columns=cols
+    )
+    edges = [[i, j, score] for (i, j), score in zip(pairs, scores) if score is not None and score >= threshold]
+    return {
+        'clusters': connected_components(len(names), [(i, j) for i, j, _ in edges]),
+        'edges': edges,
+        'pairs_scored': len(pairs)
+    }
+
+# both are fetched and loaded on first use (not at import) and then kept for the life of the container
+get_entity_formation_model = lazy_artifact(ENTITY_FORMATION_MODEL_KEY)
+# the corpus is only needed by string_to_corpus, other comparison types never load it
+entity_corpus = lazy_artifact(ENTITY_CORPUS_KEY, loader=EntityCorpus.from_json_file)
+
+def log_rule_counts(counts_before: Counter):
+    """one JSON log line per request with the pairs each rule decided and the pairs that went to the model"""
+    counts = RULE_COUNTS - counts_before
+    if counts:
+        print(json.dumps({'rule_counts': dict(counts), 'model_skipped': sum(counts.values()) - counts['model']}))
 
 def handler(event, context):
     data = json.loads(event['body'])
+    counts_before = RULE_COUNTS.copy()
+    # "debug": true in the request adds the per stage timings of the request as an X-Timings header
+    with profile_request(debug=bool(data.get('debug'))) as profile:
+        try:
+            response = handle_comparison(data)
+        finally:
+            log_rule_counts(counts_before)
+    if data.get('debug') and profile is not None:
+        response['headers']['X-Timings'] = json.dumps(profile.breakdown(), separators=(',', ':'))
+    return response
+
+def handle_comparison(data: dict):
+    entity_formation_rf_model = get_entity_formation_model()
+    # make sure the features are in the correct order
+    EF_FEATURE_COLUMNS = entity_formation_rf_model.feature_names_in_
     if 'comparison_type' not in data:
         return {'statusCode': 400,
                 'body': 'error',
@@ -351,6 +339,34 @@ def handler(event, context):
             'body': json.dumps(compare_eval_records(entity_formation_rf_model, data['entity_1'], data['entity_2'],
                                                     EF_FEATURE_COLUMNS, rm=data['entity_1_metadata'], em=data['entity_2_metadata'])),
             'headers': {'Content-Type': 'application/json'}}
+    elif data['comparison_type'] == 'string_to_corpus':
+        return {'statusCode': 200,
+            'body': json.dumps(
+            compare_record_corpus(
+                entity_formation_rf_model,
+                EF_FEATURE_COLUMNS,
+                data['record'],
+                entity_corpus(),
+                record_metadata=data.get('record_metadata'),
+                k=data.get('k', 10),
+                n_candidates=data.get('n_candidates')
+            )),
+            'headers': {'Content-Type': 'application/json'}}
+    elif data['comparison_type'] == 'cluster':
+        return {'statusCode': 200,
+            'body': json.dumps(
+            cluster_entities(
+                entity_formation_rf_model,
+                EF_FEATURE_COLUMNS,
+                data['entities'],
+                threshold=data.get('threshold', 0.5),
+                max_block_size=data.get('max_block_size', 50)
+            )),
+            'headers': {'Content-Type': 'application/json'}}
+    elif data['comparison_type'] == 'batch':
+        return {'statusCode': 200,
+            'body': json.dumps({'model_scores': compare_eval_records_batch(entity_formation_rf_model, data['pairs'], EF_FEATURE_COLUMNS)}),
+            'headers': {'Content-Type': 'application/json'}}
     else:
         return {'statusCode': 400,
                 'body': 'error',
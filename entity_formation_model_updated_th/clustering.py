@@ -0,0 +1,109 @@
+import re
+from collections import defaultdict
+from itertools import combinations
+
+# metadata lists that put two entities in the same block when they share a value
+IDENTIFIER_BLOCKS = ['phone_numbers', 'org_npis']
+
+
+def name_tokens(name: str) -> set:
+    return set(t for t in re.findall(r'\w+', name.lower()) if len(t) > 1)
+
+
+def normalize_identifier(value):
+    """phones and npis arrive as strings, ints or floats ('1962424036', 1962424036.0), compare them as digits"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    digits = re.sub(r'\D', '', str(value))
+    return digits or None
+
+
+def metadata_identifiers(metadata, key) -> set:
+    values = metadata.get(key) if metadata else None
+    if values is None:
+        return set()
+    if isinstance(values, (str, int, float)):
+        values = [values]
+    return set(v for v in (normalize_identifier(v) for v in values if v is not None) if v)
+
+
+def blocking_keys(name: str, metadata: dict) -> set:
+    """every block the entity falls in: its name tokens, its phone numbers and org npis and its cpli"""
+    keys = set(('token', t) for t in name_tokens(name))
+    for block in IDENTIFIER_BLOCKS:
+        keys.update((block, v) for v in metadata_identifiers(metadata, block))
+    cpli = metadata.get('cpli') if metadata else None
+    if cpli is not None:
+        keys.add(('cpli', str(cpli)))
+    return keys
+
+
+def split_block(members: list, size: int) -> list:
+    """
+    consecutive chunks of size members, each overlapping the next by one member, so every member is
+    still paired with its neighbours and the chunks stay linked for the connected components
+    """
+    size = max(size, 2)
+    return [members[start:start + size] for start in range(0, len(members) - 1, size - 1)]
+
+
+def candidate_pairs(names: list, metadata: list, max_block_size: int = 50) -> list:
+    """
+    Pairs of entity indexes that share at least one block. Token blocks bigger than max_block_size are
+    dropped, which is what makes a token "rare": words like 'medical' or 'center' put most of the entities
+    in one block and would bring back the all-pairs comparison blocking is there to avoid. A shared phone,
+    npi or cpli is an exact match, so those blocks are split into chunks of max_block_size (see
+    split_block) instead of dropped
+    :return: sorted list of (i, j) with i < j
+    """
+    blocks = defaultdict(list)
+    for i, (name, meta) in enumerate(zip(names, metadata)):
+        for key in blocking_keys(name, meta):
+            blocks[key].append(i)
+
+    pairs = set()
+    for (kind, _), members in blocks.items():
+        if len(members) < 2:
+            continue
+        if len(members) <= max_block_size:
+            pairs.update(combinations(members, 2))
+        elif kind != 'token':
+            for chunk in split_block(members, max_block_size):
+                pairs.update(combinations(chunk, 2))
+    return sorted(pairs)
+
+
+class UnionFind():
+    """disjoint sets over 0..n-1 with path halving and union by size"""
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+
+    def components(self) -> list:
+        """every set as a sorted list of members, ordered by their smallest member"""
+        groups = defaultdict(list)
+        for i in range(len(self.parent)):
+            groups[self.find(i)].append(i)
+        return sorted(groups.values(), key=lambda members: members[0])
+
+
+def connected_components(n: int, edges) -> list:
+    union_find = UnionFind(n)
+    for i, j in edges:
+        union_find.union(i, j)
+    return union_find.components()
@@ -0,0 +1,54 @@
+import json
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+class EntityCorpus():
+    """
+    In-memory index over known entity names for candidate retrieval. Names are embedded as character
+    n-gram tf-idf vectors (l2 normalised, so a dot product is the cosine similarity) and a query returns
+    the k nearest names, which are then cheap enough to score pair by pair with the model.
+
+    :param names: entity names
+    :param metadata: metadata dict of every name (cpli, org_npis, phone_numbers, location_types), optional
+    :param ngram_range: character n-gram lengths to index
+    """
+    def __init__(self, names: list, metadata: list = None, ngram_range: tuple = (2, 3)):
+        self.names = list(names)
+        self.metadata = list(metadata) if metadata is not None else [None] * len(self.names)
+        if len(self.metadata) != len(self.names):
+            raise ValueError('names and metadata must be the same length')
+        self.vectorizer = TfidfVectorizer(
+            analyzer='char_wb', ngram_range=ngram_range, lowercase=True, sublinear_tf=True, dtype=np.float32
+        )
+        self.matrix = self.vectorizer.fit_transform(self.names).tocsr()
+
+    @classmethod
+    def from_records(cls, records: list, **kwargs):
+        """builds the corpus from [{'name': ..., 'metadata': {...}}, ...] records"""
+        return cls([r['name'] for r in records], [r.get('metadata') for r in records], **kwargs)
+
+    @classmethod
+    def from_json(cls, body, **kwargs):
+        return cls.from_records(json.loads(body), **kwargs)
+
+    @classmethod
+    def from_json_file(cls, path: str, **kwargs):
+        with open(path) as f:
+            return cls.from_records(json.load(f), **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def top_k(self, query: str, k: int = 10) -> list:
+        """
+        :return: up to k (index, cosine similarity) tuples, most similar first. names sharing no
+            n-gram with the query are never returned
+        """
+        if not len(self) or k <= 0:
+            return []
+        scores = (self.matrix @ self.vectorizer.transform([query]).T).toarray().ravel()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,310 @@
+import numpy as np
+from functools import lru_cache
+from py_stringmatching.similarity_measure import affine, bag_distance, generalized_jaccard
+from utils.profiling_utils import stage
+from utils.similarity_utils import rapidfuzz_scorer
+from utils.string_similarity import (compute_roland_score, find_ngrams, i_token_max_similarity, meta_data_overlap,
+                                     meta_data_overlaps, roland_scores, similarity, similarity_many,
+                                     token_max_similarity_many, token_overlap)
+
+aff = affine.Affine()
+bag = bag_distance.BagDistance()
+gen_jac = generalized_jaccard.GeneralizedJaccard()
+
+def fuzz_sim(s1, s2):
+    return rapidfuzz_scorer.score(s1, s2)
+
+def find_fuzzsim_string_diffs(s1, s2):
+    """Finds the average string similarity for all words that are different between the two strings"""
+    s1_words, s2_words = set(s1.split()), set(s2.split())
+    s1_diffs = s1_words.difference(s2_words)
+    s2_diffs = s2_words.difference(s1_words)
+    # get the fuzz similarity between those differences (common misspellings=high, non=low)
+    if s2_diffs != set():
+        try:
+            s1_diff_fuzz_sims = np.max(rapidfuzz_scorer.score_matrix(s2_diffs, s1_words))
+        except Exception:
+            s1_diff_fuzz_sims = 0
+    else:
+        s1_diff_fuzz_sims = 0
+
+    if s1_diffs != set():
+        try:
+            s2_diff_fuzz_sims = np.max(rapidfuzz_scorer.score_matrix(s1_diffs, s2_words))
+        except Exception:
+            s2_diff_fuzz_sims = 0
+    else:
+        s2_diff_fuzz_sims = 0
+
+    return s1_diff_fuzz_sims, s2_diff_fuzz_sims
+
+def create_char_grams(s, n):
+    s = s.replace(' ', '').replace('  ', '')
+    return [s[i:i+n] for i in range(len(s)-1)]
+
+def find_char_diffs(s1, s2, n):
+    char_s1, char_s2 = set(create_char_grams(s=s1, n=n)), set(create_char_grams(s=s2, n=n))
+    char_s1_diff = len(char_s1.difference(char_s2))
+    char_s2_diff = len(char_s2.difference(char_s1))
+    char_s1_inter = len(char_s1.intersection(char_s2))
+    char_s2_inter = len(char_s2.intersection(char_s1))
+    numer = (char_s1_diff + char_s2_diff)
+    denom = (char_s1_inter + char_s2_inter)
+    return numer / denom if denom > 0 else numer
+
+def most_similar_words_distance(s1, s2, char_len=3):
+    """Finds the two most similar words in a certain string"""
+    s1 = set([j for j in [i.lower().strip() for i in s1.split()] if len(j) >= char_len])
+    s2 = set([j for j in [i.lower().strip() for i in s2.split()] if len(j) >= char_len])
+    diff_s1 = s1.difference(s2)
+    diff_s2 = s2.difference(s1)
+    if diff_s1 and diff_s2:
+        return np.max(rapidfuzz_scorer.score_matrix(diff_s1, diff_s2)) # distance between two most similar words
+    else:
+        return 1 # exactly the same
+
+def entity_formation_features(comp_record: dict, s1: str, s2: str, o1=None, o2=None) -> dict:
+    """
+    Features of one pair as a dict, computed one feature at a time. The service scores with
+    EntityFormationFeatureEngine, this is kept as the reference the engine's output is tested against
+    """
+    diff_fuzz_sim = find_fuzzsim_string_diffs(s1, s2)
+    features =  {
+        'overall_sim': similarity(s1, s2),
+        'overall_fuzz_sim': fuzz_sim(s1, s2),
+        'overall_roland': compute_roland_score(s1, s2),
+        'token_overlap_1': token_overlap(s1, s2),
+        'token_overlap_2': token_overlap(s2, s1),
+        'word_diff_fuzz_sim_s1': diff_fuzz_sim[0],
+        'word_diff_fuzz_sim_s2': diff_fuzz_sim[1],
+        'char_diff_fuzz_sim_bigrams': find_char_diffs(s1, s2, 2),
+        'char_diff_fuzz_sim_trigrams': find_char_diffs(s1, s2, 3),
+        'dept_vs_speciality_flag': comp_record['business_logic_match']['dept_vs_speciality_flag'],
+        'affine_gap': aff.get_raw_score(s1, s2),
+        'bag_distance': bag.get_sim_score(s1, s2),
+        'gen_jaccard_sim': gen_jac.get_sim_score(s1.split(), s2.split()),
+        'count_entity_differences': len(comp_record['entity_differences']),
+        'count_common_speciality_entities': len(comp_record['entity_overlap']),
+        'count_common_medical_entities': len(comp_record['common_medical_entities']),
+        'count_diff_medical_elements': len(comp_record['diff_medical_elements']),
+        'count_diff_department_elements': len(comp_record['diff_department_elements']),
+        's1_1_token_sim': i_token_max_similarity(s1, s2, 0),
+        's1_2_token_sim': i_token_max_similarity(s1, s2, 1),
+        's1_3_token_sim': i_token_max_similarity(s1, s2, 2),
+        's2_1_token_sim': i_token_max_similarity(s2, s1, 0),
+        's2_2_token_sim': i_token_max_similarity(s2, s1, 1),
+        's2_3_token_sim': i_token_max_similarity(s2, s1, 2),
+        'org_npi_overlap': meta_data_overlap(o1.get('org_npis') if o1 is not None else None,
+                                             o2.get('org_npis') if o2 is not None else None),
+        'location_types_overlap': meta_data_overlap(o1.get('location_types') if o1 is not None else None,
+                                                    o2.get('location_types') if o2 is not None else None),
+        'phone_numbers_overlap': meta_data_overlap(o1.get('phone_numbers') if o1 is not None else None,
+                                                   o2.get('phone_numbers') if o2 is not None else None),
+
+    }
+    return features
+
+
+class PreparedString():
+    """
+    Char gram and word sets of one string, computed on first use and then kept, so every feature of every
+    pair that sees the same string reuses them. Get instances through prepare_string. Each value is built
+    exactly the way the matching helper above builds it, so features computed from them are identical.
+    N-gram and token sets are kept by utils.string_similarity instead.
+    """
+    __slots__ = ('text', '_cache')
+
+    def __init__(self, text: str):
+        self.text = text
+        self._cache = {}
+
+    def _get(self, key, compute):
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = compute()
+        return value
+
+    def char_grams(self, n: int) -> set:
+        """set of create_char_grams, as used by find_char_diffs"""
+        return self._get(('char_grams', n), lambda: set(create_char_grams(s=self.text, n=n)))
+
+    @property
+    def words(self) -> list:
+        """words on any whitespace"""
+        return self._get('words', self.text.split)
+
+    @property
+    def word_set(self) -> set:
+        return self._get('word_set', lambda: set(self.words))
+
+
+@lru_cache(maxsize=16384)
+def prepare_string(text: str) -> PreparedString:
+    return PreparedString(text)
+
+
+def prepared_char_diffs(p1: PreparedString, p2: PreparedString, n: int) -> float:
+    """find_char_diffs on prepared strings"""
+    char_s1, char_s2 = p1.char_grams(n), p2.char_grams(n)
+    numer = len(char_s1 - char_s2) + len(char_s2 - char_s1)
+    denom = 2 * len(char_s1 & char_s2)
+    return numer / denom if denom > 0 else numer
+
+
+def prepared_fuzzsim_string_diffs(p1: PreparedString, p2: PreparedString):
+    """find_fuzzsim_string_diffs on prepared strings"""
+    s1_words, s2_words = p1.word_set, p2.word_set
+    s1_diffs = s1_words - s2_words
+    s2_diffs = s2_words - s1_words
+    s1_diff_fuzz_sims, s2_diff_fuzz_sims = 0, 0
+    if s2_diffs:
+        try:
+            s1_diff_fuzz_sims = np.max(rapidfuzz_scorer.score_matrix(s2_diffs, s1_words))
+        except Exception:
+            s1_diff_fuzz_sims = 0
+    if s1_diffs:
+        try:
+            s2_diff_fuzz_sims = np.max(rapidfuzz_scorer.score_matrix(s1_diffs, s2_words))
+        except Exception:
+            s2_diff_fuzz_sims = 0
+    return s1_diff_fuzz_sims, s2_diff_fuzz_sims
+
+
+def metadata_values(metadata, key):
+    return metadata.get(key) if metadata is not None else None
+
+
+class FeatureBatch():
+    """
+    Column view over N pairs handed to the feature kernels. Intermediate results that more than one
+    column needs (e.g. the word diff similarities) are computed once per batch and shared.
+    """
+    def __init__(self, comp_records: list, s1s: list, s2s: list, o1s=None, o2s=None):
+        self.comp_records = comp_records
+        self.s1s = s1s
+        self.s2s = s2s
+        self.o1s = o1s if o1s is not None else [None] * len(s1s)
+        self.o2s = o2s if o2s is not None else [None] * len(s1s)
+        self._shared = {}
+
+    def __len__(self):
+        return len(self.s1s)
+
+    def shared(self, key, compute):
+        if key not in self._shared:
+            self._shared[key] = compute()
+        return self._shared[key]
+
+    def pairs(self):
+        return zip(self.s1s, self.s2s)
+
+    def prepared_pairs(self) -> list:
+        return self.shared(
+            'prepared_pairs', lambda: [(prepare_string(s1), prepare_string(s2)) for s1, s2 in self.pairs()]
+        )
+
+    def column(self, values) -> np.ndarray:
+        return np.fromiter(values, dtype=np.float64, count=len(self))
+
+    def business_logic(self, flag: str) -> np.ndarray:
+        return self.column(bool(r['business_logic_match'][flag]) for r in self.comp_records)
+
+    def count(self, key: str) -> np.ndarray:
+        return self.column(len(r[key]) for r in self.comp_records)
+
+    def metadata_overlap(self, key: str) -> np.ndarray:
+        return meta_data_overlaps(
+            [metadata_values(o1, key) for o1 in self.o1s], [metadata_values(o2, key) for o2 in self.o2s]
+        )
+
+
+def word_diff_fuzz_sims(batch: FeatureBatch) -> np.ndarray:
+    """(N, 2) array of find_fuzzsim_string_diffs, shared by both word_diff_fuzz_sim columns"""
+    return batch.shared(
+        'word_diff_fuzz_sims',
+        lambda: np.array(
+            [prepared_fuzzsim_string_diffs(p1, p2) for p1, p2 in batch.prepared_pairs()], dtype=np.float64
+        ).reshape(-1, 2)
+    )
+
+
+def token_sim_kernel(first: int, n: int):
+    if first == 1:
+        return lambda batch: token_max_similarity_many(batch.s1s, batch.s2s, n)
+    return lambda batch: token_max_similarity_many(batch.s2s, batch.s1s, n)
+
+
+# every kernel takes a FeatureBatch and returns one float column of length N
+FEATURE_KERNELS = {
+    'overall_sim': lambda batch: similarity_many(batch.s1s, batch.s2s),
+    'overall_fuzz_sim': lambda batch: rapidfuzz_scorer.score_pairs(batch.s1s, batch.s2s),
+    'overall_roland': lambda batch: roland_scores(batch.s1s, batch.s2s),
+    # token_overlap checks the token list against the other token list (`t1 in t2`), so it is 0 for any pair
+    'token_overlap_1': lambda batch: np.zeros(len(batch)),
+    'token_overlap_2': lambda batch: np.zeros(len(batch)),
+    'word_diff_fuzz_sim_s1': lambda batch: word_diff_fuzz_sims(batch)[:, 0],
+    'word_diff_fuzz_sim_s2': lambda batch: word_diff_fuzz_sims(batch)[:, 1],
+    'char_diff_fuzz_sim_bigrams': lambda batch: batch.column(
+        prepared_char_diffs(p1, p2, 2) for p1, p2 in batch.prepared_pairs()
+    ),
+    'char_diff_fuzz_sim_trigrams': lambda batch: batch.column(
+        prepared_char_diffs(p1, p2, 3) for p1, p2 in batch.prepared_pairs()
+    ),
+    'dept_vs_speciality_flag': lambda batch: batch.business_logic('dept_vs_speciality_flag'),
+    'affine_gap': lambda batch: batch.column(aff.get_raw_score(s1, s2) for s1, s2 in batch.pairs()),
+    'bag_distance': lambda batch: batch.column(bag.get_sim_score(s1, s2) for s1, s2 in batch.pairs()),
+    'gen_jaccard_sim': lambda batch: batch.column(
+        gen_jac.get_sim_score(p1.words, p2.words) for p1, p2 in batch.prepared_pairs()
+    ),
+    'count_entity_differences': lambda batch: batch.count('entity_differences'),
+    'count_common_speciality_entities': lambda batch: batch.count('entity_overlap'),
+    'count_common_medical_entities': lambda batch: batch.count('common_medical_entities'),
+    'count_diff_medical_elements': lambda batch: batch.count('diff_medical_elements'),
+    'count_diff_department_elements': lambda batch: batch.count('diff_department_elements'),
+    's1_1_token_sim': token_sim_kernel(1, 0),
+    's1_2_token_sim': token_sim_kernel(1, 1),
+    's1_3_token_sim': token_sim_kernel(1, 2),
+    's2_1_token_sim': token_sim_kernel(2, 0),
+    's2_2_token_sim': token_sim_kernel(2, 1),
+    's2_3_token_sim': token_sim_kernel(2, 2),
+    'org_npi_overlap': lambda batch: batch.metadata_overlap('org_npis'),
+    'location_types_overlap': lambda batch: batch.metadata_overlap('location_types'),
+    'phone_numbers_overlap': lambda batch: batch.metadata_overlap('phone_numbers'),
+}
+
+
+class EntityFormationFeatureEngine():
+    """
+    Builds the model input for N pairs at once. Each requested feature is computed as a whole column
+    and written straight into a preallocated float32 matrix whose columns follow feature_names, so the
+    result can go to predict_proba as is (sklearn forests score float32 internally anyway).
+
+    :param feature_names: model features in the order the model expects them, see for_model
+    """
+    def __init__(self, feature_names):
+        self.feature_names = [str(name) for name in feature_names]
+        unknown = [name for name in self.feature_names if name not in FEATURE_KERNELS]
+        if unknown:
+            raise KeyError(f'no feature kernel for {unknown}')
+        self.kernels = [FEATURE_KERNELS[name] for name in self.feature_names]
+        self.stage_names = [f'feature:{name}' for name in self.feature_names]
+
+    @classmethod
+    def for_model(cls, model):
+        return cls(model.feature_names_in_)
+
+    def transform(self, comp_records: list, s1s: list, s2s: list, o1s=None, o2s=None) -> np.ndarray:
+        """
+        :param comp_records: comparison records from EntityStringParsing.create_comparison_records, one per pair
+        :param s1s: first string of every pair
+        :param s2s: second string of every pair
+        :param o1s: metadata of the first strings (org_npis, location_types, phone_numbers), optional
+        :param o2s: metadata of the second strings, optional
+        :return: float32 array of shape (N, len(feature_names)), nan replaced by 0
+        """
+        batch = FeatureBatch(comp_records, s1s, s2s, o1s, o2s)
+        X = np.empty((len(batch), len(self.kernels)), dtype=np.float32)
+        for j, kernel in enumerate(self.kernels):
+            with stage(self.stage_names[j]):
+                X[:, j] = kernel(batch)
+        return np.nan_to_num(X, copy=False)
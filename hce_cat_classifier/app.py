@@ -6,7 +6,7 @@ import pickle
 from fuzzywuzzy import fuzz
 import pandas as pd
 from utils.db_utils import (
-    norm_db_conn,
+    get_engine,
  )
 import importlib.resources
 import hce_cat_classifier
@@ -20,7 +20,7 @@ from datetime import datetime
 
 
 def categorize_entity(entity_name, google_place_data, log_result = False):
-    conn, _ = norm_db_conn()
+    conn = get_engine('normalized', 'writer')
 
     rbn_name = entity_name.lower()
     upper_name = rbn_name.upper()
@@ -6,12 +6,9 @@ import joblib
 import numpy as np
 import pandas as pd
 from locations_resolver import parse_address_components
-import boto3
-import io
 from typing import Dict, List, Optional
 from pydantic import BaseModel
-
-DATASCIENCE_MICROSERVICES_BUCKET = "rh-ds-microservices"
+from utils.artifact_utils import lazy_artifact
 
 class ModelInput(BaseModel):
     """Model input data schema."""
@@ -27,21 +24,9 @@ class ModelOutput(BaseModel):
     location_correctness_score: Optional[float]
     phone_scores: Optional[List[Dict]]
 
-def get_s3_obj(bucket, path):
-    print("in get s3 obj")
-    client = boto3.client('s3')
-    obj = client.get_object(
-        Bucket=bucket,
-        Key=path,
-    )
-    print("after get")
-    return obj['Body']
-
-
-obj = get_s3_obj(DATASCIENCE_MICROSERVICES_BUCKET, "artifacts/hce_confidence/RFLocationCorrectnessV4_5-6-2022.model")
-correctness_model = joblib.load(io.BytesIO(obj.read()))
-obj = get_s3_obj(DATASCIENCE_MICROSERVICES_BUCKET, "artifacts/hce_confidence/RFPhoneCorrectnessV4_5-6-2022.model")
-phone_correctness_model = joblib.load(io.BytesIO(obj.read()))
+# fetched and loaded on the first request (not at import), then kept for the life of the container
+get_correctness_model = lazy_artifact("artifacts/hce_confidence/RFLocationCorrectnessV4_5-6-2022.model", loader=joblib.load)
+get_phone_correctness_model = lazy_artifact("artifacts/hce_confidence/RFPhoneCorrectnessV4_5-6-2022.model", loader=joblib.load)
 model_path = 'models'
 with open(os.path.join(model_path, 'RFLocationCorrectnessV4_5-6-2022_cols.json'), 'rb') as inp:
     correctness_cols = json.load(inp)
@@ -98,7 +83,7 @@ class ScoringService(object):
     def predict_location_correctness(cls, input_data):
         parsed_data = pd.DataFrame([cls.parse_input_data(input_data, correctness_cols)])
         x = np.nan_to_num(parsed_data[correctness_cols['covar_cols']].values)
-        return correctness_model.predict_proba(x)[0, 1]
+        return get_correctness_model().predict_proba(x)[0, 1]
 
     @classmethod
     def predict_phone_confidences(cls, input_data):
@@ -114,7 +99,7 @@ class ScoringService(object):
 
             parsed_data_df = pd.DataFrame(parsed_data)
             x = np.nan_to_num(parsed_data_df[phone_correctness_cols['phone_covar_cols']].values)
-            phone_scores.append({'phone': phone, 'score': phone_correctness_model.predict_proba(x)[0, 1]})
+            phone_scores.append({'phone': phone, 'score': get_phone_correctness_model().predict_proba(x)[0, 1]})
         return phone_scores
 
 
@@ -8,82 +8,23 @@ import xgboost as xgb
 import os,itertools, re, pickle
 from sklearn.ensemble import RandomForestClassifier
 import time
-from sqlalchemy import create_engine
-# from utils.dbutils import (
-#     norm_db_reader_conn
-# )
+from utils.db_utils import Statement, fetch_rows, get_engine
+from utils.string_similarity import similarity, token_overlap
 
 
-def norm_db_reader_conn():
-    """Norm cluster reader endpoint connection
-
-    Returns:
-        sqlalchemy.engine.base.Engine: [description]
-    """
-
-    DB_NORMALIZED_USER = "hw_api_master"
-    DB_NORMALIZED_HOST = "healthwiz-normalized-db-cluster.cluster-ro-clexxn8nq8ps.us-west-2.rds.amazonaws.com"
-    DB_NORMALIZED_NAME = "healthwiz_normalized_database_name"
-    DB_NORMALIZED_PASSWORD = "3FsSaVS2kNheNYkDS5W4e6qB3eDghGcy"
-
-    login = "postgresql://{0}:{1}@{2}:5432/{3}".format(DB_NORMALIZED_USER, DB_NORMALIZED_PASSWORD,
-                                                       DB_NORMALIZED_HOST, DB_NORMALIZED_NAME)
-
-    return create_engine(login)
-
-
-
-
-def find_ngrams(text: str, number: int=3) -> set:
-    """
-    returns a set of ngrams for the given string
-    :param text: the string to find ngrams for
-    :param number: the length the ngrams should be. defaults to 3 (trigrams)
-    :return: set of ngram strings
-    """
-
-    if not text:
-        return set()
-
-    words = [f'  {x} ' for x in re.split(r'\W+', text.lower()) if x.strip()]
-
-    ngrams = set()
-
-    for word in words:
-        for x in range(0, len(word) - number + 1):
-            ngrams.add(word[x:x+number])
-
-    return ngrams
-
-
-def similarity(text1: str, text2: str, number: int=3) -> float:
-    """
-    Finds the similarity between 2 strings using ngrams.
-    0 being completely different strings, and 1 being equal strings
-    """
-    if text1 is None or text2 is None:
-        return None
-    
-    ngrams1 = find_ngrams(text1, number)
-    ngrams2 = find_ngrams(text2, number)
-
-    num_unique = len(ngrams1 | ngrams2)
-    num_equal = len(ngrams1 & ngrams2)
-    return float(num_equal) / float(num_unique)
-
-
-def token_overlap(s1: str, s2: str) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    t2 = s2.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    return len([t for t in t1 if t1 in t2])/len(t1)
-
-
-def i_token_max_similarity(s1: str, s2: str, n: int) -> float:
-    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
-    if n >= len(t1):
-        return 0.0
-    else:
-        return max([similarity(t1[n], t) for t in s2.lower().replace('  ',' ').replace('   ',' ').split(' ')])
+PLANS_QUERY = """select uuid::text
+                        , carrier_association
+                        , carrier_brand
+                        , carrier_name
+                        , insurance_keys.plan_name
+                        , plan_type
+                        , display_name
+                from insurance_keys where similarity(lower($1), lower(display_name)) > 0.15
+                                    or similarity(lower($1), lower(carrier_name)) > 0.15
+                                    or similarity(lower($1), lower(carrier_brand)) > 0.15
+                                    or ($2::text is not null and similarity(lower($2), lower(carrier_name)) > 0.15)"""
+PLANS = Statement('insurance_plans', PLANS_QUERY)
+PLAN_COLUMNS = ['uuid', 'carrier_association', 'carrier_brand', 'carrier_name', 'plan_name', 'plan_type', 'display_name']
 
 
 def field_similarity(s1,s2):
@@ -166,24 +107,10 @@ def handler(event, context):
     network_name = query_plan['network_name'] if 'network_name' in query_plan else None
     payer_name = query_plan['payer_name'] if 'payer_name' in query_plan else None
     
-    plans_query = f"""select uuid::text
-                            , carrier_association
-                            , carrier_brand
-                            , carrier_name
-                            , insurance_keys.plan_name
-                            , plan_type
-                            , display_name
-                    from insurance_keys where similarity(lower('{input_insurance}'), lower(display_name)) > 0.15 
-                                        or similarity(lower('{input_insurance}'), lower(carrier_name)) > 0.15
-                                        or similarity(lower('{input_insurance}'), lower(carrier_brand)) > 0.15"""
-
-    if payer_name is not None:
-        plans_query += f""" or similarity(lower('{payer_name}'), lower(carrier_name)) > 0.15"""
-        
-    norm = norm_db_reader_conn()
-    ribbon_plans = pd.read_sql(plans_query, norm)
+    # the pooled reader engine is shared by every warm invocation, so it is not disposed here
+    norm = get_engine('normalized', 'reader')
+    ribbon_plans = pd.DataFrame(fetch_rows(norm, PLANS, input_insurance, payer_name), columns=PLAN_COLUMNS)
     print(ribbon_plans.shape)
-    norm.dispose()
     
     ribbon_plans['network_name'] = network_name
     ribbon_plans['input_insurance'] = input_insurance
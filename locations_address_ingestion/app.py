@@ -7,7 +7,9 @@ from utils.db_utils import (
     norm_db_conn,
     rapid_db_conn,
     get_env_var,
-    norm_db_reader_conn
+    norm_db_reader_conn,
+    Statement,
+    fetch_row
 )
 
 from locations_address_ingestion.location_resolver import parse_address_components, format_hw_place_json
@@ -31,17 +33,11 @@ def return_format_error():
         }}
 
 
-def check_geocode_exists(full_address, conn):
-    print('querying db for address')
-    # first search locations_geocode table
-    # exists_query = """select lkr_id,lkr_parent_id,coalesce_parent_lkr_id 
-    # from locations_geocode where value_src='{0}'""".format(full_address.replace("'","''"))
-
-    exists_query = f"""
+GEOCODE_EXISTS_QUERY = """
     with a as (
         select location_keys_rollup_id
         from location_mappings
-        where value_src='{full_address.replace("'", "''")}'
+        where value_src=$1
     ) select location_keys_rollup_id as lkr_id,
              parent_id as lkr_parent_id,
              coalesce(parent_id,id) as coalesce_parent_lkr_id,
@@ -52,20 +48,9 @@ def check_geocode_exists(full_address, conn):
              address_components
     from a join location_keys_rollup on id = location_keys_rollup_id
     limit 1"""
-    coded = pd.read_sql(exists_query, conn).to_dict(orient='records')
-    print('query finished')
+GEOCODE_EXISTS = Statement('check_geocode_exists', GEOCODE_EXISTS_QUERY)
 
-    if coded:
-        return coded[0]
-
-    return False
-
-
-def check_lkr(formatted_address, conn):
-    # lkr_query = """select id as lkr_id, parent_id as lkr_parent_id, coalesce(parent_id, id) as coalesce_parent_lkr_id 
-    #             from location_keys_rollup_test where address='{0}'""".format(formatted_address.replace("'","''"))
-
-    lkr_query = f"""
+LKR_QUERY = """
     select id as lkr_id,
            parent_id as lkr_parent_id,
            coalesce(parent_id, id) as coalesce_parent_lkr_id,
@@ -75,13 +60,27 @@ def check_lkr(formatted_address, conn):
            longitude::float,
            address_components
     from location_keys_rollup
-    where address='{formatted_address.replace("'", "''")}'
+    where address=$1
     limit 1"""
+LKR = Statement('check_lkr', LKR_QUERY)
+
+def check_geocode_exists(full_address, conn):
+    print('querying db for address')
+    # first search location_mappings for the raw address
+    coded = fetch_row(conn, GEOCODE_EXISTS, full_address, as_dict=True)
+    print('query finished')
+
+    if coded:
+        return coded
+
+    return False
 
-    lkr_data = pd.read_sql(lkr_query, conn).to_dict(orient='records')
+
+def check_lkr(formatted_address, conn):
+    lkr_data = fetch_row(conn, LKR, formatted_address, as_dict=True)
 
     if lkr_data:
-        return lkr_data[0]
+        return lkr_data
 
     return False
 
@@ -275,10 +274,17 @@ def handler(event, context=None):
     except:
         return return_format_error()
 
+    # the engines are pooled and shared across invocations, only the raw connections are handed back
     conn, pconn = norm_db_conn()
     rapid_conn, rapid_pconn = rapid_db_conn()
-    reader_conn = norm_db_reader_conn()
+    try:
+        return _ingest_address(full_address, conn, pconn, rapid_pconn, norm_db_reader_conn())
+    finally:
+        pconn.close()
+        rapid_pconn.close()
 
+
+def _ingest_address(full_address, conn, pconn, rapid_pconn, reader_conn):
     check = check_geocode_exists(full_address, reader_conn)
     if check:
         return {
@@ -312,23 +318,11 @@ def handler(event, context=None):
             #pd.DataFrame([parsed_google_obj]).to_sql('locations_geocode', conn, method='multi', index=False, if_exists='append')
             pd.DataFrame([parsed_google_obj]).to_sql('location_mappings', conn, method='multi', index=False, if_exists='append')
 
-            pconn.close()
-            conn.dispose()
-            rapid_pconn.close()
-            rapid_conn.dispose()
-            reader_conn.dispose()
-
             return {
                 'statusCode': 200,
                 'body': json.dumps(resp)
             }
         else:
-            pconn.close()
-            conn.dispose()
-            rapid_pconn.close()
-            rapid_conn.dispose()
-            reader_conn.dispose()
-
             return return_geocode_error(address_components, full_address)
 
 
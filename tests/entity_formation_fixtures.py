@@ -0,0 +1,68 @@
+import importlib
+import os
+import pickle
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from utils.artifact_utils import ARTIFACT_LOCAL_DIR_ENV
+
+EF_FEATURES = [
+    'overall_sim', 'overall_fuzz_sim', 'overall_roland', 'token_overlap_1', 'token_overlap_2',
+    'word_diff_fuzz_sim_s1', 'word_diff_fuzz_sim_s2', 'char_diff_fuzz_sim_bigrams',
+    'char_diff_fuzz_sim_trigrams', 'dept_vs_speciality_flag', 'affine_gap', 'bag_distance',
+    'gen_jaccard_sim', 'count_entity_differences', 'count_common_speciality_entities',
+    'count_common_medical_entities', 'count_diff_medical_elements', 'count_diff_department_elements',
+    's1_1_token_sim', 's1_2_token_sim', 's1_3_token_sim', 's2_1_token_sim', 's2_2_token_sim',
+    's2_3_token_sim', 'org_npi_overlap', 'location_types_overlap', 'phone_numbers_overlap'
+]
+
+
+def fixture_model(feature_names=EF_FEATURES, seed=0):
+    """small forest with the same feature names as the production model, trained on noise"""
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame(rng.rand(200, len(feature_names)), columns=list(feature_names))
+    y = (X[feature_names[0]] + rng.rand(200) * .2 > .6).astype(int)
+    return RandomForestClassifier(n_estimators=10, max_depth=4, random_state=seed).fit(X, y)
+
+
+class TinyEmbeddingModel():
+    """8-d stand-in for BioSentVec: the mean of a fixed random vector per word, zeros for an empty string"""
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def word_vector(self, word):
+        return np.random.RandomState(zlib.crc32(word.encode())).randn(self.dim)
+
+    def embed_sentences(self, sentences):
+        self.calls.append(list(sentences))
+        return np.array([
+            np.mean([self.word_vector(w) for w in s.split()], axis=0) if s.split() else np.zeros(self.dim)
+            for s in sentences
+        ], dtype=np.float32)
+
+
+def write_artifact(local_dir, key, obj):
+    path = os.path.join(local_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f)
+
+
+def load_entity_formation_app():
+    """imports entity_formation_model_updated_th.app with its artifacts served from a local directory"""
+    module_name = 'entity_formation_model_updated_th.app'
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    app = importlib.import_module(module_name)
+    if ARTIFACT_LOCAL_DIR_ENV not in os.environ:
+        local_dir = tempfile.mkdtemp()
+        write_artifact(local_dir, app.ENTITY_FORMATION_MODEL_KEY, fixture_model())
+        os.environ[ARTIFACT_LOCAL_DIR_ENV] = local_dir
+    return app
@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from entity_formation_fixtures import TinyEmbeddingModel
+
+SERVICE = 'embedded_string_comparison'
+if SERVICE not in sys.path:
+    sys.path.append(SERVICE)
+
+from ann_index import EntityNameIndex, IVFIndex, brute_force_search  # noqa: E402
+from embedded_comp import SentenceEmbedder  # noqa: E402
+
+
+def clustered_vectors(n, dim=16, n_clusters=20, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(n_clusters, dim)
+    return (centers[rng.randint(n_clusters, size=n)] + rng.randn(n, dim) * .3).astype(np.float32)
+
+
+class TestIVFIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.vectors = clustered_vectors(2000)
+        self.queries = clustered_vectors(50, seed=1)
+
+    def test_probing_every_list_is_exact(self):
+        index = IVFIndex(16, n_lists=16)
+        index.add(self.vectors)
+        rows, scores = index.search(self.queries, k=5, n_probe=16)
+        exact_rows, exact_scores = brute_force_search(self.vectors, self.queries, k=5)
+        for row, exact_row in zip(rows, exact_rows):
+            np.testing.assert_array_equal(row, exact_row)
+        np.testing.assert_allclose(np.array(scores), np.array(exact_scores), rtol=1e-5)
+
+    def test_recall_with_few_probes(self):
+        index = IVFIndex(16, n_lists=32)
+        index.add(self.vectors)
+        rows, _ = index.search(self.queries, k=10, n_probe=4)
+        exact_rows, _ = brute_force_search(self.vectors, self.queries, k=10)
+        recall = np.mean([len(set(r) & set(e)) / 10 for r, e in zip(rows, exact_rows)])
+        self.assertGreater(recall, .9)
+
+    def test_incremental_inserts(self):
+        index = IVFIndex(16, n_lists=8)
+        first = index.add(self.vectors[:500])
+        np.testing.assert_array_equal(first, np.arange(500))
+        for i in range(500, 2000, 300):
+            index.add(self.vectors[i:i + 300])
+        index.add(self.vectors[:0])
+        self.assertEqual(len(index), 2000)
+        np.testing.assert_allclose(index.vectors[1999], self.vectors[1999] / np.linalg.norm(self.vectors[1999]), rtol=1e-6)
+        rows, scores = index.search(self.vectors[1500:1501], k=1)
+        self.assertEqual(rows[0].tolist(), [1500])
+        self.assertAlmostEqual(float(scores[0][0]), 1.0, places=5)
+
+    def test_retrain_keeps_the_vectors(self):
+        index = IVFIndex(16, n_lists=4)
+        index.add(self.vectors[:100])
+        index.add(self.vectors[100:])
+        index.train(index.vectors)
+        rows, _ = index.search(self.queries, k=5, n_probe=4)
+        exact_rows, _ = brute_force_search(self.vectors, self.queries, k=5)
+        self.assertEqual([r.tolist() for r in rows], [e.tolist() for e in exact_rows])
+
+    def test_wrong_dimension(self):
+        with self.assertRaises(ValueError):
+            IVFIndex(8).add(self.vectors)
+
+
+class TestEntityNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.embedder = SentenceEmbedder(model=TinyEmbeddingModel(), preprocess=str.lower)
+        self.names = ['carle bromenn medical center', 'bromenn med center er', 'osf st joseph',
+                      'nyu langone health', 'nyu langone orthopedics', 'emory decatur hospital']
+        self.metadata = [{'cpli': i} for i in range(len(self.names))]
+
+    def test_top_k(self):
+        index = EntityNameIndex(self.embedder)
+        self.assertEqual(index.top_k('nyu langone'), [])
+        index.add(self.names[:3], self.metadata[:3])
+        index.add(self.names[3:])
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.metadata[4], None)
+        top = index.top_k('NYU Langone Health', k=2, n_probe=6)
+        self.assertEqual(top[0][0], 3)
+        self.assertAlmostEqual(top[0][1], 1.0, places=5)
+
+    def test_save_and_load(self):
+        index = EntityNameIndex(self.embedder)
+        index.add(self.names, self.metadata)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'entity_index.npz')
+            index.save(path)
+            loaded = EntityNameIndex.load(path, self.embedder)
+        self.assertEqual(loaded.names, self.names)
+        self.assertEqual(loaded.metadata, self.metadata)
+        for record in ['osf saint joseph', 'emory decatur', 'bromenn er']:
+            self.assertEqual(loaded.top_k(record, k=3), index.top_k(record, k=3))
+        loaded.add(['upenn urology'])
+        self.assertEqual(loaded.top_k('upenn urology', k=1)[0][0], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
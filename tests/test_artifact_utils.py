@@ -0,0 +1,102 @@
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import artifact_utils
+from utils.artifact_utils import ArtifactChecksumError, fetch_artifact, lazy_artifact
+
+KEY = 'artifacts/test/model.pkl'
+BODY = pickle.dumps({'weights': [1, 2, 3]})
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {artifact_utils.ARTIFACT_CACHE_DIR_ENV: self.cache_dir})
+        self.env.start()
+        os.environ.pop(artifact_utils.ARTIFACT_LOCAL_DIR_ENV, None)
+        self.s3 = mock.Mock()
+        self.etag = '"v1"'
+        self.s3.get_object.side_effect = lambda Bucket, Key: {'Body': io.BytesIO(BODY), 'Metadata': {}, 'ETag': self.etag}
+        self.s3.head_object.side_effect = lambda Bucket, Key: {'Metadata': {}, 'ETag': self.etag}
+        self.client = mock.patch('utils.artifact_utils.boto3.client', return_value=self.s3)
+        self.client.start()
+
+    def tearDown(self):
+        self.client.stop()
+        self.env.stop()
+
+    def test_downloads_once(self):
+        path = fetch_artifact(KEY)
+        self.assertEqual(fetch_artifact(KEY), path)
+        self.assertEqual(self.s3.get_object.call_count, 1)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_corrupt_cache_is_downloaded_again(self):
+        path = fetch_artifact(KEY)
+        with open(path, 'wb') as f:
+            f.write(b'truncated')
+        fetch_artifact(KEY)
+        self.assertEqual(self.s3.get_object.call_count, 2)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_replaced_object_is_downloaded_again(self):
+        fetch_artifact(KEY)
+        self.etag = '"v2"'
+        fetch_artifact(KEY)
+        self.assertEqual(self.s3.get_object.call_count, 2)
+        fetch_artifact(KEY)
+        self.assertEqual(self.s3.get_object.call_count, 2)
+
+    def test_sha256_metadata_keeps_cache(self):
+        fetch_artifact(KEY)
+        self.s3.head_object.side_effect = lambda Bucket, Key: {
+            'Metadata': {'sha256': hashlib.sha256(BODY).hexdigest()}, 'ETag': '"copied"'
+        }
+        fetch_artifact(KEY)
+        self.assertEqual(self.s3.get_object.call_count, 1)
+
+    def test_unreachable_s3_serves_cache(self):
+        path = fetch_artifact(KEY)
+        self.s3.head_object.side_effect = OSError('no route to s3')
+        with mock.patch('traceback.print_exc'):
+            self.assertEqual(fetch_artifact(KEY), path)
+        self.assertEqual(self.s3.get_object.call_count, 1)
+
+    def test_checksum_mismatch(self):
+        self.s3.get_object.side_effect = lambda Bucket, Key: {'Body': io.BytesIO(BODY), 'Metadata': {'sha256': 'bad'}}
+        with self.assertRaises(ArtifactChecksumError):
+            fetch_artifact(KEY)
+        self.s3.get_object.side_effect = lambda Bucket, Key: {
+            'Body': io.BytesIO(BODY), 'Metadata': {'sha256': hashlib.sha256(BODY).hexdigest()}
+        }
+        fetch_artifact(KEY)
+
+    def test_lazy_artifact(self):
+        load = lazy_artifact(KEY)
+        self.s3.get_object.assert_not_called()
+        self.assertIs(load(), load())
+        self.assertEqual(load(), {'weights': [1, 2, 3]})
+        self.assertEqual(self.s3.get_object.call_count, 1)
+
+    def test_local_override(self):
+        local_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(local_dir, 'artifacts/test'))
+        with open(os.path.join(local_dir, KEY), 'wb') as f:
+            f.write(BODY)
+        with mock.patch.dict(os.environ, {artifact_utils.ARTIFACT_LOCAL_DIR_ENV: local_dir}):
+            self.assertEqual(fetch_artifact(KEY), os.path.join(local_dir, KEY))
+            with self.assertRaises(FileNotFoundError):
+                fetch_artifact('artifacts/test/missing.pkl')
+        self.s3.get_object.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
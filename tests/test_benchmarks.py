@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.entity_formation_bench import compare_to_baseline, request_pairs
+from benchmarks.stand_ins import create_geotag_db, sqlite_query_geotags
+from benchmarks.synthetic import PAYLOAD_ADDRESS_KEYS, SyntheticCorpus, address_keys, synthetic_requests
+
+
+class TestStandIns(unittest.TestCase):
+
+    def test_sqlite_geotags_match_query_geotags_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'address_keys.sqlite')
+            create_geotag_db(path, PAYLOAD_ADDRESS_KEYS)
+            query_geotags = sqlite_query_geotags(path)
+            self.assertEqual(query_geotags(['3259484', 2383383, 999]), {
+                3259484: {'city': 'Decatur', 'state': 'GA', 'street': 'N Decatur Rd'},
+                2383383: {'city': 'Philadelphia', 'state': 'PA', 'street': None},
+            })
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    def test_same_seed_same_requests(self):
+        geotags = address_keys(50)
+        first = synthetic_requests(SyntheticCorpus(100, geotags, seed=3), 'batch', 2, 20)
+        second = synthetic_requests(SyntheticCorpus(100, geotags, seed=3), 'batch', 2, 20)
+        self.assertEqual(first, second)
+        self.assertEqual([len(r['pairs']) for r in first], [20, 20])
+        self.assertTrue(all(p['rm']['cpli'] in geotags for r in first for p in r['pairs']))
+
+    def test_request_pairs(self):
+        corpus = SyntheticCorpus(20, address_keys(50))
+        entity, = synthetic_requests(corpus, 'string_to_entity', 1, 10)
+        cluster, = synthetic_requests(corpus, 'cluster', 1, 10)
+        self.assertEqual(request_pairs(entity, {}), 10)
+        self.assertEqual(request_pairs(cluster, {'pairs_scored': 7}), 7)
+
+
+class TestBaseline(unittest.TestCase):
+
+    BASELINE = {'svc': {'batch': {'p50_ms': 10.0, 'p95_ms': 20.0, 'pairs_per_sec': 1000.0, 'peak_rss_mb': 200.0}}}
+
+    def results(self, **changes):
+        summary = dict(self.BASELINE['svc']['batch'], errors=0)
+        summary.update(changes)
+        return {'svc': {'batch': summary}}
+
+    def test_within_tolerance(self):
+        results = self.results(p95_ms=24.0, pairs_per_sec=800.0, peak_rss_mb=220.0)
+        self.assertEqual(compare_to_baseline(results, self.BASELINE, tolerance=.25, rss_tolerance=.15), [])
+
+    def test_regressions(self):
+        results = self.results(p50_ms=13.0, pairs_per_sec=700.0, peak_rss_mb=240.0)
+        regressions = compare_to_baseline(results, self.BASELINE, tolerance=.25, rss_tolerance=.15)
+        self.assertEqual([r.split(':')[1].split()[0] for r in regressions], ['p50_ms', 'pairs_per_sec', 'peak_rss_mb'])
+
+    def test_failed_requests_fail_without_baseline(self):
+        self.assertEqual(len(compare_to_baseline(self.results(errors=2), {}, .25, .15)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import importlib.util
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+from scipy.spatial import distance
+
+from entity_formation_fixtures import TinyEmbeddingModel, fixture_model
+
+SERVICE = 'embedded_string_comparison'
+if SERVICE not in sys.path:
+    sys.path.append(SERVICE)
+
+import embedded_comp  # noqa: E402
+from embedded_comp import EMBEDDING_FEATURE, SentenceEmbedder, cosine_similarities  # noqa: E402
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(f'{SERVICE}_app', f'{SERVICE}/app.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestSentenceEmbedder(unittest.TestCase):
+
+    def test_embeds_each_normalized_string_once(self):
+        model = TinyEmbeddingModel()
+        embedder = SentenceEmbedder(model=model, preprocess=normalize)
+        vectors = embedder.embed(['UMIAMI medicine urology', 'umiami  medicine urology', 'umiami neurology'])
+        self.assertEqual(vectors.shape, (3, 8))
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_array_equal(vectors[0], vectors[1])
+        self.assertEqual(model.calls, [['umiami medicine urology', 'umiami neurology']])
+
+        embedder.embed(['umiami neurology', 'umiami cardiology'])
+        self.assertEqual(model.calls[1:], [['umiami cardiology']])
+
+    def test_model_loaded_on_first_use(self):
+        load_model = mock.Mock(return_value=TinyEmbeddingModel())
+        embedder = SentenceEmbedder(load_model=load_model, preprocess=normalize)
+        load_model.assert_not_called()
+        embedder.embed(['a b'])
+        embedder.embed(['c d'])
+        load_model.assert_called_once_with()
+
+    def test_pair_similarities_match_scipy(self):
+        embedder = SentenceEmbedder(model=TinyEmbeddingModel(), preprocess=normalize)
+        s1s = ['umiami medicine urology', 'nyu langone', 'same words']
+        s2s = ['umiami medicine neurology', 'upenn radiology', 'same words']
+        sims = embedder.pair_similarities(s1s, s2s)
+        expected = [1 - distance.cosine(embedder.embed([a])[0], embedder.embed([b])[0]) for a, b in zip(s1s, s2s)]
+        np.testing.assert_allclose(sims, expected, rtol=1e-6)
+        self.assertAlmostEqual(sims[2], 1.0, places=6)
+
+    def test_zero_vectors_score_zero(self):
+        np.testing.assert_array_equal(cosine_similarities(np.zeros((1, 3)), np.ones((1, 3))), [0.0])
+
+    @unittest.skipUnless(importlib.util.find_spec('nltk'), 'nltk is not installed')
+    def test_preprocess_sentence(self):
+        self.assertEqual(embedded_comp.preprocess_sentence('UMIAMI MEDICINE - UROLOGY'), 'umiami medicine - urology')
+
+
+class TestEmbeddingFeature(unittest.TestCase):
+
+    def setUp(self):
+        self.app = load_app()
+        self.model = TinyEmbeddingModel()
+        patcher = mock.patch.object(self.app, 'sentence_embedder', SentenceEmbedder(model=self.model, preprocess=normalize))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_request_pairs_embedded_in_one_batch(self):
+        cols = self.app.ef_feature_columns + [EMBEDDING_FEATURE]
+        rf = fixture_model(cols)
+        entity = ['carle bromenn medical center', 'bromenn med center er', 'osf st joseph']
+        result = self.app.compare_record_entity(rf, cols, 'advocate bromenn regional medical center', entity)
+        self.assertEqual(len(self.model.calls), 1)
+        self.assertEqual(result['all_comparisons'], [
+            self.app.compare_eval_records(rf, 'advocate bromenn regional medical center', e, cols) for e in entity
+        ])
+
+    def test_models_without_the_feature_never_embed(self):
+        rf = fixture_model(self.app.ef_feature_columns)
+        self.app.compare_record_entity(rf, self.app.ef_feature_columns, 'nyu langone', ['nyu langone health'])
+        self.assertEqual(self.model.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
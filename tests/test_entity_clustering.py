@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from entity_formation_fixtures import load_entity_formation_app
+from entity_formation_model_updated_th.clustering import (
+    UnionFind, candidate_pairs, connected_components, metadata_identifiers
+)
+
+ENTITIES = [
+    {'name': 'upenn radiology', 'metadata': {'phone_numbers': ['2155551234']}},
+    {'name': 'UPenn Radiology', 'metadata': {}},
+    {'name': 'jefferson urology', 'metadata': {'org_npis': [1962424036.0]}},
+    {'name': 'tjuh urology clinic', 'metadata': {'org_npis': ['1962424036']}},
+    {'name': 'osf st joseph', 'metadata': None},
+    'random string of ohio',
+]
+
+
+class TestBlocking(unittest.TestCase):
+
+    def test_candidate_pairs(self):
+        names = [e['name'] if isinstance(e, dict) else e for e in ENTITIES]
+        metadata = [e.get('metadata') if isinstance(e, dict) else None for e in ENTITIES]
+        self.assertEqual(candidate_pairs(names, metadata), [(0, 1), (2, 3)])
+        # every block of two is over the limit, the token blocks are dropped and the npi block is split
+        self.assertEqual(candidate_pairs(names, metadata, max_block_size=1), [(2, 3)])
+
+    def test_oversized_identifier_blocks_are_split(self):
+        names = [f'clinic {i}' for i in range(7)]
+        metadata = [{'cpli': 3259484}] * 7
+        pairs = candidate_pairs(names, metadata, max_block_size=3)
+        # 'clinic' is over the limit, the shared cpli is chained through overlapping chunks of three
+        self.assertEqual(pairs, [(0, 1), (0, 2), (1, 2), (2, 3), (2, 4), (3, 4), (4, 5), (4, 6), (5, 6)])
+        self.assertEqual(connected_components(7, pairs), [list(range(7))])
+        self.assertEqual(candidate_pairs(names, [None] * 7, max_block_size=3), [])
+
+    def test_identifiers_are_normalized(self):
+        self.assertEqual(metadata_identifiers({'phone_numbers': '(309) 454-1400'}, 'phone_numbers'), {'3094541400'})
+        self.assertEqual(metadata_identifiers({'org_npis': [1306867866.0, '1306867866']}, 'org_npis'), {'1306867866'})
+        self.assertEqual(metadata_identifiers(None, 'org_npis'), set())
+
+    def test_connected_components(self):
+        self.assertEqual(connected_components(6, [(0, 1), (4, 2), (1, 5)]), [[0, 1, 5], [2, 4], [3]])
+        union_find = UnionFind(3)
+        union_find.union(0, 2)
+        self.assertEqual(union_find.find(2), union_find.find(0))
+
+
+class TestClusterMode(unittest.TestCase):
+
+    def test_cluster_handler(self):
+        app = load_entity_formation_app()
+        event = {'body': json.dumps({'comparison_type': 'cluster', 'entities': ENTITIES, 'threshold': 0.9})}
+        body = json.loads(app.handler(event, None)['body'])
+        self.assertEqual(body['pairs_scored'], 2)
+        # identical names (after lower casing) are decided by the rules as the same entity
+        self.assertEqual(body['edges'][0], [0, 1, 0.999])
+        self.assertIn([0, 1], body['clusters'])
+        self.assertEqual(sorted(i for cluster in body['clusters'] for i in cluster), list(range(len(ENTITIES))))
+
+
+if __name__ == '__main__':
+    unittest.main()
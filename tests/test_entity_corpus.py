@@ -0,0 +1,51 @@
+import json
+import unittest
+from unittest import mock
+
+from entity_formation_fixtures import load_entity_formation_app
+from entity_formation_model_updated_th.corpus import EntityCorpus
+
+RECORDS = [
+    {'name': 'Cleveland Clinic', 'metadata': {'org_npis': [1]}},
+    {'name': 'Cleveland Clinic - Cardiology', 'metadata': {}},
+    {'name': 'Random String of Ohio', 'metadata': {}},
+    {'name': 'upenn urology', 'metadata': {}},
+    {'name': 'upenn radiology', 'metadata': {}},
+    {'name': 'nyu langone emergency room', 'metadata': None},
+]
+
+
+class TestEntityCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = EntityCorpus.from_records(RECORDS)
+
+    def test_top_k(self):
+        top = self.corpus.top_k('cleveland clinic cardiology', 2)
+        self.assertEqual([i for i, _ in top], [1, 0])
+        self.assertGreater(top[0][1], top[1][1])
+        self.assertEqual(self.corpus.top_k('zzzz', 3), [])
+        self.assertEqual(sorted(i for i, _ in self.corpus.top_k('upenn', 100)[:2]), [3, 4])
+
+    def test_metadata_must_line_up(self):
+        with self.assertRaises(ValueError):
+            EntityCorpus(['a', 'b'], [{}])
+
+    def test_string_to_corpus(self):
+        app = load_entity_formation_app()
+        model = app.get_entity_formation_model()
+        event = {'body': json.dumps({'comparison_type': 'string_to_corpus', 'record': 'upenn radiology', 'k': 2})}
+        with mock.patch.object(app, 'entity_corpus', return_value=self.corpus):
+            resp = app.handler(event, None)
+        candidates = json.loads(resp['body'])['candidates']
+        self.assertEqual(len(candidates), 2)
+        self.assertEqual(candidates[0]['entity'], 'upenn radiology')
+        self.assertEqual(candidates[0]['model_score'], 0.999)
+        self.assertEqual(candidates[1]['model_score'], app.compare_eval_records(
+            model, 'upenn radiology', candidates[1]['entity'], model.feature_names_in_,
+            em=candidates[1]['entity_metadata']
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import unittest
+from unittest import mock
+
+from entity_formation_fixtures import load_entity_formation_app
+from utils import geographic_utils
+
+
+class TestBatchComparison(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = load_entity_formation_app()
+        cls.model = cls.app.get_entity_formation_model()
+
+    def test_batch_matches_single_pair_scores(self):
+        pairs = [
+            {'s1': 'Cleveland Clinic', 's2': 'Cleveland Clinic', 'rm': {}, 'em': {}},
+            {'s1': 'advanced healthcare urology', 's2': 'advanced healthcare neurology', 'rm': {}, 'em': {}},
+            {'s1': 'upenn family practice', 's2': 'upenn family medicine', 'rm': {'phone_numbers': ['8585789600']},
+             'em': {'phone_numbers': ['8585789600']}},
+            ['jefferson health northeast', 'jefferson health', {}, {}],
+        ]
+        batch = self.app.compare_eval_records_batch(
+            self.model, pairs, self.model.feature_names_in_
+        )
+        single = [
+            self.app.compare_eval_records(self.model, *self.app.unpack_pair(pair)[:2],
+                                          self.model.feature_names_in_, *self.app.unpack_pair(pair)[2:])
+            for pair in pairs
+        ]
+        self.assertEqual(len(batch), len(pairs))
+        for batch_score, single_score in zip(batch, single):
+            self.assertAlmostEqual(batch_score, single_score)
+        self.assertEqual(batch[0], 0.999)
+
+    def test_malformed_pair_only_fails_itself(self):
+        with mock.patch('traceback.print_exc'), mock.patch('builtins.print'):
+            scores = self.app.compare_eval_records_batch(self.model, [
+                ['upenn radiology', 'upenn radiology'], ['upenn radiology'], [None, 'upenn'], 'upenn', {'s1': 'upenn'},
+                ['upenn urology', 'upenn nephrology'],
+            ], self.model.feature_names_in_)
+        self.assertEqual(scores, [0.999, None, None, None, None, 0.001])
+
+    def test_batch_handler(self):
+        event = {'body': json.dumps({
+            'comparison_type': 'batch',
+            'pairs': [['upenn urology', 'upenn nephrology'], ['upenn radiology', 'upenn radiology']]
+        })}
+        resp = self.app.handler(event, None)
+        self.assertEqual(resp['statusCode'], 200)
+        self.assertEqual(json.loads(resp['body'])['model_scores'], [0.001, 0.999])
+
+    def test_rule_counts(self):
+        before = self.app.RULE_COUNTS.copy()
+        self.app.compare_eval_records_batch(self.model, [
+            ['upenn urology', 'upenn nephrology'], ['upenn radiology', 'upenn radiology'],
+            ['advanced healthcare', 'advanced health care'],
+        ], self.model.feature_names_in_)
+        counts = self.app.RULE_COUNTS - before
+        self.assertEqual(counts['diff:mismatched_specialty_flag'], 1)
+        self.assertEqual(counts['identical_strings'], 1)
+        self.assertEqual(sum(counts.values()), 3)
+
+    def test_rules_look_up_both_geotags_together(self):
+        geographic_utils.GEOTAG_CACHE.clear()
+        address_keys = {
+            3259484: {'city': 'Decatur', 'state': 'GA', 'street': 'N Decatur Rd'},
+            2383383: {'city': 'Philadelphia', 'state': 'PA', 'street': None},
+        }
+        with mock.patch.object(geographic_utils, 'query_geotags',
+                               side_effect=lambda cplis: {cpli: dict(address_keys[cpli]) for cpli in cplis}) as query:
+            self.app.apply_business_rules('emory clinic decatur', 'emory clinic', {'cpli': 3259484}, {'cpli': 2383383})
+        query.assert_called_once_with([2383383, 3259484])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from entity_formation_fixtures import EF_FEATURES, load_entity_formation_app
+from entity_formation_model_updated_th.features import (
+    EntityFormationFeatureEngine, create_char_grams, entity_formation_features, prepare_string
+)
+from utils.parsing_utils import EntityStringParsing
+from utils.string_parser_lookup import departments_lookup, medical_entities, field_roots
+
+PAIRS = [
+    ('advanced healthcare urology', 'advanced healthcare neurology', None, None),
+    ('upenn family practice', 'upenn family medicine', {'phone_numbers': ['8585789600']},
+     {'phone_numbers': ['8585789600', '2155551234']}),
+    ('jefferson health northeast', 'jefferson health', {'org_npis': [1]}, {'org_npis': [1, 2]}),
+    ('nyu langone emergency room', 'nyu langone medical center er', {}, {}),
+    ('advocate bromenn regional medical center', 'carle bromenn ip rehab', None, {'location_types': ['hospital']}),
+    ('st lukes', 'saint lukes cardiology', None, None),
+    ('a', 'b c d', None, None),
+    ('st  lukes  - cardiology', 'st lukes   cardiolgy', None, None),
+]
+
+
+class TestFeatureEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.esp = EntityStringParsing(
+            medical_entities=medical_entities, fields=field_roots, departments=departments_lookup
+        )
+        self.records = [self.esp.create_comparison_records(s1, s2) for s1, s2, _, _ in PAIRS]
+        self.columns = [list(column) for column in zip(*PAIRS)]
+
+    def test_matches_feature_dicts(self):
+        columns = list(reversed(EF_FEATURES))
+        expected = np.nan_to_num(pd.DataFrame([
+            entity_formation_features(record, s1, s2, o1, o2) for record, (s1, s2, o1, o2) in zip(self.records, PAIRS)
+        ])[columns].values.astype(np.float64))
+        X = EntityFormationFeatureEngine(columns).transform(self.records, *self.columns)
+        self.assertEqual(X.shape, (len(PAIRS), len(columns)))
+        self.assertEqual(X.dtype, np.float32)
+        np.testing.assert_allclose(X, expected.astype(np.float32), rtol=1e-6)
+
+    def test_only_requested_columns(self):
+        X = EntityFormationFeatureEngine(['overall_roland', 'overall_sim']).transform(self.records, *self.columns)
+        self.assertEqual(X.shape, (len(PAIRS), 2))
+        self.assertEqual(X[0, 0], 67)
+
+    def test_unknown_feature(self):
+        with self.assertRaises(KeyError):
+            EntityFormationFeatureEngine(['overall_sim', 'not_a_feature'])
+
+    def test_prepared_strings_are_shared(self):
+        prepared = prepare_string('upenn   family practice')
+        self.assertIs(prepared, prepare_string('upenn   family practice'))
+        self.assertIs(prepared.char_grams(2), prepared.char_grams(2))
+        self.assertEqual(prepared.char_grams(2), set(create_char_grams('upenn   family practice', 2)))
+        self.assertEqual(prepared.words, ['upenn', 'family', 'practice'])
+
+    def test_failed_pair_does_not_fail_the_batch(self):
+        app = load_entity_formation_app()
+        model = app.get_entity_formation_model()
+        pairs = [
+            ('upenn urology clinic', 'upenn urology practice', {'org_npis': []}, {'org_npis': []}),
+            ('advanced healthcare urology', 'advanced healthcare neurology', {}, {}),
+        ]
+        scores = app.compare_eval_records_batch(model, pairs, model.feature_names_in_)
+        self.assertIsNone(scores[0])
+        self.assertEqual(
+            scores[1], app.compare_eval_records(model, *pairs[1][:2], model.feature_names_in_)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
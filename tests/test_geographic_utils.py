@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from utils import geographic_utils
+from utils.cache_utils import TTLCache
+
+ADDRESS_KEYS = {
+    3259484: {'city': 'Decatur', 'state': 'GA', 'street': 'N Decatur Rd'},
+    2383383: {'city': 'Philadelphia', 'state': 'PA', 'street': None},
+}
+
+
+def fake_query_geotags(cplis):
+    return {cpli: dict(ADDRESS_KEYS[cpli]) for cpli in cplis if cpli in ADDRESS_KEYS}
+
+
+class TestGeotagCache(unittest.TestCase):
+
+    def setUp(self):
+        geographic_utils.GEOTAG_CACHE.clear()
+        patcher = mock.patch.object(geographic_utils, 'query_geotags', side_effect=fake_query_geotags)
+        self.query = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pull_geotags_is_cached(self):
+        self.assertEqual(geographic_utils.pull_geotags('3259484'), ['decatur', 'ga', 'n decatur rd', 'georgia'])
+        self.assertEqual(geographic_utils.pull_geotags(3259484), ['decatur', 'ga', 'n decatur rd', 'georgia'])
+        self.assertEqual(self.query.call_count, 1)
+
+    def test_pull_geotags_many_fetches_missing_cplis_once(self):
+        geographic_utils.pull_geotags(3259484)
+        geotags = geographic_utils.pull_geotags_many([3259484, '2383383', 2383383, None, 12345])
+        self.assertEqual(geotags, {
+            3259484: ['decatur', 'ga', 'n decatur rd', 'georgia'],
+            2383383: ['philadelphia', 'pa', 'pennsylvania'],
+        })
+        self.assertEqual(self.query.call_count, 2)
+        self.assertEqual(sorted(self.query.call_args[0][0]), [12345, 2383383])
+
+    def test_unknown_cpli_raises(self):
+        with self.assertRaises(KeyError):
+            geographic_utils.pull_geotags(12345)
+
+
+class TestHospitalCpliIndex(unittest.TestCase):
+
+    def setUp(self):
+        with open(geographic_utils.HOSPITAL_CPLIS_FILE) as f:
+            self.hospital_cplis = [int(i.strip()) for i in f.read().split(',')]
+
+    def test_index_matches_text_file(self):
+        index = geographic_utils.build_hospital_cpli_index()
+        self.assertEqual(list(index), sorted(set(self.hospital_cplis)))
+        self.assertFalse(index.flags.writeable)
+
+    def test_membership(self):
+        cpli = self.hospital_cplis[0]
+        self.assertTrue(geographic_utils.is_hospital_cpli(cpli))
+        self.assertTrue(geographic_utils.is_hospital_cpli(float(cpli)))
+        self.assertFalse(geographic_utils.is_hospital_cpli(str(cpli)))
+        self.assertFalse(geographic_utils.is_hospital_cpli(None))
+        self.assertFalse(geographic_utils.is_hospital_cpli(1))
+        self.assertEqual(
+            list(geographic_utils.is_hospital_cpli_many([cpli, 1, max(self.hospital_cplis) + 1])),
+            [True, False, False]
+        )
+
+    def test_prebuilt_index_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'hospital_cplis.npy')
+            geographic_utils.write_hospital_cpli_index(path)
+            self.assertTrue(np.array_equal(np.load(path, mmap_mode='r'), geographic_utils.build_hospital_cpli_index()))
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_entries_expire(self):
+        now = [0]
+        cache = TTLCache(maxsize=10, ttl=5, timer=lambda: now[0])
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 6
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.cache_info().hits, 1)
+        self.assertEqual(cache.cache_info().misses, 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=None)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
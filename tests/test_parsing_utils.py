@@ -0,0 +1,109 @@
+import unittest
+
+from benchmarks.parse_specialty_bench import reference_parse_specialty
+from utils.parsing_utils import EntityStringParsing, multiple_word_edit_distance, single_word_edit_distance
+from utils.string_parser_lookup import departments_lookup, medical_entities, field_roots
+
+
+class TestParsedRecordCache(unittest.TestCase):
+
+    def setUp(self):
+        self.esp = EntityStringParsing(
+            medical_entities=medical_entities, fields=field_roots, departments=departments_lookup
+        )
+
+    def test_repeated_strings_are_parsed_once(self):
+        for entity in ['advocate bromenn medical center', 'bromenn med center er', 'carle bromenn ip rehab']:
+            self.esp.create_comparison_records('advocate bromenn regional medical center', entity)
+        info = self.esp.parsed_record_cache_info()
+        self.assertEqual(info.misses, 4)
+        self.assertEqual(info.hits, 2)
+
+    def test_parsed_records_are_read_only(self):
+        record = self.esp.create_parsed_record('nyu langone emergency room')
+        self.assertIs(record, self.esp.create_parsed_record('nyu langone emergency room'))
+        self.assertEqual(record['department_entities'], {'emergency room'})
+        with self.assertRaises(TypeError):
+            record['string'] = 'changed'
+        with self.assertRaises(TypeError):
+            record['mapping']['emergency room'] = 'changed'
+        with self.assertRaises(AttributeError):
+            record['total_entities'].add('changed')
+
+    def test_lookup_version_changes_with_lookups(self):
+        other = EntityStringParsing(
+            medical_entities=medical_entities, fields=field_roots + ['podiatry'], departments=departments_lookup
+        )
+        self.assertNotEqual(self.esp.lookup_version, other.lookup_version)
+
+
+class TestFuzzyMatching(unittest.TestCase):
+
+    def setUp(self):
+        self.esp = EntityStringParsing(
+            medical_entities=medical_entities, fields=field_roots, departments=departments_lookup
+        )
+        self.strings = [
+            'upenn famly medicine', 'emergncy rom', 'nyu langone physical therapy', 'urgnt care', 'physcal',
+            'st marys medcal centr', 'the hosptial of penn', 'carle medical grup', 'radiolgy', '', ' ',
+        ]
+
+    def test_department_matches(self):
+        for string in self.strings:
+            words = string.split()
+            single = {
+                d: [w for w in words if single_word_edit_distance(d, w)]
+                for d in departments_lookup if len(d.split()) == 1
+            }
+            self.assertEqual(
+                dict(self.esp.single_word_department_matches(words)), {d: m for d, m in single.items() if m}, string
+            )
+            multiple = {
+                d: multiple_word_edit_distance(d, string) for d in departments_lookup if len(d.split()) > 1
+            }
+            self.assertEqual(
+                self.esp.multiple_word_department_matches(string), {d: m for d, m in multiple.items() if m}, string
+            )
+
+    def test_parse_specialty(self):
+        strings = self.strings + [
+            'upenn cardiology and cardiologist', 'nyu radiolgy', 'emory nephrologists', 'gastroenterolgy center',
+            'pulmonary pulmonology neurology urology', 'ob gyn ent', 'otorhinolaryngology', 'hepatolog', 'oncolgy',
+        ]
+        for string in strings:
+            self.assertEqual(self.esp.parse_specialty(string), reference_parse_specialty(field_roots, string), string)
+
+    def test_medical_entities_and_hospitals(self):
+        self.assertEqual(self.esp.parse_medical_entities('st marys medcal centr', 'medical center'),
+                         ('medical center', 'medcal centr'))
+        self.assertEqual(self.esp.parse_medical_entities('st marys medcal', 'medical center'), [])
+        self.assertEqual(self.esp.parse_hospitals('the hospitl of penn'), [('hospital', 'hospitl')])
+
+
+class TestLazyComparisonRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.esp = EntityStringParsing(
+            medical_entities=medical_entities, fields=field_roots, departments=departments_lookup
+        )
+
+    def test_flags_only_compute_what_they_need(self):
+        record = self.esp.create_comparison_records('upenn urology', 'upenn nephrology')
+        self.assertTrue(record['business_logic_match']['mismatched_specialty_flag'])
+        self.assertEqual(
+            sorted(record.computed_fields()),
+            ['business_logic_match', 'diff_speciality_elements', 's1_speciality_entities', 's2_speciality_entities']
+        )
+
+    def test_to_dict_has_every_field(self):
+        record = self.esp.create_comparison_records('nyu langone emergency room', 'nyu langone er')
+        full = record.to_dict()
+        self.assertEqual(list(full), list(record))
+        self.assertEqual(len(full['business_logic_match']), 6)
+        self.assertEqual(full['fuzz_sim'], record['fuzz_sim'])
+        with self.assertRaises(KeyError):
+            record['not_a_field']
+
+
+if __name__ == '__main__':
+    unittest.main()
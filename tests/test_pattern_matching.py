@@ -0,0 +1,76 @@
+import re
+import unittest
+
+from Levenshtein import distance as levenshtein_distance
+
+from utils.pattern_matching import EditDistanceIndex, MultiPatternMatcher, deletions, is_literal_pattern
+from utils.string_parser_lookup import departments_lookup, medical_entities
+
+PATTERNS = (
+    list(departments_lookup.keys()) +
+    [m for matchers in departments_lookup.values() for m in matchers] +
+    [m for matches in medical_entities.values() for m in matches] +
+    ['hospital', 'hospt']
+)
+
+STRINGS = [
+    'nyu langone medical center emergency room',
+    'the emegency  room at st lukes',
+    'emegency room',
+    'pharmacies of the medical ctr',
+    'medicalcenter ambulatory surgery center - icu',
+    'upenn physicians group (phy)',
+    'sleep clinic & sleep lab',
+    'hosptal',
+    'dialysisdialysis',
+    'rehab_rehabilitation',
+    '',
+]
+
+
+class TestMultiPatternMatcher(unittest.TestCase):
+
+    def test_lookup_patterns_are_literal(self):
+        self.assertTrue(all(is_literal_pattern(p) for p in PATTERNS))
+
+    def test_scan_matches_re(self):
+        matcher = MultiPatternMatcher(PATTERNS)
+        for string in STRINGS:
+            hits = matcher.scan(string)
+            self.assertEqual(hits.substrings, set(p for p in PATTERNS if p in string), string)
+            self.assertEqual(
+                hits.bounded, set(p for p in PATTERNS if re.search(r'\b' + p + r'\b', string)), string
+            )
+
+    def test_overlapping_occurrences(self):
+        matcher = MultiPatternMatcher(['he', 'she', 'hers', 'his'])
+        self.assertEqual(
+            sorted(matcher.find_all('ushers')), [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+        )
+
+
+class TestEditDistanceIndex(unittest.TestCase):
+
+    def test_deletions(self):
+        self.assertEqual(deletions('abc', 1), {'abc', 'bc', 'ac', 'ab'})
+        self.assertEqual(deletions('ab', 3), {'ab', 'a', 'b', ''})
+
+    def test_lookup_matches_levenshtein(self):
+        terms = [w for p in PATTERNS for w in p.split()]
+        index = EditDistanceIndex(terms, max_distance=2)
+        words = [w for s in STRINGS for w in s.split()] + ['hospitl', 'emergncy', 'medcal', 'ctr', 'x', 'ÿ', 'a' * 40]
+        for word in words:
+            for max_distance in (0, 1, 2):
+                self.assertEqual(
+                    index.lookup(word, max_distance),
+                    set(t for t in terms if levenshtein_distance(t, word) <= max_distance),
+                    (word, max_distance)
+                )
+
+    def test_distance_above_the_index(self):
+        with self.assertRaises(ValueError):
+            EditDistanceIndex(['hospital'], max_distance=1).lookup('hospitl', 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
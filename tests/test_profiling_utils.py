@@ -0,0 +1,62 @@
+import contextlib
+import io
+import json
+import unittest
+
+from entity_formation_fixtures import load_entity_formation_app
+from utils.profiling_utils import StageHistograms, is_profiling, profile_request, stage
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_stages_are_free_when_not_profiling(self):
+        with profile_request(debug=False) as profile:
+            self.assertIsNone(profile)
+            self.assertFalse(is_profiling())
+            with stage('parsing'):
+                pass
+
+    def test_request_breakdown(self):
+        with profile_request(debug=True) as profile:
+            for _ in range(3):
+                with stage('rules'):
+                    with stage('geotags'):
+                        pass
+        self.assertFalse(is_profiling())
+        breakdown = profile.breakdown()
+        self.assertEqual(breakdown['rules'][1], 3)
+        self.assertEqual(breakdown['geotags'][1], 3)
+        self.assertGreaterEqual(breakdown['rules'][0], breakdown['geotags'][0])
+
+    def test_histograms_flush_as_json(self):
+        clock = [0.0]
+        histograms = StageHistograms(bounds_ms=[1, 10], timer=lambda: clock[0])
+        histograms.record('predict', 0.0005)
+        histograms.record('predict', 0.005)
+        histograms.record('predict', 0.5)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            histograms.flush()
+            self.assertEqual(out.getvalue(), '')
+            clock[0] = 3600
+            histograms.flush()
+        line = json.loads(out.getvalue())
+        self.assertEqual(line['stage_histograms']['predict']['buckets'], [1, 1, 1])
+        self.assertEqual(histograms.snapshot(), {})
+
+    def test_debug_timings_header(self):
+        app = load_entity_formation_app()
+        event = {'body': json.dumps({
+            'comparison_type': 'batch', 'debug': True,
+            'pairs': [['upenn urology', 'upenn nephrology'], ['advanced healthcare', 'advanced health care']]
+        })}
+        resp = app.handler(event, None)
+        timings = json.loads(resp['headers']['X-Timings'])
+        for name in ['parsing', 'rules', 'features', 'predict', 'feature:overall_sim']:
+            self.assertIn(name, timings)
+        event = {'body': json.dumps({'comparison_type': 'batch', 'pairs': [['a b', 'a c']]})}
+        self.assertNotIn('X-Timings', app.handler(event, None)['headers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
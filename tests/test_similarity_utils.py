@@ -0,0 +1,36 @@
+import itertools
+import unittest
+
+from polyfuzz import PolyFuzz
+from polyfuzz.models import RapidFuzz
+
+from utils.similarity_utils import rapidfuzz_scorer
+
+STRINGS = [
+    'cleveland clinic', 'Cleveland Clinic - Cardiology', "st luke's east hospital", 'saint lukes east',
+    'emory decatur medical center', 'emory decatur hospital', 'nyu departmen of nephrolog', 'ER', '', '  ',
+]
+
+
+def polyfuzz_sim(s1, s2):
+    return PolyFuzz(RapidFuzz(n_jobs=1)).match([s1], [s2]).get_matches().iloc[0]['Similarity']
+
+
+class TestRapidFuzzScorer(unittest.TestCase):
+
+    def test_single_pair_matches_polyfuzz(self):
+        for s1, s2 in itertools.product(STRINGS, STRINGS):
+            self.assertEqual(rapidfuzz_scorer.score(s1, s2), polyfuzz_sim(s1, s2), (s1, s2))
+
+    def test_matrix_matches_single_pairs(self):
+        matrix = rapidfuzz_scorer.score_matrix(STRINGS[:4], STRINGS[4:])
+        self.assertEqual(matrix.shape, (4, len(STRINGS) - 4))
+        for (i, s1), (j, s2) in itertools.product(enumerate(STRINGS[:4]), enumerate(STRINGS[4:])):
+            self.assertEqual(matrix[i, j], rapidfuzz_scorer.score(s1, s2))
+
+    def test_empty_matrix(self):
+        self.assertEqual(rapidfuzz_scorer.score_matrix(['a'], []).shape, (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import importlib.util
+import sys
+import unittest
+from unittest import mock
+
+from entity_formation_fixtures import fixture_model
+
+SERVICES = ['entity_formation_string_comparison', 'embedded_string_comparison']
+
+
+def load_service_app(service):
+    # the flat services import their sibling modules top level, like the lambda image lays them out
+    if service not in sys.path:
+        sys.path.append(service)
+    spec = importlib.util.spec_from_file_location(f'{service}_app', f'{service}/app.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestPairMemo(unittest.TestCase):
+
+    def test_truthset_pass_reuses_scores(self):
+        for service in SERVICES:
+            app = load_service_app(service)
+            model = fixture_model(app.ef_feature_columns)
+            entity = ['carle bromenn medical center', 'bromenn med center er', 'bromenn med center er', 'osf st joseph']
+            metadata = {'phone_numbers': ['3094541400'], 'org_npis': None}
+            kwargs = dict(
+                record_metadata=metadata, entity_metadata=dict(metadata), truthset_records=['carle bromenn medical center']
+            )
+            with mock.patch.object(app, 'compare_eval_records', wraps=app.compare_eval_records) as scored:
+                result = app.compare_record_entity(
+                    model, app.ef_feature_columns, 'advocate bromenn regional medical center', entity, **kwargs
+                )
+            with mock.patch.object(app, 'memoized_compare_eval_records',
+                                   lambda memo, *args, **kw: app.compare_eval_records(*args, **kw)):
+                unmemoized = app.compare_record_entity(
+                    model, app.ef_feature_columns, 'advocate bromenn regional medical center', entity, **kwargs
+                )
+            self.assertEqual(result, unmemoized, service)
+            self.assertEqual(len(result['all_comparisons']), 8, service)
+            # the duplicate entity is scored once, and 'osf st joseph' (no truthset terms to strip) is the
+            # same pair in both passes
+            self.assertEqual(scored.call_count, 5, service)
+
+
+if __name__ == '__main__':
+    unittest.main()
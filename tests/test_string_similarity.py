@@ -0,0 +1,200 @@
+import re
+import unittest
+
+import numpy as np
+
+from utils import string_similarity
+from utils.string_similarity import (
+    compute_roland_score, find_ngrams, i_token_max_similarity, meta_data_overlap, meta_data_overlaps, roland_scores,
+    similarity, similarity_many, token_max_similarity_many, token_overlap, token_overlap_many
+)
+
+
+# the copies every service carried before utils.string_similarity, kept verbatim to check against
+def reference_find_ngrams(text: str, number: int=3) -> set:
+    if not text:
+        return set()
+
+    words = [f'  {x} ' for x in re.split(r'\W+', text.lower()) if x.strip()]
+
+    ngrams = set()
+
+    for word in words:
+        for x in range(0, len(word) - number + 1):
+            ngrams.add(word[x:x+number])
+
+    return ngrams
+
+
+def reference_similarity(text1: str, text2: str, number: int=3) -> float:
+    """entity_formation_model_updated_th, entity_formation_string_comparison and embedded_string_comparison"""
+    if text1 is None or text2 is None:
+        return None
+
+    ngrams1 = reference_find_ngrams(text1, number)
+    ngrams2 = reference_find_ngrams(text2, number)
+
+    num_unique = len(ngrams1 | ngrams2)
+    if num_unique == 0:
+        return 0
+    num_equal = len(ngrams1 & ngrams2)
+    return float(num_equal) / float(num_unique)
+
+
+def reference_insurance_similarity(text1: str, text2: str, number: int=3) -> float:
+    """insurance_mapping_model, without the guard for two strings with no n-grams"""
+    if text1 is None or text2 is None:
+        return None
+
+    ngrams1 = reference_find_ngrams(text1, number)
+    ngrams2 = reference_find_ngrams(text2, number)
+
+    num_unique = len(ngrams1 | ngrams2)
+    num_equal = len(ngrams1 & ngrams2)
+    return float(num_equal) / float(num_unique)
+
+
+def reference_token_overlap(s1: str, s2: str) -> float:
+    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
+    t2 = s2.lower().replace('  ',' ').replace('   ',' ').split(' ')
+    return len([t for t in t1 if t1 in t2])/len(t1)
+
+
+def reference_i_token_max_similarity(s1: str, s2: str, n: int) -> float:
+    t1 = s1.lower().replace('  ',' ').replace('   ',' ').split(' ')
+    if n >= len(t1):
+        return 0.0
+    else:
+        return max([reference_similarity(t1[n], t) for t in s2.lower().replace('  ',' ').replace('   ',' ').split(' ')])
+
+
+def reference_compute_roland_score(possible_name, cleaned_name):
+    word_set_1 = possible_name.split(' ')
+    word_set_2 = cleaned_name.split(' ')
+    total_words = len(word_set_1) + len(word_set_2)
+    count_of_syncs = 0
+    for word_temp in word_set_1:
+        if word_temp in word_set_2:
+            count_of_syncs += 1
+    for word_temp in word_set_2:
+        if word_temp in word_set_1:
+            count_of_syncs += 1
+    roland_score = int(round(100.0 * count_of_syncs / total_words, 0))
+    return roland_score
+
+
+def reference_meta_data_overlap(m1, m2):
+    if m1 is None or m2 is None:
+        return 0
+    return float(len([m for m in m1 if m in m2]) + len([m for m in m2 if m in m1])) / (len(m1) + len(m2))
+
+
+STRINGS = [
+    'nyu langone health', 'NYU Langone  Health', 'nyu langone orthopedics', 'upenn   family practice',
+    'upenn family medicine', 'carle bromenn medical center', 'bromenn med center er', 'osf st. joseph',
+    'osf saint joseph', "st mary's hospital - cardiology", 'emory decatur hospital', 'emory  decatur   hospital',
+    'umiami medicine urology', 'UMIAMI MEDICINE - UROLOGY', 'a', 'ab', 'er', ' leading space', 'trailing space ',
+    '', ' ', '---', '&&& / ###', 'clínica são josé', 'hôpital de montréal', 'ortho 2nd floor suite 100',
+]
+PAIRS = [(s1, s2) for s1 in STRINGS for s2 in STRINGS]
+
+
+class TestStringSimilarityParity(unittest.TestCase):
+
+    def test_find_ngrams(self):
+        for text in STRINGS + [None]:
+            for number in (2, 3, 4):
+                self.assertEqual(find_ngrams(text, number), reference_find_ngrams(text, number))
+
+    def test_similarity(self):
+        for s1, s2 in PAIRS:
+            for number in (2, 3):
+                self.assertEqual(similarity(s1, s2, number), reference_similarity(s1, s2, number), (s1, s2))
+        self.assertIsNone(similarity(None, 'nyu'))
+        self.assertIsNone(similarity('nyu', None))
+
+    def test_insurance_similarity(self):
+        # the insurance copy raised for two strings without any n-gram, it now scores them 0 like the others
+        for s1, s2 in PAIRS:
+            try:
+                expected = reference_insurance_similarity(s1, s2)
+            except ZeroDivisionError:
+                self.assertFalse(reference_find_ngrams(s1) or reference_find_ngrams(s2))
+                self.assertEqual(similarity(s1, s2), 0)
+                continue
+            self.assertEqual(similarity(s1, s2), expected, (s1, s2))
+
+    def test_token_overlap(self):
+        for s1, s2 in PAIRS:
+            self.assertEqual(token_overlap(s1, s2), reference_token_overlap(s1, s2))
+        with self.assertRaises(AttributeError):
+            token_overlap(None, 'nyu')
+
+    def test_i_token_max_similarity(self):
+        for s1, s2 in PAIRS:
+            for n in range(6):
+                self.assertEqual(i_token_max_similarity(s1, s2, n), reference_i_token_max_similarity(s1, s2, n), (s1, s2, n))
+
+    def test_compute_roland_score(self):
+        for s1, s2 in PAIRS:
+            self.assertEqual(compute_roland_score(s1, s2), reference_compute_roland_score(s1, s2), (s1, s2))
+
+    def test_meta_data_overlap(self):
+        lists = [None, ['1234567890'], ['1234567890', '5555555555'], ['hospital', 'clinic', 'clinic'],
+                 [1, 2.0, True], [['nested'], 'x'], [{'a': 1}], ['clinic']]
+        for m1 in lists:
+            for m2 in lists:
+                self.assertEqual(meta_data_overlap(m1, m2), reference_meta_data_overlap(m1, m2), (m1, m2))
+        with self.assertRaises(ZeroDivisionError):
+            meta_data_overlap([], [])
+
+
+class TestBatchEntryPoints(unittest.TestCase):
+
+    def setUp(self):
+        self.s1s = [s1 for s1, _ in PAIRS]
+        self.s2s = [s2 for _, s2 in PAIRS]
+
+    def test_batches_match_the_scalar_functions(self):
+        np.testing.assert_array_equal(similarity_many(self.s1s, self.s2s), [similarity(*p) for p in PAIRS])
+        np.testing.assert_array_equal(roland_scores(self.s1s, self.s2s), [compute_roland_score(*p) for p in PAIRS])
+        np.testing.assert_array_equal(token_overlap_many(self.s1s, self.s2s), np.zeros(len(PAIRS)))
+        for n in range(3):
+            np.testing.assert_array_equal(
+                token_max_similarity_many(self.s1s, self.s2s, n), [i_token_max_similarity(s1, s2, n) for s1, s2 in PAIRS]
+            )
+        np.testing.assert_array_equal(
+            meta_data_overlaps([['a', 'b'], None], [['b'], ['a']]), [meta_data_overlap(['a', 'b'], ['b']), 0]
+        )
+
+    def test_missing_strings_are_nan(self):
+        sims = similarity_many(['nyu', None], [None, 'nyu langone'])
+        self.assertEqual(sims.dtype, np.float64)
+        self.assertTrue(np.isnan(sims).all())
+
+
+class TestVocabulary(unittest.TestCase):
+
+    def test_ids_are_stable(self):
+        vocabulary = {}
+        self.assertEqual(string_similarity.intern_id(vocabulary, ' ny'), 0)
+        self.assertEqual(string_similarity.intern_id(vocabulary, 'nyu'), 1)
+        self.assertEqual(string_similarity.intern_id(vocabulary, ' ny'), 0)
+
+    def test_full_vocabulary_keeps_scores(self):
+        vocabulary = {'nyu': 0}
+        limit = string_similarity.VOCABULARY_LIMIT
+        string_similarity.VOCABULARY_LIMIT = 1
+        try:
+            self.assertEqual(string_similarity.intern_id(vocabulary, 'nyu'), 0)
+            self.assertEqual(string_similarity.intern_id(vocabulary, 'yu '), 'yu ')
+            self.assertEqual(vocabulary, {'nyu': 0})
+            self.assertEqual(
+                string_similarity.jaccard(frozenset([0, 'yu ']), frozenset([0, 'yu ', 'lan'])), 2 / 3
+            )
+        finally:
+            string_similarity.VOCABULARY_LIMIT = limit
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,26 +2,17 @@ import pandas as pd
 from twilio.rest import Client
 import json
 import re
-from sqlalchemy import create_engine
 from datetime import datetime
 import boto3
 import ast
 import os
+from utils.db_utils import Statement, fetch_row, get_engine
 
 SECRETS_PREFIX = "dev-lambda-"
 SECRETS_NORM = f"{SECRETS_PREFIX}norm"
 SECRETS_TWILIO = f"{SECRETS_PREFIX}twilio"
 
 
-def get_norm_secrets():
-    return (
-        os.environ['DB_NORMALIZED_USER'],
-        os.environ['DB_NORMALIZED_PASSWORD'],
-        os.environ['DB_NORMALIZED_HOST_RW'],
-        os.environ['DB_NORMALIZED_NAME'],
-    )
-
-
 def get_twilio_secrets():
     return os.environ["TWILIO_ACCT_SID"], os.environ["TWILIO_AUTH_TOKEN"],
 
@@ -37,19 +28,17 @@ def clean_phones(phone_number):
         return clean_number
 
 
-def norm_connection():
-    login = "postgresql://{0}:{1}@{2}:5432/{3}".format(*get_norm_secrets())
-    return create_engine(login)
+EXISTING_PHONE_QUERY = "SELECT lookup_response FROM twilio_phones WHERE phone = $1::BIGINT"
+EXISTING_PHONE = Statement('check_existing_phones', EXISTING_PHONE_QUERY)
 
-def check_existing_phones(phone_number, conn):
-    q = "SELECT * FROM twilio_phones WHERE phone = {}".format(phone_number)
 
-    twilio_phones = pd.read_sql(q, conn)
+def check_existing_phones(phone_number, conn):
+    twilio_phone = fetch_row(conn, EXISTING_PHONE, int(phone_number))
 
-    if len(twilio_phones.index) == 0:
+    if twilio_phone is None:
         return False, {}
     else:
-        return True, twilio_phones['lookup_response'][0]
+        return True, twilio_phone[0]
 
 
 def append_new_phone(twilio_response, engine):
@@ -101,7 +90,8 @@ def handler(event, context):
     else:
         phone = clean_phones(data['phone'])
 
-        engine = norm_connection()
+        # pooled engine shared across invocations, used for the lookup and for storing a new response
+        engine = get_engine('normalized', 'writer')
 
         status, twilio_response = check_existing_phones(phone, engine)
 
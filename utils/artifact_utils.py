@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import traceback
+from functools import lru_cache
+
+import boto3
+
+DATASCIENCE_MICROSERVICES_BUCKET = "rh-ds-microservices"
+# where downloaded artifacts are kept, /tmp survives between invocations of a warm lambda container
+ARTIFACT_CACHE_DIR_ENV = 'ARTIFACT_CACHE_DIR'
+DEFAULT_ARTIFACT_CACHE_DIR = '/tmp/artifacts'
+# when set, artifacts are read from <dir>/<s3 key> and S3 is never called (tests, local runs, baked images)
+ARTIFACT_LOCAL_DIR_ENV = 'ARTIFACT_LOCAL_DIR'
+# object metadata key an uploader can set to the sha256 of the artifact, checked on download when present
+SHA256_METADATA_KEY = 'sha256'
+
+
+class ArtifactChecksumError(Exception):
+    pass
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_cache_path(bucket: str, key: str, cache_dir: str = None) -> str:
+    cache_dir = cache_dir or os.environ.get(ARTIFACT_CACHE_DIR_ENV, DEFAULT_ARTIFACT_CACHE_DIR)
+    return os.path.join(cache_dir, bucket, key)
+
+
+def read_sidecar(path: str):
+    try:
+        with open(path + '.sha256') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cached(path: str) -> bool:
+    """True when the file exists and still hashes to the sha256 recorded next to it when it was downloaded"""
+    sidecar = read_sidecar(path)
+    if sidecar is None or not os.path.exists(path):
+        return False
+    return file_sha256(path) == sidecar.get('sha256')
+
+
+def is_current(path: str, bucket: str, key: str) -> bool:
+    """
+    True when S3 still holds the version of s3://bucket/key that was cached at path, by the ETag recorded in
+    the sidecar or the object's sha256 metadata. Costs one head_object call, the body is not read
+    """
+    sidecar = read_sidecar(path) or {}
+    head = boto3.client('s3').head_object(Bucket=bucket, Key=key)
+    if sidecar.get('etag') and sidecar['etag'] == head.get('ETag'):
+        return True
+    expected = (head.get('Metadata') or {}).get(SHA256_METADATA_KEY)
+    return bool(expected) and expected == sidecar.get('sha256')
+
+
+def atomic_write(path: str, body: bytes):
+    """writes to a temp file in the same directory and renames it, so a reader never sees half a file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def download_artifact(bucket: str, key: str, path: str):
+    print(f"downloading s3://{bucket}/{key}")
+    obj = boto3.client('s3').get_object(Bucket=bucket, Key=key)
+    body = obj['Body'].read()
+    sha256 = hashlib.sha256(body).hexdigest()
+    expected = (obj.get('Metadata') or {}).get(SHA256_METADATA_KEY)
+    if expected and expected != sha256:
+        raise ArtifactChecksumError(f's3://{bucket}/{key} has sha256 {sha256}, expected {expected}')
+    atomic_write(path, body)
+    sidecar = {'bucket': bucket, 'key': key, 'sha256': sha256, 'etag': obj.get('ETag')}
+    atomic_write(path + '.sha256', json.dumps(sidecar).encode())
+
+
+def fetch_artifact(key: str, bucket: str = DATASCIENCE_MICROSERVICES_BUCKET, cache_dir: str = None) -> str:
+    """
+    Returns a local path to the artifact stored at s3://bucket/key. The artifact is downloaded once and
+    then served from the cache directory for as long as its checksum holds and a head_object shows the
+    object in S3 is still the same version, so a replaced artifact is picked up without downloading an
+    unchanged one again. When S3 can't be reached the verified local copy is served.
+    :param key: S3 key of the artifact
+    :param bucket: S3 bucket, defaults to the data science microservices bucket
+    :param cache_dir: cache directory, defaults to $ARTIFACT_CACHE_DIR or /tmp/artifacts
+    :return: path of the local copy
+    """
+    local_dir = os.environ.get(ARTIFACT_LOCAL_DIR_ENV)
+    if local_dir:
+        path = os.path.join(local_dir, key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'{key} not found in {ARTIFACT_LOCAL_DIR_ENV}={local_dir}')
+        return path
+
+    path = artifact_cache_path(bucket, key, cache_dir)
+    if is_cached(path):
+        try:
+            if is_current(path, bucket, key):
+                return path
+        except Exception:
+            traceback.print_exc()
+            return path
+    download_artifact(bucket, key, path)
+    return path
+
+
+def load_pickle(path: str):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def lazy_artifact(key: str, loader=load_pickle, bucket: str = DATASCIENCE_MICROSERVICES_BUCKET):
+    """
+    Wraps an artifact in a function that fetches and loads it on its first call and returns the same
+    object afterwards. Modules define these at import time instead of downloading the artifact there.
+    :param key: S3 key of the artifact
+    :param loader: function that turns the local path into the loaded object, defaults to unpickling
+    :param bucket: S3 bucket
+    """
+    @lru_cache(maxsize=1)
+    def load():
+        try:
+            return loader(fetch_artifact(key, bucket=bucket))
+        except Exception:
+            traceback.print_exc()
+            raise
+    load.key = key
+    return load
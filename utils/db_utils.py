@@ -6,108 +6,360 @@ import boto3
 import pandas as pd
 import psycopg2
 import requests
-import urllib
+import urllib.parse
 import uuid
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 import ast
+import re
+import sys
 import os
+import threading
+from utils.cache_utils import TTLCache
 
 def get_boto_session():
     return boto3.Session(region_name='us-west-2')
 
-def __pull_global_secret(varname, boto_client):
-    secret_vars_dict = ast.literal_eval(boto_client.get_secret_value(SecretId=varname)['SecretString'])
-    if 'value' in secret_vars_dict:
-        return secret_vars_dict['value']
-    raise Exception()
 
+SECRETS_NAME = os.environ.get('DS_MS_SECRETS_NAME', 'DS_MS_SECRETS')  # "dev-internal-tool-secrets"
+# parsed secrets, so a cold start fetches the bundle once instead of once per variable
+SECRETS_CACHE = TTLCache(maxsize=64, ttl=int(os.environ.get('SECRETS_CACHE_TTL_SECONDS', 900)))
 
-def get_boto_session():
-    return boto3.Session(region_name='us-west-2')
 
-def __pull_global_secret(varname, boto_client):
-    secret_vars_dict = ast.literal_eval(boto_client.get_secret_value(SecretId=varname)['SecretString'])
+class SecretsManagerBackend():
+    """reads secrets from AWS Secrets Manager, with one client for the life of the process"""
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_boto_session().client(service_name='secretsmanager')
+        return self._client
+
+    def get_secret(self, secret_id):
+        return ast.literal_eval(self.client.get_secret_value(SecretId=secret_id)['SecretString'])
+
+
+class DictSecretsBackend():
+    """secrets from a local {secret_id: {key: value}} dict, for tests and local runs"""
+    def __init__(self, secrets):
+        self.secrets = secrets
+
+    def get_secret(self, secret_id):
+        return self.secrets[secret_id]
+
+
+_secrets_backend = SecretsManagerBackend()
+
+
+def set_secrets_backend(backend):
+    """replaces where secrets are read from and forgets the cached ones :return: the previous backend"""
+    global _secrets_backend
+    previous, _secrets_backend = _secrets_backend, backend
+    SECRETS_CACHE.clear()
+    return previous
+
+
+def get_secret(secret_id):
+    """parsed secret dict, fetched from the backend at most once per SECRETS_CACHE ttl"""
+    secret = SECRETS_CACHE.get(secret_id)
+    if secret is None:
+        secret = _secrets_backend.get_secret(secret_id)
+        SECRETS_CACHE.set(secret_id, secret)
+    return secret
+
+
+def _pull_global_secret(varname):
+    secret_vars_dict = get_secret(varname)
     if 'value' in secret_vars_dict:
         return secret_vars_dict['value']
     raise Exception()
 
+
 def get_env_var(varname):
     if varname in os.environ:
         val = os.environ[varname]
         return val
 
-    print(f"Couldn't find {varname} in local envars - using secrets manager")
-    secret_name = 'DS_MS_SECRETS'  # "dev-internal-tool-secrets"
-    client = get_boto_session().client(service_name='secretsmanager')
-    secret_vars_dict = ast.literal_eval(client.get_secret_value(SecretId=secret_name)['SecretString'])
+    secret_vars_dict = get_secret(SECRETS_NAME)
 
     if varname in secret_vars_dict:
-        # logger.info(f'secret_vars_dict={secret_vars_dict}')
         val = secret_vars_dict[varname]
         if not val.startswith('GLOBAL_'):
             return val
         # We need to pull the global secret then
-        res_val = __pull_global_secret(val, client)
-        return res_val
+        return _pull_global_secret(val)
     else:
         return None
 
 
-def norm_db_conn():
-    # DB_NORMALIZED_USER = "temp_external_user"
-    DB_NORMALIZED_USER = get_env_var(varname='DB_NORMALIZED_USER')
-    DB_NORMALIZED_HOST = get_env_var(varname='DB_NORMALIZED_HOST_RW')
-    DB_NORMALIZED_NAME = get_env_var(varname='DB_NORMALIZED_NAME')
-    DB_NORMALIZED_PASSWORD = get_env_var(varname='DB_NORMALIZED_PASSWORD')
-    # DB_NORMALIZED_USER = os.environ['DB_NORMALIZED_USER']
-    # DB_NORMALIZED_HOST = os.environ['DB_NORMALIZED_HOST']
-    # DB_NORMALIZED_NAME = os.environ['DB_NORMALIZED_NAME']
-    # DB_NORMALIZED_PASSWORD = os.environ['DB_NORMALIZED_PASSWORD']
-
-    login = "postgresql://{0}:{1}@{2}:5432/{3}".format(DB_NORMALIZED_USER, DB_NORMALIZED_PASSWORD,
-                                                       DB_NORMALIZED_HOST, DB_NORMALIZED_NAME)
-
-    conn = psycopg2.connect("host='{0}' dbname='{1}' user='{2}' password='{3}'".format(
-        DB_NORMALIZED_HOST,
-        DB_NORMALIZED_NAME,
-        DB_NORMALIZED_USER,
-        DB_NORMALIZED_PASSWORD
-    ))
-    conn.autocommit = True
-    return create_engine(login), conn
+# host, user, password and database name variables of every cluster, per role
+DB_CLUSTERS = {
+    'normalized': {
+        'user': 'DB_NORMALIZED_USER', 'password': 'DB_NORMALIZED_PASSWORD', 'name': 'DB_NORMALIZED_NAME',
+        'hosts': {'writer': 'DB_NORMALIZED_HOST_RW', 'reader': 'DB_NORMALIZED_HOST_RO'},
+    },
+    'rapid': {
+        'user': 'DB_RAPID_USER', 'password': 'DB_RAPID_PASSWORD', 'name': 'DB_RAPID_NAME',
+        'hosts': {'writer': 'DB_RAPID_HOST_RW', 'reader': 'DB_RAPID_HOST_RO'},
+    },
+}
+# a Lambda container serves one request at a time, so a couple of connections per engine is plenty
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 2))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+DB_POOL_TIMEOUT_SECONDS = int(os.environ.get('DB_POOL_TIMEOUT_SECONDS', 30))
+# reconnect before Aurora or a NAT drops an idle connection
+DB_POOL_RECYCLE_SECONDS = int(os.environ.get('DB_POOL_RECYCLE_SECONDS', 1800))
 
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
 
-def norm_db_reader_conn():
-    # DB_NORMALIZED_USER = "temp_external_user"
-    DB_NORMALIZED_USER = get_env_var(varname='DB_NORMALIZED_USER')
-    DB_NORMALIZED_HOST = get_env_var(varname='DB_NORMALIZED_HOST_RO')
-    DB_NORMALIZED_NAME = get_env_var(varname='DB_NORMALIZED_NAME')
-    DB_NORMALIZED_PASSWORD = get_env_var(varname='DB_NORMALIZED_PASSWORD')
-    # DB_NORMALIZED_USER = os.environ['DB_NORMALIZED_USER']
-    # DB_NORMALIZED_HOST = os.environ['DB_NORMALIZED_HOST']
-    # DB_NORMALIZED_NAME = os.environ['DB_NORMALIZED_NAME']
-    # DB_NORMALIZED_PASSWORD = os.environ['DB_NORMALIZED_PASSWORD']
 
-    login = "postgresql://{0}:{1}@{2}:5432/{3}".format(DB_NORMALIZED_USER, DB_NORMALIZED_PASSWORD,
-                                                       DB_NORMALIZED_HOST, DB_NORMALIZED_NAME)
-    print(DB_NORMALIZED_HOST, DB_NORMALIZED_USER)
+def database_url(cluster, role='reader'):
+    """
+    DB_URL_<CLUSTER>_<ROLE> (e.g. DB_URL_RAPID_READER=sqlite:////tmp/rapid.sqlite) when set, otherwise the
+    postgres url built from the cluster's variables
+    """
+    override = os.environ.get(f'DB_URL_{cluster.upper()}_{role.upper()}')
+    if override:
+        return override
+    if cluster not in DB_CLUSTERS or role not in DB_CLUSTERS[cluster]['hosts']:
+        raise KeyError(f'no database {cluster} {role}')
+    config = DB_CLUSTERS[cluster]
+    user = get_env_var(varname=config['user'])
+    password = get_env_var(varname=config['password'])
+    host = get_env_var(varname=config['hosts'][role])
+    name = get_env_var(varname=config['name'])
+    if not (user and password and host and name):
+        raise Exception(f'Unable to construct database connection for {cluster} {role}')
+    return "postgresql://{0}:{1}@{2}:5432/{3}".format(
+        urllib.parse.quote_plus(user), urllib.parse.quote_plus(password), host, name
+    )
 
-    return create_engine(login)
 
+def _reset_autocommit(dbapi_connection, connection_record):
+    # connections handed out by autocommit_connection go back to the pool in normal transaction mode
+    if getattr(dbapi_connection, 'autocommit', None) is True:
+        dbapi_connection.autocommit = False
 
-def rapid_db_conn():
-    DB_NORMALIZED_USER = get_env_var(varname='DB_RAPID_USER')
-    DB_NORMALIZED_HOST =  get_env_var(varname='DB_RAPID_HOST_RW')
-    DB_NORMALIZED_NAME = get_env_var(varname='DB_RAPID_NAME')
-    DB_NORMALIZED_PASSWORD = get_env_var(varname='DB_RAPID_PASSWORD')
-    login = "postgresql://{0}:{1}@{2}:5432/{3}".format(DB_NORMALIZED_USER, DB_NORMALIZED_PASSWORD,
-                                                       DB_NORMALIZED_HOST, DB_NORMALIZED_NAME)
 
-    conn = psycopg2.connect("host='{0}' dbname='{1}' user='{2}' password='{3}'".format(DB_NORMALIZED_HOST,
-                                                                                       DB_NORMALIZED_NAME,
-                                                                                       DB_NORMALIZED_USER,
-                                                                                       DB_NORMALIZED_PASSWORD))
-    conn.autocommit = True
-    return create_engine(login), conn
+def create_pooled_engine(url):
+    """engine with a QueuePool sized by the DB_POOL_ variables, connections are pinged before every checkout"""
+    engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+    event.listen(engine, 'checkin', _reset_autocommit)
+    return engine
+
+
+def get_engine(cluster, role='reader'):
+    """
+    the process wide engine of a cluster ('normalized' or 'rapid') and role ('writer' or 'reader'), created
+    on first use and then shared by every caller and every warm invocation. Don't dispose it
+    """
+    key = (cluster, role)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        with _ENGINES_LOCK:
+            engine = _ENGINES.get(key)
+            if engine is None:
+                engine = _ENGINES[key] = create_pooled_engine(database_url(cluster, role))
+    return engine
+
+
+def autocommit_connection(cluster, role='writer'):
+    """
+    raw DBAPI connection (psycopg2 for the postgres clusters) checked out of the engine's pool, with
+    autocommit on. close() hands it back to the pool instead of closing it
+    """
+    connection = get_engine(cluster, role).raw_connection()
+    # the pre ping may have opened a transaction, and autocommit can't be switched inside one
+    connection.rollback()
+    connection.set_session(autocommit=True)
+    return connection
+
+
+def pool_stats():
+    """connections per engine: pool size, idle in the pool, checked out and overflow in use"""
+    return {
+        f'{cluster}_{role}': {
+            'size': engine.pool.size(),
+            'checked_in': engine.pool.checkedin(),
+            'checked_out': engine.pool.checkedout(),
+            'overflow': engine.pool.overflow(),
+        }
+        for (cluster, role), engine in list(_ENGINES.items())
+    }
+
+
+def dispose_engines():
+    """closes every pooled connection and empties the registry, e.g. after a fork or between tests"""
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+
+
+PARAMETER = re.compile(r'\$(\d+)')
+
+
+class Statement():
+    """
+    named query with $1, $2, ... parameters, as postgres writes them. On postgres it is
+    prepared once per pooled connection, so every later call only sends EXECUTE and the values
+    """
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+
+    def __repr__(self):
+        return f'Statement({self.name!r})'
+
+
+def _dbapi_connection(connection):
+    # dbapi_connection since SQLAlchemy 1.4.24, connection before
+    return getattr(connection, 'dbapi_connection', None) or connection.connection
+
+
+def _is_postgres(dbapi_connection):
+    return isinstance(dbapi_connection, psycopg2.extensions.connection)
+
+
+def _execute_prepared(cursor, info, statement, args):
+    prepared = info.setdefault('prepared_statements', set())
+    if statement.name not in prepared:
+        # PREPARE outlives the transaction, and the pool clears info when it replaces the connection
+        cursor.execute(f'PREPARE {statement.name} AS {statement.sql}')
+        prepared.add(statement.name)
+    if args:
+        cursor.execute(f"EXECUTE {statement.name} ({', '.join(['%s'] * len(args))})", args)
+    else:
+        cursor.execute(f'EXECUTE {statement.name}')
+
+
+def _execute_unprepared(cursor, dbapi_connection, statement, args):
+    # other databases (sqlite in the tests) get the $n parameters rewritten to their positional style
+    module = sys.modules.get(type(dbapi_connection).__module__.split('.')[0])
+    placeholder = '%s' if getattr(module, 'paramstyle', 'qmark') in ('format', 'pyformat') else '?'
+    positions = [int(n) - 1 for n in PARAMETER.findall(statement.sql)]
+    cursor.execute(PARAMETER.sub(placeholder, statement.sql), [args[i] for i in positions])
+
+
+def fetch_rows(conn, statement, *args, as_dict=False):
+    """
+    rows of a Statement, without building a DataFrame
+    :param conn: an engine, a connection is checked out of its pool for the call, or a connection from
+        raw_connection() / autocommit_connection
+    :return: list of tuples, or of {column: value} dicts with as_dict
+    """
+    connection = conn.raw_connection() if hasattr(conn, 'raw_connection') else conn
+    try:
+        dbapi_connection = _dbapi_connection(connection)
+        cursor = connection.cursor()
+        try:
+            if _is_postgres(dbapi_connection):
+                _execute_prepared(cursor, connection.info, statement, args)
+            else:
+                _execute_unprepared(cursor, dbapi_connection, statement, args)
+            rows = cursor.fetchall()
+            if as_dict:
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in rows]
+        finally:
+            cursor.close()
+    finally:
+        if connection is not conn:
+            connection.close()
+    return rows
+
+
+def fetch_row(conn, statement, *args, as_dict=False):
+    """the first row of a Statement, None when there is none. See fetch_rows"""
+    rows = fetch_rows(conn, statement, *args, as_dict=as_dict)
+    return rows[0] if rows else None
+
+
+class BatchLoader():
+    """
+    Request scoped loader for one kind of point lookup. Keys passed to load() are collected, and the next
+    get() fetches every pending key with a single query, so N lookups cost one round trip. The statement
+    takes the list of keys as $1 (e.g. WHERE address = ANY($1::text[])). Results, misses included, are kept
+    for the life of the loader: create one per request, and clear() a key after writing it
+    :param conn: an engine or a raw connection, see fetch_rows
+    :param key: column (as_dict) or index of the key in a row, the first row of every key is kept
+    """
+    def __init__(self, conn, statement, key=0, as_dict=False):
+        self.conn = conn
+        self.statement = statement
+        self.key = key
+        self.as_dict = as_dict
+        self.pending = []
+        self.results = {}
+        self.queries = 0
+
+    def load(self, key):
+        if key not in self.results and key not in self.pending:
+            self.pending.append(key)
+        return self
+
+    def load_many(self, keys):
+        for key in keys:
+            self.load(key)
+        return self
+
+    def dispatch(self):
+        """fetches every pending key with one query"""
+        if not self.pending:
+            return
+        keys, self.pending = self.pending, []
+        rows = fetch_rows(self.conn, self.statement, keys, as_dict=self.as_dict)
+        self.queries += 1
+        found = {}
+        for row in rows:
+            found.setdefault(row[self.key], row)
+        for key in keys:
+            self.results[key] = found.get(key)
+
+    def get(self, key):
+        """:return: the row of the key, None when there is none"""
+        self.load(key).dispatch()
+        return self.results[key]
+
+    def get_many(self, keys):
+        self.load_many(keys).dispatch()
+        return [self.results[key] for key in keys]
+
+    def prime(self, key, row):
+        self.results[key] = row
+
+    def clear(self, key=None):
+        """forgets one key, e.g. after inserting it, or every key"""
+        if key is None:
+            self.results.clear()
+        else:
+            self.results.pop(key, None)
+
+
+def norm_db_conn():
+    """pooled normalized writer engine and an autocommit connection from its pool, close the connection when done"""
+    return get_engine('normalized', 'writer'), autocommit_connection('normalized', 'writer')
+
+
+def norm_db_reader_conn():
+    return get_engine('normalized', 'reader')
+
+
+def rapid_db_conn():
+    """pooled rapid writer engine and an autocommit connection from its pool, close the connection when done"""
+    return get_engine('rapid', 'writer'), autocommit_connection('rapid', 'writer')
 
 
+def rapid_db_reader_conn():
+    return get_engine('rapid', 'reader')
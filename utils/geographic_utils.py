@@ -1,149 +1,141 @@
 import json
 from functools import lru_cache
-import sqlalchemy
 import os
-import pandas as pd
-import ast
-import boto3
-
-def get_boto_session():
-    return boto3.Session(region_name='us-west-2')
-
-def __pull_global_secret(varname, boto_client):
-    secret_vars_dict = ast.literal_eval(boto_client.get_secret_value(SecretId=varname)['SecretString'])
-    if 'value' in secret_vars_dict:
-        return secret_vars_dict['value']
-    raise Exception()
-
-def get_env_var(varname):
-    if varname in os.environ:
-        val = os.environ[varname]
-        return val
-
-    secret_name = 'DS_MS_SECRETS'  # "dev-internal-tool-secrets"
-    client = get_boto_session().client(service_name='secretsmanager')
-    secret_vars_dict = ast.literal_eval(client.get_secret_value(SecretId=secret_name)['SecretString'])
-
-    if varname in secret_vars_dict:
-        # logger.info(f'secret_vars_dict={secret_vars_dict}')
-        val = secret_vars_dict[varname]
-        if not val.startswith('GLOBAL_'):
-            return val
-        # We need to pull the global secret then
-        res_val = __pull_global_secret(val, client)
-        return res_val
-    else:
-        return None
-
-def _postgres_engine(
-    user: str, password: str, host: str, name: str, echo: bool = False
-) -> sqlalchemy.engine.Engine:
-    """Create a postgres sql engine.
-
-    :param user: User name
-    :param password: Password
-    :param host: Host
-    :param name: Name
-    :param echo: sqlalchemy echo
-
-    :return: A postgres engine
-    """
-    login = f"postgresql://{user}:{password}@{host}:5432/{name}"
-    return sqlalchemy.create_engine(login, echo=echo)
-
-
-
-def _rapid_db_conn(
-    host_env_variable: str, echo: bool = False
-) -> sqlalchemy.engine.Engine:
-    """
-    Norm cluster endpoint engine.
-
-    :param host_env_variable: Then name of the environment variable for the host
-    :param echo: sqlalchemy echo
-
-    .. csv-table:: Environment Variables
-
-       DB_RAPID_USER
-       DB_RAPID_PASSWORD
-       DB_RAPID_HOST_RO
-       DB_RAPID_NAME
-
-    :return: A sql engine to the rapid DB"
-    """
-    db_rapid_user = get_env_var("DB_RAPID_USER")
-    db_rapid_password = get_env_var("DB_RAPID_PASSWORD")
-    db_rapid_host = get_env_var(host_env_variable)
-    db_rapid_name = get_env_var("DB_RAPID_NAME")
-    if not (db_rapid_user and db_rapid_password and db_rapid_host and db_rapid_name):
-        Exception("Unable to construct database connection")
-    return _postgres_engine(
-        db_rapid_user,  # pyright: ignore
-        db_rapid_password,  # pyright: ignore
-        db_rapid_host,  # pyright: ignore
-        db_rapid_name,  # pyright: ignore
-        echo,  # pyright: ignore
-    )
-
-def rapid_db_reader_conn(echo: bool = False) -> sqlalchemy.engine.Engine:
-    """Norm cluster read-only endpoint engine.
-
-    :param echo: sqlalchemy echo
-    .. todo::
-
-       For security reasons this should be calling KMS rather than hard-coded creds.
-
-    .. csv-table:: **Environment Variables**
-
-       DB_RAPID_USER
-       DB_RAPID_PASSWORD
-       DB_RAPID_HOST_RO
-       DB_RAPID_NAME
-
-    :return: A read-writ sql engine to the rapid DB
-    """
-    return _rapid_db_conn("DB_RAPID_HOST_RO", echo)
+import numpy as np
+from utils.cache_utils import TTLCache
+from utils.db_utils import Statement, fetch_rows, rapid_db_reader_conn
+from utils.profiling_utils import stage
 
+GEOTAG_CACHE = TTLCache(
+    maxsize=int(os.environ.get('GEOTAG_CACHE_SIZE', 50000)),
+    ttl=int(os.environ.get('GEOTAG_CACHE_TTL_SECONDS', 3600))
+)
 
+@lru_cache(maxsize=1)
 def pull_state_map():
-    file = json.load(open('utils/state_abbrev_mapping.json', 'rb'))
+    with open('utils/state_abbrev_mapping.json', 'rb') as f:
+        file = json.load(f)
     return file
 
-def pull_geotags(cpli):
-    conn = rapid_db_reader_conn()
-    query = f"""
+GEOTAGS_QUERY = """
     SELECT
         id AS cpli,
         address_components ->> 'city' AS city,
         address_components ->> 'state' AS state,
         address_components ->> 'route' AS street
     FROM address_keys
-    WHERE id::BIGINT = {cpli}
-    LIMIT 1
+    WHERE id::BIGINT = ANY($1::BIGINT[])
     """
-    cpli = int(cpli) if isinstance(cpli, str) else cpli # ensure typing of CPLI
-    geotags = pd.read_sql(sql=query, con=conn).set_index('cpli').to_dict(orient='index')
+GEOTAGS = Statement('pull_geotags', GEOTAGS_QUERY)
+
+def query_geotags(cplis):
+    """pulls the city, state and street for every cpli in one query, keyed by the cpli"""
+    rows = fetch_rows(rapid_db_reader_conn(), GEOTAGS, [int(cpli) for cpli in cplis])
+    return {int(cpli): {'city': city, 'state': state, 'street': street} for cpli, city, state, street in rows}
+
+def geotag_tokens(geotag):
     # add in the long state version to the geotag dictonary
     state_map = pull_state_map()
-    full_state = state_map[geotags[cpli]['state'].title()]
-    geotags[cpli]['full_state'] = full_state
-    geotokens = list(geotags[cpli].values())
+    full_state = state_map[geotag['state'].title()]
+    geotokens = list(geotag.values()) + [full_state]
     # remove any null values from the geotags
     geotokens = [token.lower() for token in geotokens if token is not None]
     return geotokens
 
-
-@lru_cache(maxsize=2048)
-def read_hospital_cplis():
-    file = 'utils/hospital_cplis.txt'
+def pull_geotags(cpli):
+    cpli = int(cpli) if isinstance(cpli, str) else cpli # ensure typing of CPLI
+    geotokens = GEOTAG_CACHE.get(cpli)
+    if geotokens is None:
+        with stage('geotags:query'):
+            geotags = query_geotags([cpli])
+        geotokens = tuple(geotag_tokens(geotags[cpli]))
+        GEOTAG_CACHE.set(cpli, geotokens)
+    return list(geotokens)
+
+def _cached_geotags(cplis):
+    """:return: ({cpli: geotokens} served from GEOTAG_CACHE, sorted cplis that are not cached)"""
+    found, missing = {}, set()
+    for cpli in set(int(c) for c in cplis if c is not None):
+        geotokens = GEOTAG_CACHE.get(cpli)
+        if geotokens is None:
+            missing.add(cpli)
+        else:
+            found[cpli] = list(geotokens)
+    return found, sorted(missing)
+
+def _cache_geotags(geotags, found):
+    for cpli, geotag in geotags.items():
+        try:
+            geotokens = tuple(geotag_tokens(geotag))
+        except (AttributeError, KeyError):
+            # bad state on the address, leave it to pull_geotags to raise for this cpli
+            continue
+        GEOTAG_CACHE.set(cpli, geotokens)
+        found[cpli] = list(geotokens)
+    return found
+
+def pull_geotags_many(cplis):
+    """
+    Geotags for a batch of cplis. Cached cplis are served from GEOTAG_CACHE and every distinct
+    cpli that is not cached is fetched with a single query.
+    :return: {cpli: geotokens} for the cplis that were found
+    """
+    found, missing = _cached_geotags(cplis)
+    if missing:
+        with stage('geotags:query'):
+            geotags = query_geotags(missing)
+        _cache_geotags(geotags, found)
+    return found
+
+HOSPITAL_CPLIS_FILE = 'utils/hospital_cplis.txt'
+# prebuilt form of the file above, written at image build time by write_hospital_cpli_index
+HOSPITAL_CPLIS_INDEX_FILE = 'utils/hospital_cplis.npy'
+
+def build_hospital_cpli_index(file=HOSPITAL_CPLIS_FILE):
+    """parses the comma separated cpli file into a sorted, deduplicated, read only int64 array"""
     with open(file) as f:
-        hospital_cplis = [int(i.strip()) for i in f.read().split(',')]
-
+        hospital_cplis = np.unique(np.array([int(i.strip()) for i in f.read().split(',')], dtype=np.int64))
+    hospital_cplis.setflags(write=False)
     return hospital_cplis
 
+def write_hospital_cpli_index(path=HOSPITAL_CPLIS_INDEX_FILE, file=HOSPITAL_CPLIS_FILE):
+    np.save(path, build_hospital_cpli_index(file))
+
+@lru_cache(maxsize=1)
+def read_hospital_cplis():
+    """
+    Sorted int64 array of hospital cplis. Memory maps the prebuilt index when there is one that is
+    at least as new as the text file, otherwise parses the text file
+    """
+    if (os.path.exists(HOSPITAL_CPLIS_INDEX_FILE) and
+            os.path.getmtime(HOSPITAL_CPLIS_INDEX_FILE) >= os.path.getmtime(HOSPITAL_CPLIS_FILE)):
+        return np.load(HOSPITAL_CPLIS_INDEX_FILE, mmap_mode='r')
+    return build_hospital_cpli_index()
+
 def is_hospital_cpli(cpli):
+    try:
+        value = int(cpli)
+    except (TypeError, ValueError):
+        return False
+    # cplis only ever match by value, so '123' or 123.5 are never hospitals
+    if value != cpli:
+        return False
+    hospitals = read_hospital_cplis()
+    position = np.searchsorted(hospitals, value)
+    return True if position < len(hospitals) and hospitals[position] == value else False
+
+def is_hospital_cpli_many(cplis):
+    """
+    Vectorized is_hospital_cpli for batch callers
+    :param cplis: array like of integer cplis
+    :return: boolean array, True where the cpli is a hospital
+    """
     hospitals = read_hospital_cplis()
-    return True if cpli in hospitals else False
+    cplis = np.asarray(cplis, dtype=np.int64)
+    if len(hospitals) == 0:
+        return np.zeros(cplis.shape, dtype=bool)
+    positions = np.minimum(np.searchsorted(hospitals, cplis), len(hospitals) - 1)
+    return hospitals[positions] == cplis
 
 def is_geotag_diff(s1, s2, cpli):
     geotags = [i.lower() for i in pull_geotags(cpli)]
@@ -155,4 +147,3 @@ def is_geotag_diff(s1, s2, cpli):
         if geotag_words == string_diff_words:
             return True
     return False
-
@@ -1,8 +1,15 @@
 import pandas as pd
 from Levenshtein import distance as levenshtein_distance
-from polyfuzz import PolyFuzz
 from utils.db_utils import norm_db_reader_conn
-from polyfuzz.models import RapidFuzz, Embeddings
+from utils.similarity_utils import rapidfuzz_scorer
+from utils.pattern_matching import EditDistanceIndex, MultiPatternMatcher, is_literal_pattern
+from utils.profiling_utils import stage
+from collections import defaultdict
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
+import hashlib
+import json
 import re
 pd.options.mode.chained_assignment = None  # default='warn'
 
@@ -10,10 +17,7 @@ pd.options.mode.chained_assignment = None  # default='warn'
 def fuzz_sim(s1, s2):
     if s1 == s2:
         return 1.0
-    rapidfuzz_matcher = RapidFuzz(n_jobs=1)
-    pfmodel = PolyFuzz(rapidfuzz_matcher).match([s1.lower()], [s2.lower()])
-    fuzz_sim = pfmodel.get_matches().iloc[0]['Similarity']
-    return fuzz_sim
+    return rapidfuzz_scorer.score(s1.lower(), s2.lower())
 
 def find_word_matches(string, substring):
     matches = []
@@ -70,6 +74,10 @@ def no_meaningful_diff(s1, s2, record):
     else:
         return False
 
+@lru_cache(maxsize=4096)
+def compile_alternation(elements):
+    return re.compile(r'|'.join(map(re.escape, elements)))
+
 def single_word_edit_distance(string, department):
     edit_distance = levenshtein_distance(string, department)
     if edit_distance <= 1:
@@ -77,25 +85,80 @@ def single_word_edit_distance(string, department):
     else:
         return False
 
+HOSPITAL_BASE_MATCHES = ['hospital', 'hospt']
+
+def lookup_tables_version(medical_entities, departments, fields):
+    """short hash of the lookup tables, so cached parses are never reused across different lookups"""
+    tables = json.dumps([medical_entities, departments, fields], sort_keys=True)
+    return hashlib.sha1(tables.encode('utf-8')).hexdigest()[:12]
+
 class EntityStringParsing():
-    def __init__(self, medical_entities, departments, fields):
+    def __init__(self, medical_entities, departments, fields, parsed_record_cache_size=8192):
         self.medical_entities = medical_entities
         self.departments = departments
         self.fields = fields
+        self.lookup_version = lookup_tables_version(medical_entities, departments, fields)
+        # parsed records only depend on the string and the lookups, so repeated names are parsed once
+        # per process (and stay cached across warm invocations)
+        self._cached_parsed_record = lru_cache(maxsize=parsed_record_cache_size)(self._build_parsed_record)
+        # every exact-match term in the lookups goes into one automaton, so a string is scanned once
+        # for all of them instead of once per synonym
+        patterns = (
+            [bm for matches in medical_entities.values() for bm in matches] +
+            list(departments.keys()) +
+            [match for matchers in departments.values() for match in matchers] +
+            HOSPITAL_BASE_MATCHES
+        )
+        self.matcher = MultiPatternMatcher([p for p in patterns if is_literal_pattern(p)])
+        # anything with regex syntax keeps going through re so its meaning doesn't change
+        self.regex_patterns = set(p for p in patterns if not is_literal_pattern(p))
+        # the fuzzy checks (edit distance 1 for departments, 2 for medical entity words and hospital) look
+        # a word up in a deletion index instead of computing its distance to every term
+        self.single_word_departments = set(d for d in departments if len(d.split()) == 1)
+        self.multiple_word_departments = [(d, d.split()) for d in departments if len(d.split()) > 1]
+        self.department_index = EditDistanceIndex(
+            list(self.single_word_departments) + [w for _, words in self.multiple_word_departments for w in words],
+            max_distance=1
+        )
+        self.entity_word_index = EditDistanceIndex(
+            [w for entity_type in medical_entities for w in entity_type.split()[:2]] + ['hospital'], max_distance=2
+        )
+        self.specialty_roots = [i.replace('logy', '').replace('logist', '') for i in fields]
+        self.specialty_name_index = EditDistanceIndex([root + 'logy' for root in self.specialty_roots], max_distance=1)
+        self._specialty_name_positions = defaultdict(list)
+        for i, root in enumerate(self.specialty_roots):
+            self._specialty_name_positions[root + 'logy'].append(i)
+        self._cached_specialty_candidates = lru_cache(maxsize=parsed_record_cache_size)(self._specialty_candidates)
+
+    def find_exact_matches(self, string):
+        return self.matcher.scan(string)
+
+    def _contains(self, string, pattern, hits):
+        if pattern in self.regex_patterns:
+            return pattern in string
+        return pattern in hits.substrings
+
+    def _contains_word(self, string, pattern, hits):
+        if pattern in self.regex_patterns:
+            return bool(re.search(r'\b' + pattern + r'\b', string))
+        return pattern in hits.bounded
+
+    def _matched_text(self, string, pattern):
+        return re.search(pattern, string).group(0) if pattern in self.regex_patterns else pattern
 
     def find_high_level_entities(self, mapping):
         med_entities = list(self.medical_entities.keys()) + ['hospital', 'hospitalists', 'hospitals', 'hospital group', 'hospitalist']
-        high_level = set(i[0] for i in mapping if i[0] in med_entities)
+        high_level = frozenset(i[0] for i in mapping if i[0] in med_entities)
         return high_level
 
     def find_department_entities(self, mapping):
         departments = list(self.departments.keys())
-        depts = set(i[0] for i in mapping if i[0] in departments)
+        depts = frozenset(i[0] for i in mapping if i[0] in departments)
         return depts
 
     def find_specialties(self, mapping):
         specialties = self.fields
-        special = set(i[0] for i in mapping if i[0] in specialties)
+        special = frozenset(i[0] for i in mapping if i[0] in specialties)
         return special
 
     def diff_elements(self, x, y):
@@ -105,18 +168,19 @@ class EntityStringParsing():
         return list(x.intersection(y))
 
     def replace_elements(self, string, elem):
-        new_str = re.sub(r'|'.join(map(re.escape, elem)), '', string).strip()
+        new_str = compile_alternation(tuple(elem)).sub('', string).strip()
         return new_str
 
-    def parse_medical_entities(self, string, entity_type):
+    def parse_medical_entities(self, string, entity_type, hits=None):
         assert entity_type in self.medical_entities.keys(), f'Entity Type must be in {self.medical_entities.keys()}'
         # set the inital match to false
         match = False
         first_word, second_word = entity_type.split()[0], entity_type.split()[1]
         # pull all the input matches from the data and check for exact match
+        hits = self.find_exact_matches(string) if hits is None else hits
         base_matches = self.medical_entities[entity_type]
         for bm in base_matches:
-            if re.search(r'\b' + bm + r'\b', string):
+            if self._contains_word(string, bm, hits):
                 match = True
                 word = bm
 
@@ -124,70 +188,47 @@ class EntityStringParsing():
         if not match:
             words = string.split()
             for i in range(len(words) - 1):
-                # calclate the distance for the first two words (medical and something else)
-                first_word_dist = levenshtein_distance(first_word, words[i])
-                second_word_dist = levenshtein_distance(second_word, words[i + 1])
-                if first_word_dist <= 2 and second_word_dist <= 2:
+                # check the distance for the first two words (medical and something else)
+                if (first_word in self.entity_word_index.lookup(words[i]) and
+                        second_word in self.entity_word_index.lookup(words[i + 1])):
                     match = True
                     word = words[i] + ' ' + words[i + 1]
 
         return (entity_type, word) if match else []
 
-    def parse_hospitals(self, string):
+    def parse_hospitals(self, string, hits=None):
         # look for the word hospital, or any common misspellings
-        base_matches = ['hospital', 'hospt']
+        hits = self.find_exact_matches(string) if hits is None else hits
+        base_matches = HOSPITAL_BASE_MATCHES
         match = False
         for bm in base_matches:
-            if bm in string:
+            if self._contains(string, bm, hits):
                 match = True
                 match_word = bm
 
         if not match:
             words = string.split()
             for word in words:
-                dist = levenshtein_distance(word, 'hospital')
-                if dist <= 2:
+                if 'hospital' in self.entity_word_index.lookup(word):
                     match = True
                     match_word = word
 
         return [('hospital', match_word)] if match else []
 
     def parse_specialty(self, string, cutoff=1):
-        roots = [
-            i.replace('logy', '').replace('logist', '') for i in self.fields
-        ]
-        # first, try to match the exact string
+        roots = self.specialty_roots
+        # first, try to match the exact string (only the root + 'logy' names are ever compared)
         vals = []
-        specialties = []
-        full_names = (
-                [i + 'logy' for i in roots] +
-                [i + 'logist' for i in roots] +
-                [i + 'logists' for i in roots]
-        )
-        for full_name, root in zip(full_names, roots):
-            if full_name in string.split():
-                vals.append((root + 'logy', full_name))
-
-        # then check if the root of the word resembles
-        matches = find_word_matches(string=string, substring='logy')
-        for match in matches:
-            if isinstance(match, str):
-                index_string = match.find('logy')
-                # last four resemble common roots
-            elif isinstance(match, list):
-                # if theres a partial match of the string
-                index_string = match[0].find(match[1])
-                match = match[0]
-            else:
-                for field in roots:
-                    # make sure you're comparing the different parts of words
-                    string_root = match[:index_string].strip()
-                    sim = levenshtein_distance(field, string_root)
-                    if sim == cutoff:
-                        vals.append((field + 'logy', match))
+        words = string.split()
+        word_set = set(words)
+        for root in roots:
+            if root + 'logy' in word_set:
+                vals.append((root + 'logy', root + 'logy'))
+
+        # the pass that compared find_word_matches roots to the fields with cutoff never reached its
+        # append (every match is a str or a list), so it is not run
 
         # certain field matches - more can be added here as needed
-        words = string.split()
         for word in words:
             if word.endswith('sia') and word.startswith('a'):
                 vals.append(('anesthesiology', word))
@@ -208,63 +249,108 @@ class EntityStringParsing():
             if word == 'ent' or word.startswith('otorhino'):
                 vals.append(('ent', word))
 
-            for root in roots:
+            # only the roots the word contains or is within distance 1 of can append anything
+            candidates, near_names = self._cached_specialty_candidates(word)
+            for i in candidates:
+                root = roots[i]
                 root_word = f'{root}log'
                 if root_word not in [v[0] for v in vals] and root_word not in ['urolog', 'neurolog']:
                     if root_word in word:
                         vals.append((root_word + 'y', word))
-                    if levenshtein_distance(root + 'logy', word) <= 1 and root[0] == word[0]:
+                    if root + 'logy' in near_names and root[0] == word[0]:
                         vals.append((root + 'logy', word))
 
 
         return vals if vals else []
 
-    def parse_departments(self, string):
+    def parse_departments(self, string, hits=None):
         departs = []
+        hits = self.find_exact_matches(string) if hits is None else hits
         words = string.split()
+        single_word_matches = self.single_word_department_matches(words)
+        multiple_word_matches = self.multiple_word_department_matches(string)
         departments = self.departments
         for department, matchers in departments.items():
             dept_words = len(department.split())
 
             # first check to see if there's an exact match
-            if department in string:
+            if self._contains(string, department, hits):
                 # make sure your not involutary matching substring
-                match_string = re.search(fr'{department}', string).group(0)
+                match_string = self._matched_text(string, department)
                 departs.append((department, match_string))
 
             # next, check to see if any of the potential looks are in the string
             for match in matchers:
-                if re.search(fr'\b{match}\b', string):
-                    match_string = re.search(fr'{match}', string).group(0)
+                if self._contains_word(string, match, hits):
+                    match_string = self._matched_text(string, match)
                     departs.append((department, match_string))
 
             # now, check to see if there's an edit distance of one for the offical name
             # first, check for one word entities
             if dept_words == 1:
-                for word in words:
-                    if single_word_edit_distance(department, word):
-                        match_string = word
-                        departs.append((department, match_string))
+                for match_string in single_word_matches.get(department, []):
+                    departs.append((department, match_string))
 
             # finally, check to see if there's an edit distance of one for every word
             # in the multiple department words
             if dept_words > 1:
-                if multiple_word_edit_distance(department, string):
-                    results = multiple_word_edit_distance(department, string)
-                    departs.append(results)
+                if department in multiple_word_matches:
+                    departs.append(multiple_word_matches[department])
 
         return list(set(departs)) if departs else []
 
+    def _specialty_candidates(self, word):
+        """
+        :return: (positions of the roots whose root + 'log' is in word or whose root + 'logy' is within
+            distance 1 of it, in root order; root + 'logy' names within distance 1)
+        """
+        near_names = self.specialty_name_index.lookup(word)
+        # every root word ends in 'log', so a word without it contains none of them
+        contained = [i for i, root in enumerate(self.specialty_roots) if root + 'log' in word] if 'log' in word else []
+        near = [i for name in near_names for i in self._specialty_name_positions[name]]
+        return sorted(set(contained + near)), near_names
+
+    def single_word_department_matches(self, words):
+        """
+        single_word_edit_distance(department, word) for every one word department and word
+        :return: {department: [words within distance 1, in order]}
+        """
+        matches = defaultdict(list)
+        for word in words:
+            for term in self.department_index.lookup(word):
+                if term in self.single_word_departments:
+                    matches[term].append(word)
+        return matches
+
+    def multiple_word_department_matches(self, string):
+        """
+        multiple_word_edit_distance(department, string) for every multi word department, with the arguments
+        in that (swapped) order: a department matches when some run of its words, as many as the string has,
+        is within distance 1 of the string's words one to one, and the last such run is reported
+        :return: {department: (string, matched department words)}
+        """
+        input_words = string.split()
+        near = [self.department_index.lookup(word) for word in input_words]
+        matches = {}
+        for department, dept_words in self.multiple_word_departments:
+            for start in range(len(dept_words) - len(input_words), -1, -1):
+                if all(dept_words[start + i] in near[i] for i in range(len(input_words))):
+                    matches[department] = (string, ' '.join(dept_words[start:start + len(input_words)]))
+                    break
+        return matches
+
     def find_identifiers(self, string):
         ids = []
+        hits = self.find_exact_matches(string)
         med_entities = self.medical_entities.keys()
         for med_entity in med_entities:
-            ent = self.parse_medical_entities(string, med_entity)
+            ent = self.parse_medical_entities(string, med_entity, hits=hits)
             ids.append(ent)
 
-        hospitals = self.parse_hospitals(string)
-        specialtites = self.parse_specialty(string)
-        departments = self.parse_departments(string)
+        hospitals = self.parse_hospitals(string, hits=hits)
+        with stage('parsing:specialty'):
+            specialtites = self.parse_specialty(string)
+        departments = self.parse_departments(string, hits=hits)
         vals = ids + hospitals + specialtites + departments
         # parse out the useful ids in the values
         vals = [v for v in vals if v]
@@ -272,17 +358,29 @@ class EntityStringParsing():
         return matches
 
     def create_parsed_record(self, string):
+        """
+        Parses the string into its entities. Records are cached by (string, lookup_version) and shared
+        between callers, so they are read only: the record and its mapping are mapping proxies and the
+        entity collections are frozensets
+        """
+        return self._cached_parsed_record(string, self.lookup_version)
+
+    def parsed_record_cache_info(self):
+        """hits, misses, maxsize and currsize of the parsed record cache"""
+        return self._cached_parsed_record.cache_info()
+
+    def _build_parsed_record(self, string, lookup_version):
         ids = self.find_identifiers(string)
         record = {
             'string': string,
-            'mapping': {i[0]: i[1] for i in ids},
-            'total_entities': set(i[0] for i in ids),
+            'mapping': MappingProxyType({i[0]: i[1] for i in ids}),
+            'total_entities': frozenset(i[0] for i in ids),
             'medical_entities': self.find_high_level_entities(ids),
             'department_entities': self.find_department_entities(ids),
             'speciality_entities': self.find_specialties(ids)
         }
 
-        return record
+        return MappingProxyType(record)
 
 
     def keyword_overlap(self, s1_record, s2_record, entity_mapping):
@@ -300,179 +398,173 @@ class EntityStringParsing():
         return lookup
 
     def create_comparison_records(self, string_one, string_two):
-        s1_record = self.create_parsed_record(string_one.lower())
-        s2_record = self.create_parsed_record(string_two.lower())
-        entity_keyword_overlap = self.keyword_overlap(s1_record, s2_record, 'total_entities')
-        medical_keyword_overlap = self.keyword_overlap(s1_record, s2_record, 'medical_entities')
-        department_keyword_overlap = self.keyword_overlap(s1_record, s2_record, 'department_entities')
-        specialty_keyword_overlap = self.keyword_overlap(s1_record, s2_record, 'speciality_entities')
-        # business_logic_match = self.determine_buisness_match()
-        record = {
-            'string_one': s1_record['string'],
-            'string_two': s2_record['string'],
-            'fuzz_sim': fuzz_sim(s1_record['string'], s2_record['string']),
-            # high level metrics
-            's1_total_entities': s1_record['total_entities'],
-            's2_total_entities': s2_record['total_entities'],
-            'entity_overlap': self.common_elements(
-                x=s1_record['total_entities'],
-                y=s2_record['total_entities']
-            ),
-            'entity_differences': self.diff_elements(
-                x=s1_record['total_entities'],
-                y=s2_record['total_entities']
-            ),
-
-            's1_total_keyword_overlap': entity_keyword_overlap['s1_keywords'],
-            's2_total_keyword_overlap': entity_keyword_overlap['s2_keywords'],
-            's1_overlap_new_string': self.replace_elements(
-                string=s1_record['string'],
-                elem=entity_keyword_overlap['s1_keywords']
-            ),
-            's2_overlap_new_string': self.replace_elements(
-                string=s2_record['string'],
-                elem=entity_keyword_overlap['s2_keywords']
-            ),
-
-            # medical element metrics
-            's1_medical_entities': s1_record['medical_entities'],
-            's2_medical_entities': s2_record['medical_entities'],
-            'common_medical_entities': self.common_elements(
-                x=s1_record['medical_entities'],
-                y=s2_record['medical_entities']
-            ),
-
-            'diff_medical_elements': self.diff_elements(
-                x=s1_record['medical_entities'],
-                y=s2_record['medical_entities']
-            ),
-            's1_med_keyword_overlap': medical_keyword_overlap['s1_keywords'],
-            's2_med_keyword_overlap': medical_keyword_overlap['s2_keywords'],
-            's1_med_overlap_new_string': self.replace_elements(
-                string=s1_record['string'],
-                elem=medical_keyword_overlap['s1_keywords']
-            ),
-            's2_med_overlap_new_string': self.replace_elements(
-                string=s2_record['string'],
-                elem=medical_keyword_overlap['s2_keywords']
-            ),
-            's1_no_medical_elements': self.replace_elements(
-                string=s1_record['string'],
-                elem=s1_record['medical_entities']
-            ),
-            's2_no_medical_elements': self.replace_elements(
-                string=s2_record['string'],
-                elem=s2_record['medical_entities']
-            ),
-            # department metrics
-            's1_department_entities': s1_record['department_entities'],
-            's2_department_entities': s2_record['department_entities'],
-            'common_department_entities': self.common_elements(
-                x=s1_record['department_entities'],
-                y=s2_record['department_entities']
-            ),
-
-            'diff_department_elements': self.diff_elements(
-                x=s1_record['department_entities'],
-                y=s2_record['department_entities']
-            ),
-
-            's1_dept_keyword_overlap': department_keyword_overlap['s1_keywords'],
-            's2_dept_keyword_overlap': department_keyword_overlap['s2_keywords'],
-            's1_dept_overlap_new_string': self.replace_elements(
-                string=s1_record['string'],
-                elem=department_keyword_overlap['s1_keywords']
-            ),
-            's2_dept_overlap_new_string': self.replace_elements(
-                string=s2_record['string'],
-                elem=department_keyword_overlap['s2_keywords']
-            ),
-
-            # specialty metrics
-            's1_speciality_entities': s1_record['speciality_entities'],
-            's2_speciality_entities': s2_record['speciality_entities'],
-            'common_speciality_entities': self.common_elements(
-                x=s1_record['speciality_entities'],
-                y=s2_record['speciality_entities']
-            ),
-            'diff_speciality_elements': self.diff_elements(
-                x=s1_record['speciality_entities'],
-                y=s2_record['speciality_entities']
-            ),
-            's1_specialty_keyword_overlap': specialty_keyword_overlap['s1_keywords'],
-            's2_specialty_keyword_overlap': specialty_keyword_overlap['s2_keywords'],
-            's1_specialty_overlap_new_string': self.replace_elements(
-                string=s1_record['string'],
-                elem=specialty_keyword_overlap['s1_keywords']
-            ),
-            's2_specialty_overlap_new_string': self.replace_elements(
-                string=s2_record['string'],
-                elem=specialty_keyword_overlap['s2_keywords']
-            ),
+        with stage('parsing'):
+            s1_record = self.create_parsed_record(string_one.lower())
+            s2_record = self.create_parsed_record(string_two.lower())
+        return LazyComparisonRecord(self, s1_record, s2_record)
 
-        }
 
-        # add the new fuzzy similarities in
-        record['overlap_fuzz_sim'] = fuzz_sim(
-            record['s1_overlap_new_string'], record['s2_overlap_new_string']
-        )
-        record['med_overlap_fuzz_sim'] = fuzz_sim(
-            record['s1_med_overlap_new_string'], record['s2_med_overlap_new_string']
-        )
+def _keyword_field(entity_mapping, side):
+    return lambda r: r.keyword_overlap(entity_mapping)[side]
 
-        record['dept_overlap_fuzz_sim'] = fuzz_sim(
-            record['s1_dept_overlap_new_string'], record['s2_dept_overlap_new_string']
-        )
 
-        record['specialty_overlap_fuzz_sim'] = fuzz_sim(
-            record['s1_specialty_overlap_new_string'], record['s2_specialty_overlap_new_string']
-        )
+def _replaced_field(string_side, elem_field):
+    return lambda r: r.esp.replace_elements(string=r[string_side], elem=r[elem_field])
 
-        record['no_med_elements_fuzz_sim'] = fuzz_sim(
-            record['s1_no_medical_elements'], record['s2_no_medical_elements']
-        )
 
-        record['business_logic_match'] = {
-            'entity_overlap_string_sim': True if (
-                    (len(record['entity_differences']) == 0) &
-                    (len(record['s1_total_entities']) + len(record['s2_total_entities']) > 0) &
-                    (record['overlap_fuzz_sim'] > .90)
-            ) else False
-            ,
-            'mismatched_specialty_flag': True if (
-                (len(record['diff_speciality_elements']) > 0)
-            ) else False
-            ,
-            'mismatched_department_flag': True if (
-                (len(record['diff_department_elements']) > 0)
-            ) else False
-            ,
-            'dept_vs_speciality_flag': True if (
-                    ((
-                             (len(record['s1_department_entities']) > 0) &
-                             (len(record['s2_speciality_entities']) == 0)
-                     ) |
-                     (
-                             (len(record['s2_department_entities']) > 0) &
-                             (len(record['s1_speciality_entities']) == 0)
-                     ))
-                    &
-                    ((
-                             record['s1_department_entities'] != record['s2_department_entities']
-                     )
-                     |
-                     (
-                             record['s1_speciality_entities'] != record['s2_speciality_entities']
-                     ))
-            ) else False
-            ,
-            'dual_medical_entities_flag': True if (
-                    (len(record['s1_medical_entities']) > 0) &
-                    (len(record['s2_medical_entities']) > 0)
-            ) else False,
-
-            'medical_entities_sole_diff': True if record['no_med_elements_fuzz_sim'] > .98 else False
-        }
+def _fuzz_sim_field(field_one, field_two):
+    return lambda r: fuzz_sim(r[field_one], r[field_two])
+
 
+def _entity_overlap_string_sim(r):
+    return (
+        len(r['entity_differences']) == 0 and
+        len(r['s1_total_entities']) + len(r['s2_total_entities']) > 0 and
+        r['overlap_fuzz_sim'] > .90
+    )
+
+
+def _dept_vs_speciality_flag(r):
+    one_sided = (
+        (len(r['s1_department_entities']) > 0 and len(r['s2_speciality_entities']) == 0) or
+        (len(r['s2_department_entities']) > 0 and len(r['s1_speciality_entities']) == 0)
+    )
+    return one_sided and (
+        r['s1_department_entities'] != r['s2_department_entities'] or
+        r['s1_speciality_entities'] != r['s2_speciality_entities']
+    )
+
+
+class LazyRecord(Mapping):
+    """read only mapping whose FIELDS are computed from field_input() the first time they are looked up"""
+    FIELDS = {}
+
+    def __init__(self):
+        self._values = {}
+
+    def field_input(self):
+        return self
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self.FIELDS[key](self.field_input())
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def computed_fields(self):
+        """names of the fields that have been looked up so far"""
+        return list(self._values)
+
+
+class LazyComparisonRecord(LazyRecord):
+    """
+    Comparison record of two parsed strings. It reads like the record dict, but every field is computed
+    the first time it is looked up and then kept, so the business logic flags can be checked without
+    paying for the replace_elements regexes and fuzz similarities that only some of the rules need.
+    Use to_dict for a fully built dict.
+    """
+    FIELDS = {
+        'string_one': lambda r: r.s1_record['string'],
+        'string_two': lambda r: r.s2_record['string'],
+        'fuzz_sim': _fuzz_sim_field('string_one', 'string_two'),
+        # high level metrics
+        's1_total_entities': lambda r: r.s1_record['total_entities'],
+        's2_total_entities': lambda r: r.s2_record['total_entities'],
+        'entity_overlap': lambda r: r.esp.common_elements(x=r['s1_total_entities'], y=r['s2_total_entities']),
+        'entity_differences': lambda r: r.esp.diff_elements(x=r['s1_total_entities'], y=r['s2_total_entities']),
+        's1_total_keyword_overlap': _keyword_field('total_entities', 's1_keywords'),
+        's2_total_keyword_overlap': _keyword_field('total_entities', 's2_keywords'),
+        's1_overlap_new_string': _replaced_field('string_one', 's1_total_keyword_overlap'),
+        's2_overlap_new_string': _replaced_field('string_two', 's2_total_keyword_overlap'),
+        # medical element metrics
+        's1_medical_entities': lambda r: r.s1_record['medical_entities'],
+        's2_medical_entities': lambda r: r.s2_record['medical_entities'],
+        'common_medical_entities': lambda r: r.esp.common_elements(
+            x=r['s1_medical_entities'], y=r['s2_medical_entities']
+        ),
+        'diff_medical_elements': lambda r: r.esp.diff_elements(x=r['s1_medical_entities'], y=r['s2_medical_entities']),
+        's1_med_keyword_overlap': _keyword_field('medical_entities', 's1_keywords'),
+        's2_med_keyword_overlap': _keyword_field('medical_entities', 's2_keywords'),
+        's1_med_overlap_new_string': _replaced_field('string_one', 's1_med_keyword_overlap'),
+        's2_med_overlap_new_string': _replaced_field('string_two', 's2_med_keyword_overlap'),
+        's1_no_medical_elements': _replaced_field('string_one', 's1_medical_entities'),
+        's2_no_medical_elements': _replaced_field('string_two', 's2_medical_entities'),
+        # department metrics
+        's1_department_entities': lambda r: r.s1_record['department_entities'],
+        's2_department_entities': lambda r: r.s2_record['department_entities'],
+        'common_department_entities': lambda r: r.esp.common_elements(
+            x=r['s1_department_entities'], y=r['s2_department_entities']
+        ),
+        'diff_department_elements': lambda r: r.esp.diff_elements(
+            x=r['s1_department_entities'], y=r['s2_department_entities']
+        ),
+        's1_dept_keyword_overlap': _keyword_field('department_entities', 's1_keywords'),
+        's2_dept_keyword_overlap': _keyword_field('department_entities', 's2_keywords'),
+        's1_dept_overlap_new_string': _replaced_field('string_one', 's1_dept_keyword_overlap'),
+        's2_dept_overlap_new_string': _replaced_field('string_two', 's2_dept_keyword_overlap'),
+        # specialty metrics
+        's1_speciality_entities': lambda r: r.s1_record['speciality_entities'],
+        's2_speciality_entities': lambda r: r.s2_record['speciality_entities'],
+        'common_speciality_entities': lambda r: r.esp.common_elements(
+            x=r['s1_speciality_entities'], y=r['s2_speciality_entities']
+        ),
+        'diff_speciality_elements': lambda r: r.esp.diff_elements(
+            x=r['s1_speciality_entities'], y=r['s2_speciality_entities']
+        ),
+        's1_specialty_keyword_overlap': _keyword_field('speciality_entities', 's1_keywords'),
+        's2_specialty_keyword_overlap': _keyword_field('speciality_entities', 's2_keywords'),
+        's1_specialty_overlap_new_string': _replaced_field('string_one', 's1_specialty_keyword_overlap'),
+        's2_specialty_overlap_new_string': _replaced_field('string_two', 's2_specialty_keyword_overlap'),
+        # fuzzy similarities of the strings with the shared elements taken out
+        'overlap_fuzz_sim': _fuzz_sim_field('s1_overlap_new_string', 's2_overlap_new_string'),
+        'med_overlap_fuzz_sim': _fuzz_sim_field('s1_med_overlap_new_string', 's2_med_overlap_new_string'),
+        'dept_overlap_fuzz_sim': _fuzz_sim_field('s1_dept_overlap_new_string', 's2_dept_overlap_new_string'),
+        'specialty_overlap_fuzz_sim': _fuzz_sim_field(
+            's1_specialty_overlap_new_string', 's2_specialty_overlap_new_string'
+        ),
+        'no_med_elements_fuzz_sim': _fuzz_sim_field('s1_no_medical_elements', 's2_no_medical_elements'),
+        'business_logic_match': lambda r: LazyBusinessLogic(r),
+    }
+
+    def __init__(self, esp, s1_record, s2_record):
+        super().__init__()
+        self.esp = esp
+        self.s1_record = s1_record
+        self.s2_record = s2_record
+        self._keyword_overlaps = {}
+
+    def keyword_overlap(self, entity_mapping):
+        if entity_mapping not in self._keyword_overlaps:
+            self._keyword_overlaps[entity_mapping] = self.esp.keyword_overlap(
+                self.s1_record, self.s2_record, entity_mapping
+            )
+        return self._keyword_overlaps[entity_mapping]
+
+    def to_dict(self):
+        record = {key: self[key] for key in self}
+        record['business_logic_match'] = dict(record['business_logic_match'])
         return record
 
+
+class LazyBusinessLogic(LazyRecord):
+    """the business_logic_match flags of a LazyComparisonRecord, each computed on first lookup"""
+    FIELDS = {
+        'entity_overlap_string_sim': _entity_overlap_string_sim,
+        'mismatched_specialty_flag': lambda r: len(r['diff_speciality_elements']) > 0,
+        'mismatched_department_flag': lambda r: len(r['diff_department_elements']) > 0,
+        'dept_vs_speciality_flag': _dept_vs_speciality_flag,
+        'dual_medical_entities_flag': lambda r: len(r['s1_medical_entities']) > 0 and len(r['s2_medical_entities']) > 0,
+        'medical_entities_sole_diff': lambda r: r['no_med_elements_fuzz_sim'] > .98,
+    }
+
+    def __init__(self, record):
+        super().__init__()
+        self.record = record
+
+    def field_input(self):
+        return self.record
@@ -0,0 +1,129 @@
+from collections import defaultdict, deque, namedtuple
+from functools import lru_cache
+from Levenshtein import distance as levenshtein_distance
+
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
+# substrings: every pattern that occurs anywhere in the string (same as `pattern in string`)
+# bounded: every pattern that occurs with a word boundary on both sides (same as re.search(rf'\b{pattern}\b', string))
+PatternHits = namedtuple('PatternHits', ['substrings', 'bounded'])
+
+
+def is_literal_pattern(pattern: str) -> bool:
+    """True when the pattern has no regex meaning, so matching it as plain text is the same as re.search"""
+    return not (set(pattern) & REGEX_SPECIAL_CHARS)
+
+
+def _is_word_char(char: str) -> bool:
+    # same definition of \w that re uses for str patterns
+    return char.isalnum() or char == '_'
+
+
+def _at_word_boundaries(string: str, start: int, end: int, pattern: str) -> bool:
+    """checks for a word boundary on both sides of string[start:end], which holds the pattern"""
+    before = _is_word_char(string[start - 1]) if start > 0 else False
+    after = _is_word_char(string[end]) if end < len(string) else False
+    return before != _is_word_char(pattern[0]) and _is_word_char(pattern[-1]) != after
+
+
+class MultiPatternMatcher():
+    """
+    Aho-Corasick automaton over a fixed set of literal patterns. The automaton is built once, and a
+    single pass over a string reports every occurrence of every pattern, so the scan cost depends on the
+    length of the string rather than on the number of patterns.
+    """
+    def __init__(self, patterns):
+        self.patterns = sorted(set(p for p in patterns if p))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for pattern in self.patterns:
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = next_node
+                node = next_node
+            self._out[node].append(pattern)
+
+        # breadth first pass to link each node to its longest proper suffix that is also in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                self._out[next_node] = self._out[next_node] + self._out[self._fail[next_node]]
+
+    def find_all(self, string: str):
+        """yields (start, end, pattern) for every occurrence, overlapping ones included"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for end, char in enumerate(string, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern in out[node]:
+                yield end - len(pattern), end, pattern
+
+    def scan(self, string: str) -> PatternHits:
+        substrings, bounded = set(), set()
+        for start, end, pattern in self.find_all(string):
+            substrings.add(pattern)
+            if pattern not in bounded and _at_word_boundaries(string, start, end, pattern):
+                bounded.add(pattern)
+        return PatternHits(substrings, bounded)
+
+
+def deletions(word: str, max_deletions: int) -> set:
+    """every string left after removing up to max_deletions characters from word, word itself included"""
+    variants = frontier = {word}
+    for _ in range(max_deletions):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants = variants | frontier
+    return variants
+
+
+class EditDistanceIndex():
+    """
+    Symmetric deletion index (as in SymSpell) over a fixed set of terms. Two words are within Levenshtein
+    distance d only if deleting at most d characters from each leaves the same string, so the deletions
+    of every term are indexed once and a lookup only has to generate the deletions of the query word.
+    The few candidates that come back are checked with the real distance, so results are exact.
+
+    :param terms: dictionary words
+    :param max_distance: largest distance lookups can ask for
+    :param cache_size: words whose lookups are kept
+    """
+    def __init__(self, terms, max_distance: int = 2, cache_size: int = 16384):
+        self.terms = sorted(set(t for t in terms if t))
+        self.max_distance = max_distance
+        self.max_length = max((len(t) for t in self.terms), default=0)
+        self._deletions = defaultdict(set)
+        for term in self.terms:
+            for variant in deletions(term, max_distance):
+                self._deletions[variant].add(term)
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, word: str, max_distance: int = None) -> frozenset:
+        """terms within max_distance (the index's max_distance by default) of word"""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f'index was built for distances up to {self.max_distance}')
+        if len(word) > self.max_length + max_distance:
+            return frozenset()
+        candidates = set()
+        for variant in deletions(word, max_distance):
+            candidates.update(self._deletions.get(variant, ()))
+        return frozenset(
+            term for term in candidates
+            if abs(len(term) - len(word)) <= max_distance and levenshtein_distance(term, word) <= max_distance
+        )
@@ -0,0 +1,135 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# set to 1/true to profile every request, otherwise only requests that ask for it (debug flag) are profiled
+PROFILING_ENV = 'ENTITY_PROFILING'
+# process wide histograms are written to the log at most this often
+FLUSH_SECONDS = float(os.environ.get('PROFILING_FLUSH_SECONDS', 60))
+# upper bounds (ms) of the histogram buckets, anything slower goes in the last (overflow) bucket
+BUCKET_BOUNDS_MS = [0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000, 10000]
+
+_active_profile = ContextVar('active_profile', default=None)
+
+
+def profiling_enabled() -> bool:
+    return os.environ.get(PROFILING_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+class StageHistograms():
+    """process wide latency histograms per stage, shared by every profiled request until flushed"""
+    def __init__(self, bounds_ms=BUCKET_BOUNDS_MS, timer=time.monotonic):
+        self.bounds_ms = list(bounds_ms)
+        self.timer = timer
+        self.last_flush = timer()
+        self._counts = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        bucket = bisect.bisect_left(self.bounds_ms, seconds * 1000)
+        with self._lock:
+            counts = self._counts.setdefault(stage, [0] * (len(self.bounds_ms) + 1))
+            counts[bucket] += 1
+            self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                stage: {'count': sum(counts), 'total_ms': round(self._totals[stage] * 1000, 3), 'buckets': list(counts)}
+                for stage, counts in self._counts.items()
+            }
+
+    def flush(self, force: bool = False):
+        """prints the histograms as one JSON log line and starts over, at most every FLUSH_SECONDS"""
+        now = self.timer()
+        if not force and now - self.last_flush < FLUSH_SECONDS:
+            return
+        snapshot = self.snapshot()
+        with self._lock:
+            self._counts.clear()
+            self._totals.clear()
+            self.last_flush = now
+        if snapshot:
+            print(json.dumps({'stage_histograms': snapshot, 'bucket_bounds_ms': self.bounds_ms}))
+
+
+STAGE_HISTOGRAMS = StageHistograms()
+
+
+class RequestProfile():
+    """wall time per stage for one request. Stages can nest, an outer stage includes its inner ones"""
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        total, count = self.stages.get(stage, (0.0, 0))
+        self.stages[stage] = (total + seconds, count + 1)
+        STAGE_HISTOGRAMS.record(stage, seconds)
+
+    def breakdown(self) -> dict:
+        """compact {stage: [total ms, calls]} view, slowest first"""
+        ordered = sorted(self.stages.items(), key=lambda item: item[1][0], reverse=True)
+        return {stage: [round(total * 1000, 3), count] for stage, (total, count) in ordered}
+
+
+class _NullStage():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Stage():
+    __slots__ = ('profile', 'name', 'start')
+
+    def __init__(self, profile: RequestProfile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str):
+    """
+    times a `with stage(name):` block when the current request is profiled. Otherwise it returns a
+    shared no-op context manager, so instrumented code pays about one lookup per block
+    """
+    profile = _active_profile.get()
+    return _NULL_STAGE if profile is None else _Stage(profile, name)
+
+
+def is_profiling() -> bool:
+    return _active_profile.get() is not None
+
+
+@contextmanager
+def profile_request(debug: bool = False):
+    """
+    Profiles everything run inside the block when debug is set or ENTITY_PROFILING is on
+    :return: the RequestProfile, None when the request is not profiled
+    """
+    if not (debug or profiling_enabled()):
+        yield None
+        return
+    profile = RequestProfile()
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+        STAGE_HISTOGRAMS.flush()
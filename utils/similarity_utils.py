@@ -0,0 +1,65 @@
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+
+
+def _extract_one_processor():
+    """
+    PolyFuzz's RapidFuzz model scores through process.extractOne, and the default processor of extractOne
+    changed between rapidfuzz releases (default_process before 3.0, no processing after). Probe the installed
+    version so the scorer below stays in line with what PolyFuzz would return.
+    """
+    match = process.extractOne('A', ['a'], scorer=fuzz.ratio)
+    return utils.default_process if match and match[1] == 100 else None
+
+
+class RapidFuzzScorer():
+    """
+    Reusable stand in for building PolyFuzz(RapidFuzz()) on every comparison. Scores are the same values
+    PolyFuzz's RapidFuzz model reports (scorer score / 100), without the joblib, tqdm and DataFrame round trip.
+
+    :param scorer: rapidfuzz scorer, defaults to fuzz.WRatio like polyfuzz.models.RapidFuzz
+    :param score_cutoff: minimum similarity between 0 and 1, anything below is returned as 0
+    """
+    def __init__(self, scorer=fuzz.WRatio, score_cutoff: float = 0):
+        self.scorer = scorer
+        self.score_cutoff = score_cutoff * 100
+        self.processor = _extract_one_processor()
+
+    def score(self, s1: str, s2: str) -> float:
+        """similarity between a single pair of strings"""
+        return self.scorer(s1, s2, processor=self.processor, score_cutoff=self.score_cutoff) / 100
+
+    def score_matrix(self, from_list, to_list) -> np.ndarray:
+        """
+        similarity between every pair of strings in the two lists
+        :return: float64 array of shape (len(from_list), len(to_list))
+        """
+        return process.cdist(
+            list(from_list),
+            list(to_list),
+            scorer=self.scorer,
+            processor=self.processor,
+            score_cutoff=self.score_cutoff,
+            dtype=np.float64
+        ) / 100
+
+    def score_pairs(self, from_list, to_list) -> np.ndarray:
+        """
+        element-wise similarity of two equal length lists, i.e. score(from_list[i], to_list[i]) for every i
+        :return: float64 array of shape (len(from_list),)
+        """
+        from_list, to_list = list(from_list), list(to_list)
+        if hasattr(process, 'cpdist'):
+            return process.cpdist(
+                from_list,
+                to_list,
+                scorer=self.scorer,
+                processor=self.processor,
+                score_cutoff=self.score_cutoff,
+                dtype=np.float64
+            ) / 100
+        # process.cpdist only exists from rapidfuzz 3.6
+        return np.array([self.score(s1, s2) for s1, s2 in zip(from_list, to_list)], dtype=np.float64)
+
+
+rapidfuzz_scorer = RapidFuzzScorer()
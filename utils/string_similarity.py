@@ -0,0 +1,169 @@
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# strings whose n-grams and tokens are kept, per cache
+STRING_CACHE_SIZE = int(os.environ.get('STRING_SIMILARITY_CACHE_SIZE', 65536))
+# most distinct n-grams and tokens given an int id, anything new past that stands for itself (see intern_id)
+VOCABULARY_LIMIT = int(os.environ.get('STRING_SIMILARITY_VOCABULARY_LIMIT', 1000000))
+
+_WORD_SPLIT = re.compile(r'\W+')
+_ngram_ids = {}
+_token_ids = {}
+
+
+def intern_id(vocabulary: dict, value: str):
+    """
+    Small int id of value, the same for the life of the process. Once the vocabulary is full new values
+    are returned as they are: the vocabulary only grows, so a value maps to the same id (or to itself)
+    every time, and ids never equal strings, so sets built from the result compare like the strings would
+    """
+    value_id = vocabulary.get(value)
+    if value_id is None:
+        if len(vocabulary) >= VOCABULARY_LIMIT:
+            return value
+        value_id = vocabulary.setdefault(value, len(vocabulary))
+    return value_id
+
+
+def find_ngrams(text: str, number: int=3) -> set:
+    """
+    returns a set of ngrams for the given string
+    :param text: the string to find ngrams for
+    :param number: the length the ngrams should be. defaults to 3 (trigrams)
+    :return: set of ngram strings
+    """
+    if not text:
+        return set()
+
+    words = [f'  {x} ' for x in _WORD_SPLIT.split(text.lower()) if x.strip()]
+
+    ngrams = set()
+
+    for word in words:
+        for x in range(0, len(word) - number + 1):
+            ngrams.add(word[x:x+number])
+
+    return ngrams
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def ngram_ids(text: str, number: int=3) -> frozenset:
+    """find_ngrams with every n-gram replaced by its interned id, built once per string"""
+    return frozenset(intern_id(_ngram_ids, ngram) for ngram in find_ngrams(text, number))
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def split_tokens(text: str) -> tuple:
+    """lower cased tokens, split the way token_overlap and i_token_max_similarity split"""
+    return tuple(text.lower().replace('  ',' ').replace('   ',' ').split(' '))
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def token_ngram_ids(text: str) -> tuple:
+    """ngram_ids of every token of split_tokens"""
+    return tuple(ngram_ids(token) for token in split_tokens(text))
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def word_ids(text: str) -> tuple:
+    """interned ids of the words on single spaces, case kept, the way compute_roland_score splits"""
+    return tuple(intern_id(_token_ids, word) for word in text.split(' '))
+
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def word_id_set(text: str) -> frozenset:
+    return frozenset(word_ids(text))
+
+
+def jaccard(ngrams1, ngrams2) -> float:
+    """
+    |intersection| / |union| of two sets, 0 when both are empty. The union size comes from the
+    intersection (|a| + |b| - |a & b|) so the union set is never built
+    """
+    num_equal = len(ngrams1 & ngrams2)
+    num_unique = len(ngrams1) + len(ngrams2) - num_equal
+    if num_unique == 0:
+        return 0
+    return float(num_equal) / float(num_unique)
+
+
+def similarity(text1: str, text2: str, number: int=3) -> float:
+    """
+    Finds the similarity between 2 strings using ngrams.
+    0 being completely different strings, and 1 being equal strings
+    """
+    if text1 is None or text2 is None:
+        return None
+    return jaccard(ngram_ids(text1, number), ngram_ids(text2, number))
+
+
+def token_overlap(s1: str, s2: str) -> float:
+    """
+    Share of the tokens of s1 found in s2. Every service has always computed `t1 in t2` (the token list
+    in the other token list) instead of `t in t2`, which is never true, so this is 0.0 for any two
+    strings, and the model was trained on that
+    """
+    t1 = split_tokens(s1)
+    t2 = split_tokens(s2)
+    return len([t for t in t1 if list(t1) in t2])/len(t1)
+
+
+def i_token_max_similarity(s1: str, s2: str, n: int) -> float:
+    """similarity of the nth token of s1 to its most similar token of s2, 0 when s1 has no nth token"""
+    t1 = token_ngram_ids(s1)
+    if n >= len(t1):
+        return 0.0
+    ngrams = t1[n]
+    return max([jaccard(ngrams, other) for other in token_ngram_ids(s2)])
+
+
+def compute_roland_score(possible_name, cleaned_name):
+    """percentage of the words (on single spaces) of both names that the other name also has"""
+    word_set_1, word_set_2 = word_ids(possible_name), word_ids(cleaned_name)
+    total_words = len(word_set_1) + len(word_set_2)
+    in_2, in_1 = word_id_set(cleaned_name), word_id_set(possible_name)
+    count_of_syncs = sum(1 for word in word_set_1 if word in in_2) + sum(1 for word in word_set_2 if word in in_1)
+    return int(round(100.0 * count_of_syncs / total_words, 0))
+
+
+def meta_data_overlap(m1, m2):
+    """share of the values of both lists found in the other one, 0 when either is missing"""
+    if m1 is None or m2 is None:
+        return 0
+    try:
+        in_1, in_2 = set(m1), set(m2)
+    except TypeError:
+        # unhashable values, compare them the list way
+        in_1, in_2 = m1, m2
+    return float(sum(1 for m in m1 if m in in_2) + sum(1 for m in m2 if m in in_1)) / (len(m1) + len(m2))
+
+
+def similarity_many(s1s, s2s, number: int=3) -> np.ndarray:
+    """similarity of every pair as a float64 array, nan where similarity is None"""
+    return np.array(
+        [np.nan if s1 is None or s2 is None else jaccard(ngram_ids(s1, number), ngram_ids(s2, number))
+         for s1, s2 in zip(s1s, s2s)],
+        dtype=np.float64
+    )
+
+
+def token_overlap_many(s1s, s2s) -> np.ndarray:
+    return np.array([token_overlap(s1, s2) for s1, s2 in zip(s1s, s2s)], dtype=np.float64)
+
+
+def token_max_similarity_many(s1s, s2s, n: int) -> np.ndarray:
+    """i_token_max_similarity of every pair as a float64 array"""
+    return np.array([i_token_max_similarity(s1, s2, n) for s1, s2 in zip(s1s, s2s)], dtype=np.float64)
+
+
+def roland_scores(s1s, s2s) -> np.ndarray:
+    """compute_roland_score of every pair as a float64 array"""
+    return np.array([compute_roland_score(s1, s2) for s1, s2 in zip(s1s, s2s)], dtype=np.float64)
+
+
+def meta_data_overlaps(m1s, m2s) -> np.ndarray:
+    """meta_data_overlap of every pair of metadata lists as a float64 array"""
+    return np.array([meta_data_overlap(m1, m2) for m1, m2 in zip(m1s, m2s)], dtype=np.float64)